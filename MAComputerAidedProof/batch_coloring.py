@@ -0,0 +1,62 @@
+import numpy as np
+
+# The color lists are stored as 3-bit masks, color c is represented by the bit 1 << (c - 1)
+COLOR_BITS = np.array([0, 1, 2, 4], dtype=np.uint8)
+ALL_COLORS = 7
+
+
+# Determines for each precoloring, whether it does not decompose the graph, like CustomGraph.decomposed_by_precoloring, and returns the result as a boolean vector.
+# The color lists of all precolorings are stored in a (precolorings x nodes) array, that is propagated at once, 'chunk_size' precolorings at a time.
+def surviving_precolorings(graph, precolorings, nodes_per_cycle, chunk_size=4096):
+    graph = graph.to_compact()
+    node_count = graph.number_of_nodes()
+    adjacency_matrix = get_adjacency_matrix(graph)
+
+    survivors = np.zeros(len(precolorings), dtype=bool)
+    for start in range(0, len(precolorings), chunk_size):
+        chunk = precolorings[start:start + chunk_size]
+        color_lists = np.full((len(chunk), node_count), ALL_COLORS, dtype=np.uint8)
+        for row, precoloring in enumerate(chunk):
+            for node, color in precoloring.items():
+                color_lists[row, graph.index[node]] &= COLOR_BITS[color]
+
+        color_lists = propagate(color_lists, adjacency_matrix)
+
+        failed = (color_lists == 0).any(axis=1)
+        coloring_sizes = is_single_color(color_lists).sum(axis=1)
+        decomposed = failed | (coloring_sizes == 0) | (coloring_sizes > node_count - nodes_per_cycle)
+        survivors[start:start + len(chunk)] = ~decomposed
+
+    return survivors
+
+
+# Returns the adjacency matrix of a CompactGraph as float32 array, so the propagation can use matrix products
+def get_adjacency_matrix(graph):
+    node_count = graph.number_of_nodes()
+    adjacency_matrix = np.zeros((node_count, node_count), dtype=np.float32)
+    for i, mask in enumerate(graph.adjacency):
+        for j in range(node_count):
+            if mask >> j & 1:
+                adjacency_matrix[i, j] = 1
+    return adjacency_matrix
+
+
+# Determines for each entry of the color lists array, whether it contains exactly one color
+def is_single_color(color_lists):
+    return (color_lists != 0) & ((color_lists & (color_lists - 1)) == 0)
+
+
+# Removes the color of every node with only one color from the color lists of its neighbors, until nothing changes anymore.
+# This results in the same color lists as graph_coloring.precolor, since both compute the fixpoint of the same removal rule. A row with an empty color list corresponds to the empty dictionary returned by precolor.
+def propagate(color_lists, adjacency_matrix):
+    while True:
+        removed = np.zeros_like(color_lists)
+        for color in (1, 2, 3):
+            has_color = color_lists == COLOR_BITS[color]
+            has_neighbor_with_color = has_color.astype(np.float32) @ adjacency_matrix > 0
+            removed |= np.where(has_neighbor_with_color, COLOR_BITS[color], 0).astype(np.uint8)
+
+        new_color_lists = color_lists & ~removed
+        if np.array_equal(new_color_lists, color_lists):
+            return color_lists
+        color_lists = new_color_lists
@@ -0,0 +1,315 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import batch_coloring as bc
+import graph_coloring as gc
+import graph_io as gio
+import graph_utils as gu
+import main
+import pipeline
+
+# Timings and result digests of a reference run, written with --save-baseline
+BASELINE_FILE = 'benchmarks_baseline.json'
+
+# The fixtures are sampled with a fixed seed, so every run measures the same graphs
+SEED = 317
+SAMPLE_SIZE = 40
+# Number of inputs of step 3 for C5s, that are combined into the sampled graphs with 3 C5s. Running the whole step takes too long for a benchmark.
+C5_INPUT_SAMPLE_SIZE = 40
+# Largest number of graphs, that are passed to the isomorphism filters
+FILTER_SAMPLE_SIZE = 60
+
+
+# Returns a description of a result, that only consists of lists, tuples, numbers and strings, so it can be hashed. Graphs are described by their name, nodes, edges,
+# metadata and precolorings.
+def describe(value):
+    if hasattr(value, 'to_compact'):
+        graph = value.to_compact()
+        return ('graph', graph.name, list(graph.names), sorted(tuple(sorted(edge)) for edge in graph.edges()), list(graph.edge_numbers), list(graph.graph_numbers),
+                sorted(sorted(precoloring.items()) for precoloring in graph.possible_precolorings))
+    if isinstance(value, dict):
+        return ('dict', sorted((describe(key), describe(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return ('set', sorted(describe(item) for item in value))
+    return value
+
+
+def get_result_digest(result):
+    return hashlib.sha256(repr(describe(result)).encode('utf-8')).hexdigest()
+
+
+# Runs a stage of main with its output suppressed and returns the seconds it took
+def run_stage(method, *arguments, **keyword_arguments):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        method(*arguments, **keyword_arguments)
+    return time.perf_counter() - start
+
+
+# Returns the stages of the end-to-end benchmarks for triangles up to k = 4 and for two C5s, by the number of nodes per cycle, in the order in which they run.
+# Every stage reads the outputs of the stages before it with the same number of nodes per cycle. The outputs of the stages are the fixtures of the other benchmarks.
+def get_stages():
+    stages = {3: [('two_cycles_c3s', main.find_connections_2_c3s, (), pipeline.get_level_directory(3, 2)),
+                  ('automorphisms_c3s', main.find_connections_2_c3s_with_filtered_automorphisms, (), pipeline.get_level_directory(3, 2, '_unique_by_automorphisms'))],
+              5: [('two_cycles_c5s', main.find_connections_2_c5s, (), pipeline.get_level_directory(5, 2)),
+                  ('automorphisms_c5s', main.find_connections_2_c5s_with_filtered_automorphisms, (), pipeline.get_level_directory(5, 2, '_unique_by_automorphisms'))]}
+    for k in (3, 4):
+        stages[3].append(('start_execution_' + str(k) + '_c3s', main.start_execution, (k, 3), pipeline.get_level_directory(3, k)))
+        stages[3].append(('precoloring_' + str(k) + '_c3s', main.find_possible_precolored_graphs, (k, 3), pipeline.get_level_directory(3, k, '_with_precoloring')))
+        stages[3].append(('unique_' + str(k) + '_c3s', main.find_possible_precolored_graphs_unique_by_automorphisms, (k, 3),
+                          pipeline.get_level_directory(3, k, '_with_precoloring_unique_by_automorphisms')))
+    return stages
+
+
+# Runs the stages up to the given stage for every number of nodes per cycle in the current folder, and returns the timings and output digests of the stages as benchmarks
+def run_stage_benchmarks(last_stages):
+    results = {}
+    stages = get_stages()
+    for nodes_per_cycle, last_stage in last_stages.items():
+        for (name, method, arguments, output_directory) in stages[nodes_per_cycle]:
+            keyword_arguments = {}
+            if method in (main.start_execution, main.find_possible_precolored_graphs, main.find_possible_precolored_graphs_unique_by_automorphisms):
+                keyword_arguments['max_workers'] = 1
+            if method in (main.start_execution, main.find_possible_precolored_graphs):
+                keyword_arguments['resume'] = False
+            seconds = run_stage(method, *arguments, **keyword_arguments)
+            results['stage/' + name] = {'seconds': seconds, 'digest': pipeline.get_output_digest([output_directory])}
+            if name == last_stage:
+                break
+    return results
+
+
+# Returns a sorted list of all graphs in the subfolders of a folder of the results
+def read_level(directory):
+    graphs = []
+    for (subfolder, connecting_edges) in sorted(gio.get_subfolders_with_suffix(directory, '_connecting_edges')):
+        graphs.extend(gio.read_graph_files(subfolder))
+    return graphs
+
+
+# Returns a random number generator for a fixture. Every fixture is sampled with its own seed, so it is the same, whichever other fixtures are built.
+def get_fixture_random(name):
+    return random.Random(str(SEED) + '/' + name)
+
+
+def build_graphs_with_precoloring_c3s(k):
+    graphs = read_level(pipeline.get_level_directory(3, k, '_with_precoloring'))
+    return get_fixture_random(str(k) + '_c3s').sample(graphs, min(SAMPLE_SIZE, len(graphs)))
+
+
+def build_4_c3s_bucket(fixtures):
+    subfolders = sorted(gio.get_subfolders_with_suffix(pipeline.get_level_directory(3, 4, '_with_precoloring'), '_connecting_edges'))
+    return max((gio.read_graph_files(subfolder) for (subfolder, connecting_edges) in subfolders), key=len)[:FILTER_SAMPLE_SIZE]
+
+
+def build_inputs_3_c5s(fixtures):
+    index = gu.index_connections_last_iteration(get_fixture(fixtures, 'connections_2_c5s'), 3)
+    inputs = list(gu.generate_execution_inputs(3, gu.get_unique_connections_last_iteration(3, 5), index))
+    return get_fixture_random('inputs_3_c5s').sample(inputs, min(C5_INPUT_SAMPLE_SIZE, len(inputs)))
+
+
+# Graphs with 3 C5s, that are combined from the sampled inputs of step 3
+def build_3_c5s(fixtures):
+    connections_2_c5s = get_fixture(fixtures, 'connections_2_c5s')
+    graphs = [graph for graph_pair in get_fixture(fixtures, 'inputs_3_c5s') for graph in main.find_possible_connections_c5s(tuple(graph_pair) + (connections_2_c5s, 3))]
+    return [graph.to_custom_graph() for graph in get_fixture_random('3_c5s').sample(graphs, min(SAMPLE_SIZE, len(graphs)))]
+
+
+def build_inputs_4_c3s(fixtures):
+    index = gu.index_connections_last_iteration(gu.get_connections_last_iteration(4, 3), 4)
+    inputs = list(gu.generate_execution_inputs(4, gu.get_unique_connections_last_iteration(4, 3), index))
+    return [(graph_1.to_custom_graph(), graph_2.to_custom_graph()) for (graph_1, graph_2) in get_fixture_random('inputs_4_c3s').sample(inputs, min(SAMPLE_SIZE, len(inputs)))]
+
+
+# The fixtures of the hot function benchmarks, with the last stage for every number of nodes per cycle, whose outputs they are built from, and the function that builds them.
+# The fixtures are built from the results in the current folder: the connections between two cycles, samples of the graphs with 3 and 4 triangles, sampled graphs with 3 C5s,
+# that are combined from a sample of the inputs of step 3, and samples of the inputs of step 4 for triangles.
+FIXTURES = {
+    '2_c3s': ({3: 'two_cycles_c3s'}, lambda fixtures: read_level(pipeline.get_level_directory(3, 2))),
+    '2_c5s': ({5: 'two_cycles_c5s'}, lambda fixtures: read_level(pipeline.get_level_directory(5, 2))),
+    '3_c3s': ({3: 'precoloring_3_c3s'}, lambda fixtures: build_graphs_with_precoloring_c3s(3)),
+    '4_c3s': ({3: 'precoloring_4_c3s'}, lambda fixtures: build_graphs_with_precoloring_c3s(4)),
+    '4_c3s_bucket': ({3: 'precoloring_4_c3s'}, build_4_c3s_bucket),
+    'connections_2_c3s': ({3: 'two_cycles_c3s'}, lambda fixtures: {connecting_edges: [graph.to_custom_graph() for graph in graphs]
+                                                                   for connecting_edges, graphs in gu.get_connections_2c3s().items()}),
+    'connections_2_c5s': ({5: 'two_cycles_c5s'}, lambda fixtures: gu.get_connections_2c5s()),
+    'inputs_3_c5s': ({5: 'automorphisms_c5s'}, build_inputs_3_c5s),
+    '3_c5s': ({5: 'automorphisms_c5s'}, build_3_c5s),
+    'inputs_4_c3s': ({3: 'unique_3_c3s'}, build_inputs_4_c3s),
+    'colorings_two_c5s': ({}, lambda fixtures: gc.generate_colorings_two_c5s()),
+}
+
+
+# Returns the fixture with the given name and builds it, if it was not built yet
+def get_fixture(fixtures, name):
+    if name not in fixtures:
+        fixtures[name] = FIXTURES[name][1](fixtures)
+    return fixtures[name]
+
+
+# Precolors every graph with every precoloring it carries, or with the given colorings, starting from full color lists
+def precolor_all(graphs, colorings=None):
+    results = []
+    for graph in graphs:
+        color_lists = {node: [1, 2, 3] for node in graph.nodes()}
+        for precoloring in (colorings if colorings is not None else graph.possible_precolorings):
+            results.append(gc.precolor(graph, color_lists, precoloring))
+    return results
+
+
+# Combines every sampled input of step 4 with every connection between two triangles with the networkx based combine_graph_from_last_iteration, the inputs are CustomGraphs
+def combine_all(graph_pairs, connections_2_c3s):
+    combined_graphs = []
+    for (graph_1, graph_2) in graph_pairs:
+        for connecting_edges_3, graphs_3 in connections_2_c3s.items():
+            if int(graph_1.edge_numbers[0]) <= int(connecting_edges_3):
+                combined_graphs.extend(gu.combine_graph_from_last_iteration(graph_1, graph_2, graph_3, 3) for graph_3 in graphs_3)
+    return combined_graphs
+
+
+# The hot function benchmarks by their names, with the fixtures they need and a function of the fixtures, that returns the result of the benchmark
+FUNCTION_BENCHMARKS = {
+    'precolor/3_c3s': (('3_c3s',), lambda fixtures: precolor_all(fixtures['3_c3s'])),
+    'precolor/4_c3s': (('4_c3s',), lambda fixtures: precolor_all(fixtures['4_c3s'])),
+    'precolor/3_c5s': (('3_c5s', 'colorings_two_c5s'), lambda fixtures: precolor_all(fixtures['3_c5s'], fixtures['colorings_two_c5s'][:20])),
+    'surviving_precolorings/3_c5s': (('3_c5s', 'colorings_two_c5s'),
+                                     lambda fixtures: [bc.surviving_precolorings(graph, fixtures['colorings_two_c5s'], 5).tolist() for graph in fixtures['3_c5s']]),
+    'has_induced_p6/2_c5s': (('2_c5s',), lambda fixtures: [graph.has_induced_p6() for graph in fixtures['2_c5s']]),
+    'has_induced_p6/3_c5s': (('3_c5s',), lambda fixtures: [graph.has_induced_p6() for graph in fixtures['3_c5s']]),
+    'has_induced_p6/4_c3s': (('4_c3s',), lambda fixtures: [graph.has_induced_p6() for graph in fixtures['4_c3s']]),
+    'filter_isomorphisms_with_cycle_to_cycle_mapping/4_c3s': (('4_c3s_bucket',), lambda fixtures: [graph.name for graph in
+                                                                                                 gu.filter_isomorphisms_with_cycle_to_cycle_mapping(fixtures['4_c3s_bucket'])]),
+    'filter_isomorphisms_by_canonical_form/4_c3s': (('4_c3s_bucket',), lambda fixtures: [graph.name for graph in gu.filter_isomorphisms_by_canonical_form(fixtures['4_c3s_bucket'])]),
+    'combine_graph_from_last_iteration/4_c3s': (('inputs_4_c3s', 'connections_2_c3s'), lambda fixtures: combine_all(fixtures['inputs_4_c3s'], fixtures['connections_2_c3s'])),
+    'find_possible_connections_c5s/3_c5s': (('inputs_3_c5s', 'connections_2_c5s'), lambda fixtures: [main.find_possible_connections_c5s(tuple(graph_pair) + (fixtures['connections_2_c5s'], 3))
+                                                                                                     for graph_pair in fixtures['inputs_3_c5s']]),
+}
+
+
+# Returns for every number of nodes per cycle the last stage, that has to run for the given stage benchmarks and fixtures, i.e. the latest stage of either of them
+def get_last_stages(stage_names, fixture_names):
+    stage_positions = {name: (nodes_per_cycle, position) for nodes_per_cycle, stages in get_stages().items() for position, (name, method, arguments, output_directory) in enumerate(stages)}
+    required_stages = list(stage_names)
+    for fixture_name in fixture_names:
+        required_stages.extend(FIXTURES[fixture_name][0].values())
+
+    last_stages = {}
+    for name in required_stages:
+        (nodes_per_cycle, position) = stage_positions[name]
+        if nodes_per_cycle not in last_stages or stage_positions[last_stages[nodes_per_cycle]][1] < position:
+            last_stages[nodes_per_cycle] = name
+    return last_stages
+
+
+# Runs a benchmark repeat times and returns the fastest time and the digest of its result
+def run_function_benchmark(function, repeat):
+    best_seconds = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return {'seconds': best_seconds, 'digest': get_result_digest(result)}
+
+
+# Determines whether the name of a benchmark starts with one of the prefixes, all benchmarks are selected if no prefixes are given
+def is_selected(name, prefixes):
+    return prefixes is None or any(name.startswith(prefix) for prefix in prefixes)
+
+
+# Runs all benchmarks, whose names start with one of the given prefixes, in a temporary folder and returns their timings and result digests.
+# Only the stages and fixtures, that the selected benchmarks need, are run and built.
+def run_benchmarks(repeat=3, prefixes=None):
+    stage_names = [name for stages in get_stages().values() for (name, method, arguments, output_directory) in stages if is_selected('stage/' + name, prefixes)]
+    function_names = [name for name in FUNCTION_BENCHMARKS if is_selected(name, prefixes)]
+    fixture_names = {fixture_name for name in function_names for fixture_name in FUNCTION_BENCHMARKS[name][0]}
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            stage_results = run_stage_benchmarks(get_last_stages(stage_names, fixture_names))
+            results = {name: stage_results[name] for name in stage_results if is_selected(name, prefixes)}
+            fixtures = {}
+            for fixture_name in sorted(fixture_names):
+                get_fixture(fixtures, fixture_name)
+            for name in function_names:
+                function = FUNCTION_BENCHMARKS[name][1]
+                results[name] = run_function_benchmark(lambda: function(fixtures), repeat)
+        finally:
+            os.chdir(working_directory)
+    return results
+
+
+# Compares the results with the baseline. Returns a line for every benchmark and whether all results equal the baseline and no benchmark got slower by more than tolerance.
+# A changed digest, or a benchmark without digest in the baseline, means that the results are not guarded, which is always reported as a failure. The timings are only
+# compared, if the baseline holds timings, e.g. the committed baseline only holds the digests, since timings of another machine cannot be compared.
+def compare_with_baseline(results, baseline, tolerance):
+    lines = []
+    passed = True
+    for name, result in results.items():
+        line = name + ': ' + str(round(result['seconds'], 4)) + ' s'
+        reference = baseline.get(name)
+        if reference is None:
+            lines.append(line + ', NOT IN THE BASELINE')
+            passed = False
+            continue
+        if result['digest'] != reference['digest']:
+            line += ', RESULT CHANGED'
+            passed = False
+        if reference.get('seconds') is not None:
+            ratio = result['seconds'] / reference['seconds'] if reference['seconds'] > 0 else 1
+            line += ', ' + str(round(ratio, 2)) + 'x of the baseline'
+            if ratio > 1 + tolerance:
+                line += ', REGRESSION'
+                passed = False
+        lines.append(line)
+    return lines, passed
+
+
+# Runs the benchmarks and compares them with the baseline, e.g.
+#   python benchmarks.py --save-baseline
+#   python benchmarks.py --only precolor has_induced_p6
+# The committed baseline only holds the digests of the results, --save-baseline --digests-only writes such a baseline.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Times the hot functions and the stages at small k on fixed fixtures and compares timings and results with a baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown relative to the baseline before a benchmark counts as regression')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each hot function benchmark, the fastest one counts')
+    parser.add_argument('--only', nargs='+', metavar='PREFIX', help='only run the benchmarks whose names start with one of the prefixes')
+    parser.add_argument('--digests-only', action='store_true', help='save the baseline without timings, so only the results are compared with it')
+    arguments = parser.parse_args()
+
+    benchmark_results = run_benchmarks(arguments.repeat, arguments.only)
+    if arguments.save_baseline:
+        if arguments.digests_only:
+            benchmark_results = {name: {'digest': result['digest']} for name, result in benchmark_results.items()}
+        # With --only, the other benchmarks of the baseline are kept
+        baseline_benchmarks = {}
+        if arguments.only is not None and os.path.exists(arguments.baseline):
+            with open(arguments.baseline) as f:
+                baseline_benchmarks = json.load(f)['benchmarks']
+        baseline_benchmarks.update(benchmark_results)
+        with open(arguments.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.platform(), 'benchmarks': baseline_benchmarks}, f, indent=1, sort_keys=True)
+        print('Saved the baseline of ' + str(len(benchmark_results)) + ' benchmarks to ' + arguments.baseline)
+    else:
+        if not os.path.exists(arguments.baseline):
+            sys.exit('There is no baseline ' + arguments.baseline + ', save one with --save-baseline')
+        with open(arguments.baseline) as f:
+            baseline_benchmarks = json.load(f)['benchmarks']
+        (result_lines, all_passed) = compare_with_baseline(benchmark_results, baseline_benchmarks, arguments.tolerance)
+        print('\n'.join(result_lines))
+        sys.exit(0 if all_passed else 1)
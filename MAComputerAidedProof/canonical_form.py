@@ -0,0 +1,110 @@
+from compact_graph import iter_bits
+
+
+# Returns the node indices of every cycle of a CompactGraph in cyclic order. The cycles are identified by the initial character of their node names and sorted by it.
+def get_cycle_orders(graph):
+    cycle_nodes = {}
+    for i, node in enumerate(graph.names):
+        cycle_nodes.setdefault(node[0], []).append(i)
+
+    cycle_orders = []
+    for initial in sorted(cycle_nodes):
+        nodes = cycle_nodes[initial]
+        nodes_mask = sum(1 << i for i in nodes)
+        order = [nodes[0]]
+        previous = None
+        while len(order) < len(nodes):
+            successors = [j for j in iter_bits(graph.adjacency[order[-1]] & nodes_mask) if j != previous and j != order[0]]
+            if not successors:
+                raise ValueError('The nodes with initial ' + initial + ' do not form a cycle in ' + graph.name)
+            previous = order[-1]
+            order.append(successors[0])
+        cycle_orders.append(order)
+
+    return cycle_orders
+
+
+# Returns all elements of the dihedral group acting on the positions 0, ..., n-1 of a cycle, each element is given as the tuple of the images of the positions
+def dihedral_group(n):
+    elements = set()
+    for rotation in range(n):
+        for direction in (1, -1):
+            elements.add(tuple((direction * position + rotation) % n for position in range(n)))
+    return sorted(elements)
+
+
+# Computes a canonical form of a graph that consists of cycles, where two graphs have the same canonical form if and only if there is an isomorphism between them that sends each cycle onto itself.
+# Each node is written as (cycle, position in the cycle) and the edges running between cycle i and cycle j form the block (i, j). The canonical form is the lexicographically smallest sequence of blocks, ordered by j and then by i, under the product of the dihedral groups of the cycles.
+# Since the blocks with j <= c only depend on the transformations of the first c + 1 cycles, the cycles are transformed one after the other and only the transformations that achieve the smallest blocks so far are kept.
+# cycle_permutations can contain additional permutations of the cycles (as tuples of cycle indices), under which the graphs are considered equal. The cycles that are permuted have to have the same length.
+def canonical_form(graph, cycle_permutations=None):
+    cycle_orders = get_cycle_orders(graph)
+    cycle_count = len(cycle_orders)
+    if cycle_permutations is None:
+        cycle_permutations = [tuple(range(cycle_count))]
+
+    position = {}
+    for cycle, order in enumerate(cycle_orders):
+        for i, node in enumerate(order):
+            position[node] = (cycle, i)
+
+    edges_between_cycles = {}
+    for i, mask in enumerate(graph.adjacency):
+        for j in iter_bits(mask >> (i + 1)):
+            (cycle_1, position_1) = position[i]
+            (cycle_2, position_2) = position[i + 1 + j]
+            if cycle_1 <= cycle_2:
+                edges_between_cycles.setdefault((cycle_1, cycle_2), []).append((position_1, position_2))
+            else:
+                edges_between_cycles.setdefault((cycle_2, cycle_1), []).append((position_2, position_1))
+
+    groups = [dihedral_group(len(order)) for order in cycle_orders]
+
+    best_form = None
+    for permutation in cycle_permutations:
+        form = canonical_form_for_cycle_order(permutation, edges_between_cycles, groups)
+        if best_form is None or form < best_form:
+            best_form = form
+
+    return tuple(len(order) for order in cycle_orders), best_form
+
+
+# Computes the canonical form for a fixed order of the cycles, where the c'th cycle of the form is the cycle cycle_order[c] of the graph
+def canonical_form_for_cycle_order(cycle_order, edges_between_cycles, groups):
+    partial_transformations = [()]
+    form = []
+    for c, cycle in enumerate(cycle_order):
+        best_blocks = None
+        best_transformations = []
+        for transformations in partial_transformations:
+            for transformation in groups[cycle]:
+                current = transformations + (transformation,)
+                blocks = tuple(transformed_block(cycle_order, current, edges_between_cycles, i, c) for i in range(c + 1))
+                if best_blocks is None or blocks < best_blocks:
+                    best_blocks = blocks
+                    best_transformations = [current]
+                elif blocks == best_blocks:
+                    best_transformations.append(current)
+        partial_transformations = best_transformations
+        form.append(best_blocks)
+
+    return tuple(form)
+
+
+# Returns the sorted edges between the i'th and the c'th cycle of the form (i <= c), after applying the given transformations to the positions of the cycles
+def transformed_block(cycle_order, transformations, edges_between_cycles, i, c):
+    cycle_i = cycle_order[i]
+    cycle_c = cycle_order[c]
+    transformation_i = transformations[i]
+    transformation_c = transformations[c]
+
+    if cycle_i <= cycle_c:
+        edges = edges_between_cycles.get((cycle_i, cycle_c), [])
+        pairs = [(transformation_i[p], transformation_c[q]) for (p, q) in edges]
+    else:
+        edges = edges_between_cycles.get((cycle_c, cycle_i), [])
+        pairs = [(transformation_i[q], transformation_c[p]) for (p, q) in edges]
+
+    if i == c:
+        pairs = [(min(p, q), max(p, q)) for (p, q) in pairs]
+    return tuple(sorted(pairs))
@@ -0,0 +1,242 @@
+import graph_coloring as gc
+import induced_path
+import subgraph_matcher
+
+
+# Iterates over the indices of the set bits of an integer bitmask
+def iter_bits(mask):
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+# Determines whether the nodes in the bitmask contain at least one node of every required mask
+def hits_all(nodes_mask, required_masks):
+    return all(nodes_mask & mask for mask in required_masks)
+
+
+# Compact, integer-indexed graph that is used in the hot paths instead of the networkx based CustomGraph.
+# Every node is identified by its index in 'names', its neighborhood is stored as a bitmask in 'adjacency' and the cycle it belongs to is stored in 'cycles'.
+# Nodes of the same cycle share the initial character of their name, the cycles are numbered in the order in which they first appear.
+class CompactGraph:
+    __slots__ = ('names', 'index', 'adjacency', 'cycles', 'name', 'edge_numbers', 'graph_numbers', 'possible_precolorings')
+
+    def __init__(self, names, adjacency, cycles=None, name='', edge_numbers=None, graph_numbers=None, possible_precolorings=None):
+        self.names = list(names)
+        self.index = {node: i for i, node in enumerate(self.names)}
+        self.adjacency = list(adjacency)
+        if cycles is None:
+            cycle_ids = {}
+            cycles = [cycle_ids.setdefault(node[0], len(cycle_ids)) for node in self.names]
+        self.cycles = list(cycles)
+        self.name = name
+        self.edge_numbers = edge_numbers if edge_numbers is not None else []
+        self.graph_numbers = graph_numbers if graph_numbers is not None else []
+        self.possible_precolorings = possible_precolorings if possible_precolorings is not None else []
+
+    # Builds a compact graph from any networkx graph, the metadata is taken over if the graph is a CustomGraph
+    @classmethod
+    def from_custom_graph(cls, graph):
+        names = list(graph.nodes())
+        index = {node: i for i, node in enumerate(names)}
+        adjacency = [0] * len(names)
+        for u, v in graph.edges():
+            adjacency[index[u]] |= 1 << index[v]
+            adjacency[index[v]] |= 1 << index[u]
+
+        return cls(names, adjacency,
+                   name=getattr(graph, 'name', ''),
+                   edge_numbers=getattr(graph, 'edge_numbers', []),
+                   graph_numbers=getattr(graph, 'graph_numbers', []),
+                   possible_precolorings=getattr(graph, 'possible_precolorings', []))
+
+    # Materialises the networkx based CustomGraph, which is only needed for plotting and export
+    def to_custom_graph(self):
+        import custom_graph
+
+        graph = custom_graph.CustomGraph()
+        graph.add_nodes_from(self.names)
+        graph.add_edges_from(self.edges())
+
+        graph.name = self.name
+        graph.edge_numbers = self.edge_numbers
+        graph.graph_numbers = self.graph_numbers
+        graph.possible_precolorings = self.possible_precolorings
+        return graph
+
+    # Pickles the graph in the packed format of graph_store.pack_graph instead of pickling its attributes
+    def __reduce__(self):
+        import graph_store
+
+        return graph_store.unpack_compact_graph, graph_store.pack_graph(self)
+
+    # Allows methods that accept CustomGraphs as well as CompactGraphs to call to_compact on both
+    def to_compact(self):
+        return self
+
+    # Returns a copy of the graph with the given edges added, the metadata is shared with the original graph
+    def with_edges(self, edges):
+        adjacency = self.adjacency.copy()
+        for u, v in edges:
+            i = self.index[u]
+            j = self.index[v]
+            adjacency[i] |= 1 << j
+            adjacency[j] |= 1 << i
+
+        graph = CompactGraph.__new__(CompactGraph)
+        graph.names = self.names
+        graph.index = self.index
+        graph.adjacency = adjacency
+        graph.cycles = self.cycles
+        graph.name = self.name
+        graph.edge_numbers = self.edge_numbers
+        graph.graph_numbers = self.graph_numbers
+        graph.possible_precolorings = self.possible_precolorings
+        return graph
+
+    def nodes(self):
+        return self.names
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        return sum(mask.bit_count() for mask in self.adjacency) // 2
+
+    # Returns all edges as pairs of node names, each edge is returned once
+    def edges(self):
+        edges = []
+        for i, mask in enumerate(self.adjacency):
+            for j in iter_bits(mask >> (i + 1)):
+                edges.append((self.names[i], self.names[i + 1 + j]))
+        return edges
+
+    def neighbors(self, node):
+        return [self.names[j] for j in iter_bits(self.adjacency[self.index[node]])]
+
+    def has_edge(self, u, v):
+        return bool(self.adjacency[self.index[u]] >> self.index[v] & 1)
+
+    # Returns the bitmask of all nodes that belong to the given cycle
+    def cycle_mask(self, cycle_id):
+        mask = 0
+        for i, cycle in enumerate(self.cycles):
+            if cycle == cycle_id:
+                mask |= 1 << i
+        return mask
+
+    # Groups the nodes by the first character of their name and returns them in a dictionary
+    def get_nodes_by_initial(self):
+        node_dict = {}
+        for node in self.names:
+            node_dict.setdefault(node[0], set()).add(node)
+        return node_dict
+
+    # Returns the bitmasks that a forbidden induced subgraph has to hit, when the last cycle was added to a graph by combine_compact_graph_from_last_iteration.
+    # The combined graph restricted to the nodes of graph_last_iteration_1, graph_last_iteration_2 or graph_connection_2_cycles is exactly that graph, and these graphs are already known to be free of the forbidden subgraphs.
+    # So every forbidden induced subgraph contains a node of the last cycle, a node of the second to last cycle and a node of one of the other cycles.
+    def last_cycle_required_masks(self):
+        last_cycle = max(self.cycles)
+        last_cycle_mask = self.cycle_mask(last_cycle)
+        second_to_last_cycle_mask = self.cycle_mask(last_cycle - 1)
+        other_cycles_mask = (1 << len(self.names)) - 1 & ~last_cycle_mask & ~second_to_last_cycle_mask
+        return last_cycle_mask, second_to_last_cycle_mask, other_cycles_mask
+
+    # Returns the bitmask of all nodes, where a search for a subgraph that has to hit all required masks can start
+    def anchor_nodes(self, required_masks):
+        if required_masks:
+            return min(required_masks, key=lambda mask: mask.bit_count())
+        return (1 << len(self.names)) - 1
+
+    # Determines whether the graph contains a triangle, that contains at least one node of every required mask
+    def has_triangle(self, required_masks=()):
+        adjacency = self.adjacency
+        for i in iter_bits(self.anchor_nodes(required_masks)):
+            mask = adjacency[i]
+            for j in iter_bits(mask):
+                for x in iter_bits(adjacency[j] & mask):
+                    if hits_all((1 << i) | (1 << j) | (1 << x), required_masks):
+                        return True
+        return False
+
+    # Determines whether the graph contains an induced diamond, that contains at least one node of every required mask.
+    # An induced diamond consists of an edge whose endpoints have two non-adjacent common neighbors, a node of the diamond is either an endpoint of that edge or one of the common neighbors.
+    def has_diamond(self, required_masks=()):
+        adjacency = self.adjacency
+        for i in iter_bits(self.anchor_nodes(required_masks)):
+            mask = adjacency[i]
+            for j in iter_bits(mask):
+                common = mask & adjacency[j]
+                for x in iter_bits(common):
+                    for y in iter_bits(common & ~adjacency[x] & ~(1 << x)):
+                        if hits_all((1 << i) | (1 << j) | (1 << x) | (1 << y), required_masks):
+                            return True
+                    for y in iter_bits(adjacency[j] & adjacency[x] & ~mask & ~(1 << i)):
+                        if hits_all((1 << i) | (1 << j) | (1 << x) | (1 << y), required_masks):
+                            return True
+        return False
+
+    # Determines whether the graph contains a K4, that contains at least one node of every required mask
+    def has_k4(self, required_masks=()):
+        adjacency = self.adjacency
+        for i in iter_bits(self.anchor_nodes(required_masks)):
+            mask = adjacency[i]
+            for j in iter_bits(mask):
+                common = mask & adjacency[j]
+                for x in iter_bits(common):
+                    for y in iter_bits(common & adjacency[x]):
+                        if hits_all((1 << i) | (1 << j) | (1 << x) | (1 << y), required_masks):
+                            return True
+        return False
+
+    # Determines whether the graph contains an induced path on 6 nodes, that contains at least one node of every required mask
+    def has_induced_p6(self, required_masks=()):
+        return induced_path.has_induced_path(self.adjacency, 6, required_masks)
+
+    # Determines whether the graph is (P6, triangle)-free. If required_masks are given, only forbidden subgraphs that hit every mask are searched.
+    def is_p6_triangle_free(self, required_masks=()):
+        return not self.has_triangle(required_masks) and not self.has_induced_p6(required_masks)
+
+    # Determines whether the graph is (P6, diamond, K4)-free. If required_masks are given, only forbidden subgraphs that hit every mask are searched.
+    def is_p6_diamond_k4_free(self, required_masks=()):
+        return not self.has_induced_p6(required_masks) and not self.has_diamond(required_masks) and not self.has_k4(required_masks)
+
+    # Returns the name of a forbidden subgraph of graphs consisting of cycles with the given number of nodes, that is an induced subgraph of the graph and contains
+    # at least one node of every required mask, or None. All forbidden subgraphs are searched in one pass of the compiled matcher, see subgraph_matcher.
+    def find_forbidden_subgraph(self, nodes_per_cycle, required_masks=()):
+        found = subgraph_matcher.get_forbidden_subgraph_matcher(nodes_per_cycle).find(self.adjacency, required_masks)
+        if found is None:
+            return None
+        return found[0]
+
+    # Determines whether a given coloring for the graph is proper
+    def is_possible_coloring(self, coloring):
+        color_masks = {}
+        for node, color in coloring.items():
+            color_masks[color] = color_masks.get(color, 0) | 1 << self.index[node]
+
+        for node, color in coloring.items():
+            if self.adjacency[self.index[node]] & color_masks[color]:
+                return False
+        return True
+
+    # Determines, whether applying the precoloring to the graph and updating all color lists decomposes the last cycle in the graph.
+    def decomposed_by_precoloring(self, precoloring, nodes_per_cycle):
+        new_color_lists = {node: [1, 2, 3] for node in self.names}
+        color_lists = gc.precolor(self, new_color_lists, precoloring)
+        coloring = gc.get_coloring_from_color_lists(color_lists)
+
+        if self.number_of_nodes() - nodes_per_cycle < len(coloring) or len(coloring) == 0:
+            return True, coloring
+        return False, coloring
+
+    # Determines, whether applying the precoloring to the graph and updating all color lists while regarding the color restriction, decomposes the last cycle in the graph.
+    def decomposed_by_precoloring_with_color_restriction(self, precoloring, nodes_per_cycle):
+        new_color_lists = {node: [1, 2, 3] for node in self.names}
+        color_lists = gc.precolor_with_color_restriction(self, new_color_lists, precoloring)
+        coloring = gc.get_coloring_from_color_lists(color_lists)
+
+        if self.number_of_nodes() - nodes_per_cycle < len(coloring) or len(coloring) == 0:
+            return True, coloring
+        return False, coloring
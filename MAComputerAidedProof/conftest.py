@@ -0,0 +1,44 @@
+import pytest
+
+import graph_utils as gu
+import main
+
+
+# Builds the graphs of the two-triangle stage and their representatives in memory, numbered and labeled like main.find_connections_2_cycles and
+# main.find_connections_2_c3s_with_filtered_automorphisms save them, as dictionaries from the numbers of connecting edges to lists of CompactGraphs
+@pytest.fixture(scope='session')
+def connections_2_c3s():
+    g1, g2 = main.generate_2_cycles(3)
+    connections = {}
+    graph_count = 0
+    for edge_number in range(1, 4):
+        (edge_number, edgesets) = main.find_connections_2_cycles_with_edge_number((3, edge_number))
+        graphs = []
+        for graph in gu.compose_compact_graphs(g1, g2, edgesets):
+            graph.name = 'graph' + str(graph_count)
+            graph.edge_numbers = [edge_number]
+            graph.graph_numbers = [graph_count]
+            graph.possible_precolorings = set()
+            graphs.append(graph)
+            graph_count += 1
+        connections[str(edge_number)] = graphs
+    return connections
+
+
+@pytest.fixture(scope='session')
+def unique_connections_2_c3s(connections_2_c3s):
+    symmetries = gu.get_edgeset_symmetries(3)
+    return {connecting_edges: [graph for graph in graphs if gu.is_orbit_minimal(gu.get_connecting_edge_indices(graph, 3), symmetries)]
+            for connecting_edges, graphs in connections_2_c3s.items()}
+
+
+# The candidates of start_execution(3, 3), before they are filtered
+@pytest.fixture(scope='session')
+def candidates_3_c3s(connections_2_c3s, unique_connections_2_c3s):
+    return list(main.generate_three_cycle_candidates(3, connections_2_c3s, unique_connections_2_c3s))
+
+
+# The graphs with three triangles, that start_execution(3, 3) saves
+@pytest.fixture(scope='session')
+def graphs_3_c3s(candidates_3_c3s):
+    return [graph for graph in candidates_3_c3s if graph.is_p6_diamond_k4_free()]
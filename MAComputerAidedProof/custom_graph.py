@@ -1,14 +1,21 @@
 import os
 import pickle
 
+import compact_graph
 import graph_coloring as gc
+import induced_path
+import list_coloring
 import networkx as nx
-from matplotlib import pyplot as plt
+import propagation
+import subgraph_matcher
 from networkx.algorithms import isomorphism
 
 
 class CustomGraph(nx.Graph):
 
+    # Default engine of has_induced_p6, either 'bitmask' or 'vf2'
+    p6_engine = 'bitmask'
+
     def __init__(self, *args, **kwargs):
         super(CustomGraph, self).__init__(*args, **kwargs)
         self.name = kwargs.get('name', '')
@@ -16,41 +23,55 @@ class CustomGraph(nx.Graph):
         self.graph_numbers = kwargs.get('graph_numbers', [])
         self.possible_precolorings = kwargs.get('possible_precolorings', [])
 
-    # Determines whether the graph contains a triangle
-    def has_triangle(self):
-        return any(nx.triangles(self).values())
-
-    # Determines whether the graph contains an induced diamond
-    def has_diamond(self):
-        diamond = nx.diamond_graph()
-        gm = isomorphism.GraphMatcher(self, diamond)
-        has_a_diamond = gm.subgraph_is_isomorphic()
-
-        return has_a_diamond
-
-    # Determines whether the graph contains a K4
-    def has_k4(self):
-        k4 = nx.complete_graph(4)
-        gm = isomorphism.GraphMatcher(self, k4)
-        has_a_k4 = gm.subgraph_is_isomorphic()
-
-        return has_a_k4
-
-    # Determines whether the graph contains an induced path of length 6
-    def has_induced_p6(self):
-        p6 = nx.path_graph(6)
-        gm = isomorphism.GraphMatcher(self, p6)
-        has_a_p6 = gm.subgraph_is_isomorphic()
-
-        return has_a_p6
+    # Returns the compact representation of the graph, that the searches for forbidden subgraphs run on. It is kept in the cache of networkx, which networkx clears whenever
+    # nodes or edges are added or removed, so it is only built again after the graph changed.
+    def get_compact_graph(self):
+        cache = self.__networkx_cache__
+        if 'compact_graph' not in cache:
+            cache['compact_graph'] = self.to_compact()
+        return cache['compact_graph']
+
+    # Determines whether the graph contains a triangle. If required_masks are given, only subgraphs that hit every mask are searched.
+    def has_triangle(self, required_masks=()):
+        return subgraph_matcher.get_matcher(('triangle',)).find(self.get_compact_graph().adjacency, required_masks) is not None
+
+    # Determines whether the graph contains an induced diamond. If required_masks are given, only subgraphs that hit every mask are searched.
+    def has_diamond(self, required_masks=()):
+        return subgraph_matcher.get_matcher(('diamond',)).find(self.get_compact_graph().adjacency, required_masks) is not None
+
+    # Determines whether the graph contains a K4. If required_masks are given, only subgraphs that hit every mask are searched.
+    def has_k4(self, required_masks=()):
+        return subgraph_matcher.get_matcher(('k4',)).find(self.get_compact_graph().adjacency, required_masks) is not None
+
+    # Determines whether the graph contains an induced path of length 6. If required_masks are given, only paths that hit every mask are searched.
+    # The engine 'bitmask' runs the dedicated induced path search on the compact representation of the graph, the engine 'vf2' runs the general subgraph isomorphism test of networkx,
+    # which cannot restrict the search to required_masks.
+    def has_induced_p6(self, required_masks=(), engine=None):
+        engine = engine or self.p6_engine
+        if engine == 'bitmask':
+            return induced_path.has_induced_path(self.get_compact_graph().adjacency, 6, required_masks)
+        if engine == 'vf2':
+            if required_masks:
+                raise ValueError('The P6 engine vf2 does not support required_masks')
+            p6 = nx.path_graph(6)
+            gm = isomorphism.GraphMatcher(self, p6)
+            has_a_p6 = gm.subgraph_is_isomorphic()
+
+            return has_a_p6
+        raise ValueError('Unknown P6 engine: ' + str(engine))
+
+    # Returns the name of a forbidden subgraph of graphs consisting of cycles with the given number of nodes, that is an induced subgraph of the graph, or None.
+    # If required_masks are given, only forbidden subgraphs that hit every mask are searched.
+    def find_forbidden_subgraph(self, nodes_per_cycle, required_masks=()):
+        return self.get_compact_graph().find_forbidden_subgraph(nodes_per_cycle, required_masks)
 
     # Determines whether the graph is (P6, triangle)-free
     def is_p6_triangle_free(self):
-        return not self.has_triangle() and not self.has_induced_p6()
+        return self.find_forbidden_subgraph(5) is None
 
     # Determines whether the graph is (P6, diamond, K4)-free
     def is_p6_diamond_k4_free(self):
-        return not self.has_induced_p6() and not self.has_diamond() and not self.has_k4()
+        return self.find_forbidden_subgraph(3) is None
 
     # Groups the nodes by the first character of their name and returns them in a dictionary
     def get_nodes_by_initial(self):
@@ -70,13 +91,19 @@ class CustomGraph(nx.Graph):
         return True
 
     # Determines, whether applying the precoloring to the graph and updating all color lists decomposes the last cycle in the graph.
-    def decomposed_by_precoloring(self, precoloring, nodes_per_cycle):
+    # With strict, the precoloring also decomposes the last cycle, if it cannot be extended to a coloring of the graph or a node of the last cycle has the same color in every extension.
+    def decomposed_by_precoloring(self, precoloring, nodes_per_cycle, strict=False):
         new_color_lists = {node: [1, 2, 3] for node in self.nodes()}
         color_lists = gc.precolor(self, new_color_lists, precoloring)
         coloring = gc.get_coloring_from_color_lists(color_lists)
 
         if self.number_of_nodes() - nodes_per_cycle < len(coloring) or len(coloring) == 0:
             return True, coloring
+        if strict:
+            domains = propagation.ColorDomains(self)
+            domains.assign_all(precoloring)
+            if list_coloring.is_decomposed_strictly(domains) is not None:
+                return True, coloring
         return False, coloring
 
     # Determines, whether applying the precoloring to the graph and updating all color lists while regarding the color restriction, decomposes the last C5 in the graph.
@@ -89,6 +116,14 @@ class CustomGraph(nx.Graph):
             return True, coloring
         return False, coloring
 
+    # Pickles the graph in the packed format of graph_store.pack_graph, if it can be packed, i.e. its nodes are strings and neither the graph, nor its nodes or edges carry attributes
+    def __reduce_ex__(self, protocol):
+        if set(self.graph) <= {'name'} and all(isinstance(node, str) and not data for node, data in self.nodes(data=True)) and not any(data for u, v, data in self.edges(data=True)):
+            import graph_store
+
+            return graph_store.unpack_custom_graph, graph_store.pack_graph(self)
+        return super().__reduce_ex__(protocol)
+
     # Save the graph in a pickle file
     def save_to_pickle(self, file_path):
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -101,8 +136,10 @@ class CustomGraph(nx.Graph):
         with open(file_path, 'rb') as f:
             return pickle.load(f)
 
-    # Draw the graph and save the figure in a file
+    # Draw the graph and save the figure in a file. matplotlib is only imported here, and the figure is not registered with pyplot, so it needs no interactive backend.
     def draw_and_save(self, file_path, coloring):
+        from matplotlib.figure import Figure
+
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
         color_map = {
@@ -113,10 +150,13 @@ class CustomGraph(nx.Graph):
         node_colors = [color_map.get(coloring.get(node, 0), 'gray') for node in self.nodes()]
 
         pos = nx.circular_layout(self)
-        plt.figure(figsize=(8, 8))
-        nx.draw(self, pos, with_labels=True, node_color=node_colors, edge_color='gray', node_size=3000, font_size=15, font_weight='bold')
-        plt.savefig(file_path)
-        plt.close()
+        figure = Figure(figsize=(8, 8))
+        nx.draw(self, pos, ax=figure.add_axes((0, 0, 1, 1)), with_labels=True, node_color=node_colors, edge_color='gray', node_size=3000, font_size=15, font_weight='bold')
+        figure.savefig(file_path)
+
+    # Converts the graph to the compact, integer-indexed representation that is used in the hot paths
+    def to_compact(self):
+        return compact_graph.CompactGraph.from_custom_graph(self)
 
     @classmethod
     def from_networkx_graph(cls, nx_graph, name, edge_numbers, graph_numbers, possible_precolorings):
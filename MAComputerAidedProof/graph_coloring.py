@@ -1,40 +1,20 @@
-import copy
-import networkx as nx
 import itertools
 
+import propagation
+
 
 # Applies a precoloring to the color_lists of the given graph. If the resulting color list of at least one node is empty, the returned updated color_lists dictionary is empty.
 def precolor(graph, color_lists, precoloring):
-    cur_color_lists = copy.deepcopy(color_lists)
-    for node, color in precoloring.items():
-        cur_color_lists = update_color_lists(graph, cur_color_lists, node, color)
-        if not cur_color_lists:
-            break
-
-    return cur_color_lists
+    domains = propagation.ColorDomains(graph, color_lists)
+    domains.assign_all(precoloring)
+    return domains.to_color_lists()
 
 
 # Sets the color list of the given node to only the given color and removes this color from the color lists of all neighboring nodes. If the color of a neighboring node is uniquely determined after that, the color lists are again updated, depending on that neighbor.
 def update_color_lists(graph, color_lists, node, color):
-    cur_color_lists = copy.deepcopy(color_lists)
-
-    if color in cur_color_lists[node]:
-        cur_color_lists[node] = [color]
-    else:
-        return {}
-
-    for neighbor in nx.neighbors(graph, node):
-        if color in cur_color_lists[neighbor]:
-            cur_color_lists[neighbor].remove(color)
-
-            if len(cur_color_lists[neighbor]) == 0:
-                return {}
-            elif len(cur_color_lists[neighbor]) == 1:
-                cur_color_lists = update_color_lists(graph, cur_color_lists, neighbor, cur_color_lists[neighbor][0])
-                if not cur_color_lists:
-                    break
-
-    return cur_color_lists
+    domains = propagation.ColorDomains(graph, color_lists)
+    domains.assign(node, color)
+    return domains.to_color_lists()
 
 
 # Returns a coloring as a dictionary, given the color lists of a graph. If none of the color lists contain exactly one element, the returned coloring is empty.
@@ -49,7 +29,14 @@ def get_coloring_from_color_lists(color_lists):
 
 # The given graph has to consist of k C5s, given in some order that is determined by the initial character of their node names. It is checked, whether any node in the k'th C5 has 2 neighbors in either the first k-1 C5s. If that is the case, the color 3 is removed from the color list of each such node. After that the precoloring is applied.
 def precolor_with_color_restriction(graph, color_lists, precoloring):
-    cur_color_lists = copy.deepcopy(color_lists)
+    domains = propagation.ColorDomains(graph, color_lists)
+    restrict_last_cycle_colors(graph, domains)
+    domains.assign_all(precoloring)
+    return domains.to_color_lists()
+
+
+# Removes the color 3 from the domain of every node in the last C5, that has 2 neighbors in the C5 with initial 'u' or in the C5 with initial 'v'
+def restrict_last_cycle_colors(graph, domains):
     groups_by_initial = graph.get_nodes_by_initial()
     last_c_5_node_name = max([node[0] for node in graph.nodes()])
 
@@ -58,12 +45,9 @@ def precolor_with_color_restriction(graph, color_lists, precoloring):
             if initial == 'u' or initial == 'v':
                 edge_count = sum(1 for neighbor in graph.neighbors(node) if neighbor in c5_nodes)
                 if edge_count >= 2:
-                    cur_color_lists[node].remove(3)
+                    domains.remove_color(node, 3)
                     break
 
-    propagated_color_lists = precolor(graph, cur_color_lists, precoloring)
-    return propagated_color_lists
-
 
 # Generates all colorings of a C5 with the given nodes, that are rotations of the coloring {'u_0': 1, 'u_1': 2, 'u_2': 1, 'u_3': 2, 'u_4': 3}, so color 3 appears only once. Every proper coloring of a C5 can be received from these by permuting the colors.
 def generate_colorings_c5(nodes):
@@ -146,6 +130,14 @@ def generate_colorings_two_c3s():
 
 # coloring_wo_c5 has to be a coloring of a graph that consists of k-1 C5s. The method generates all colorings for a k'th C5 and returns all combinations of them with the input coloring. The returned coloring is not necessarily proper.
 def generate_colorings_with_added_c5(coloring_wo_c5):
+    resulting_colorings = []
+    for coloring_new_c5 in generate_colorings_of_added_c5(coloring_wo_c5):
+        resulting_colorings.append(coloring_wo_c5 | coloring_new_c5)
+    return resulting_colorings
+
+
+# coloring_wo_c5 has to be a coloring of a graph that consists of k-1 C5s. The method generates all colorings of the nodes of a k'th C5, in the order in which generate_colorings_with_added_c5 combines them with the input coloring.
+def generate_colorings_of_added_c5(coloring_wo_c5):
     latest_char = max([key[0] for key in coloring_wo_c5.keys()])
     node_char = chr(ord(latest_char) + 1)
 
@@ -156,15 +148,19 @@ def generate_colorings_with_added_c5(coloring_wo_c5):
 
     for coloring in colorings_wo_permutation:
         colorings_list.extend(permute_coloring(coloring))
+    return colorings_list
 
+
+# coloring_wo_c3 has to be a coloring of a graph that consists of k-1 triangles. The method generates all colorings for a k'th triangle and returns all combinations of them with the input coloring. The returned coloring is not necessarily proper.
+def generate_colorings_with_added_c3(coloring_wo_c3):
     resulting_colorings = []
-    for coloring_new_c5 in colorings_list:
-        resulting_colorings.append(coloring_wo_c5 | coloring_new_c5)
+    for coloring_new_c3 in generate_colorings_of_added_c3(coloring_wo_c3):
+        resulting_colorings.append(coloring_wo_c3 | coloring_new_c3)
     return resulting_colorings
 
 
-# coloring_wo_c3 has to be a coloring of a graph that consists of k-1 triangles. The method generates all colorings for a k'th triangle and returns all combinations of them with the input coloring. The returned coloring is not necessarily proper.
-def generate_colorings_with_added_c3(coloring_wo_c3):
+# coloring_wo_c3 has to be a coloring of a graph that consists of k-1 triangles. The method generates all colorings of the nodes of a k'th triangle, in the order in which generate_colorings_with_added_c3 combines them with the input coloring.
+def generate_colorings_of_added_c3(coloring_wo_c3):
     latest_char = max([key[0] for key in coloring_wo_c3.keys()])
     node_char = chr(ord(latest_char) + 1)
 
@@ -175,8 +171,4 @@ def generate_colorings_with_added_c3(coloring_wo_c3):
 
     for coloring in colorings_wo_permutation:
         colorings_list.extend(permute_coloring(coloring))
-
-    resulting_colorings = []
-    for coloring_new_c3 in colorings_list:
-        resulting_colorings.append(coloring_wo_c3 | coloring_new_c3)
-    return resulting_colorings
+    return colorings_list
@@ -1,27 +1,76 @@
 import os
-import custom_graph
+import graph_store
 
 
-# Helper function to save a graph in the correct folder depending on its properties
-def save_graph(graph, nodes_per_cycle, with_plot=False):
+# Returns the directory of the graph store, in which a graph is saved depending on its properties. A shard saves its graphs below its own results_root, see sharding.py
+def get_graph_directory(graph, nodes_per_cycle, results_root='results'):
     cycle_number = len(graph.nodes()) // nodes_per_cycle
     edges = str(graph.edge_numbers[0])
     for edge_number in graph.edge_numbers[1:]:
         edges += '_' + str(edge_number)
 
-    path_name = 'results/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's/' + str(edges) + '_connecting_edges/' + graph.name + '.pkl'
-    graph.save_to_pickle(path_name)
+    return results_root + '/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's/' + str(edges) + '_connecting_edges'
 
-    if with_plot:
-        path_name_plot = 'results/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's/' + str(edges) + '_connecting_edges_plots/' + graph.name + '.png'
-        graph.draw_and_save(path_name_plot, graph.possible_precolorings[0])
 
+# Collects graphs and saves each one in the graph store of the directory, that get_graph_directory returns for it. The graphs are appended in batches of batch_size graphs,
+# so the index of a store is not read again for every graph.
+# The graphs of each directory are saved in the order in which they were added, flush has to be called after the last graph was added.
+# store_counts holds the number of graphs in each store that was written by the writer, including the graphs that were in the store before (initial_store_counts).
+class GraphWriter:
 
-# Saves a list of graphs
-def save_graphs_in_directory(graph_list, directory_name):
-    for graph in graph_list:
-        file_path = directory_name + '/' + graph.name + '.pkl'
-        graph.save_to_pickle(file_path)
+    def __init__(self, nodes_per_cycle, batch_size=1000, fsync=False, initial_store_counts=None, results_root='results'):
+        self.nodes_per_cycle = nodes_per_cycle
+        self.results_root = results_root
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.batches = {}
+        self.graph_count = 0
+        self.store_counts = dict(initial_store_counts or {})
+
+    def add(self, graph):
+        directory_name = get_graph_directory(graph, self.nodes_per_cycle, self.results_root)
+        batch = self.batches.setdefault(directory_name, [])
+        batch.append(graph)
+        self.graph_count += 1
+        if len(batch) >= self.batch_size:
+            self.flush_directory(directory_name)
+
+    def add_all(self, graphs):
+        for graph in graphs:
+            self.add(graph)
+
+    def flush_directory(self, directory_name):
+        batch = self.batches.pop(directory_name)
+        graph_store.GraphStore(directory_name).append_graphs(batch, self.fsync)
+        self.store_counts[directory_name] = self.store_counts.get(directory_name, 0) + len(batch)
+
+    def flush(self):
+        for directory_name in list(self.batches):
+            self.flush_directory(directory_name)
+
+
+# Saves a list of graphs to the graph store of a directory, the graphs that were stored in the directory before are replaced
+def save_graphs_in_directory(graph_list, directory_name, fsync=False):
+    graph_store.remove_store(directory_name)
+    graph_store.GraphStore(directory_name).append_graphs(graph_list, fsync)
+
+
+# Removes the graph stores in a directory and all its subfolders, so a stage that appends graphs one by one starts from empty stores
+def remove_graph_stores(directory_name):
+    for root, dirs, files in os.walk(directory_name):
+        graph_store.remove_store(root)
+
+
+# Truncates the graph stores in a directory and all its subfolders to the number of graphs given in store_counts, the stores that are not in store_counts are removed.
+# This restores the stores of a stage to the state of its last checkpoint.
+def truncate_graph_stores(directory_name, store_counts):
+    for root, dirs, files in os.walk(directory_name):
+        if graph_store.store_exists(root):
+            count = store_counts.get(root.replace(os.sep, '/'), 0)
+            if count == 0:
+                graph_store.remove_store(root)
+            else:
+                graph_store.GraphStore(root).truncate(count)
 
 
 # Saves the plots of a list of graphs
@@ -34,20 +83,29 @@ def save_graph_plots_in_directory(graph_list, directory_name):
             graph.draw_and_save(file_path, graph.possible_precolorings[0])
 
 
-# Reads all graph files found in a directory
-def read_graph_files(directory_name):
-    files = os.listdir(directory_name)
+# Reads all graphs found in a directory from its graph store, a directory without graph store holds no graphs. The pickle files of the old format are never read here,
+# since pickles of an earlier run would be read back, whenever a run removes the store of a directory and saves no graphs to it. They are imported with
+# graph_store.import_pickle_tree instead.
+# With compact, the graphs are returned as CompactGraphs, which is what the hot paths work on. The networkx based CustomGraphs are only needed for plotting and export.
+def read_graph_files(directory_name, compact=False):
+    if not graph_store.store_exists(directory_name):
+        return []
 
-    graph_files = [f for f in files if f.endswith('.pkl')]
+    store = graph_store.GraphStore(directory_name)
+    if compact:
+        return list(store.read_compacts())
+    return list(store.read_graphs())
 
-    graphs = []
 
-    for graph_file in graph_files:
-        graph_path = os.path.join(directory_name, graph_file)
-        graph = custom_graph.CustomGraph.load_from_pickle(graph_path)
-        graphs.append(graph)
+# Returns the number of graphs, that read_graph_files reads from a directory, without reading them
+def count_graph_files(directory_name):
+    if not graph_store.store_exists(directory_name):
+        return 0
 
-    return graphs
+    store = graph_store.GraphStore(directory_name)
+    count = len(store)
+    store.close()
+    return count
 
 
 # Finds all subfolders with a given suffix
@@ -0,0 +1,392 @@
+import argparse
+import array
+import collections
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+
+import compact_graph
+
+# A GraphStore keeps all graphs of one directory, e.g. results/c5s/3_c5s/5_5_6_connecting_edges, in three files:
+# META_FILE holds the node names, that are shared by all graphs of the directory. RECORDS_FILE holds the packed records, one after the other.
+# INDEX_FILE holds the end offset of every record in RECORDS_FILE as unsigned 64 bit integer. A record only counts as written, once its end offset is in the index.
+META_FILE = 'store_meta.json'
+RECORDS_FILE = 'records.bin'
+INDEX_FILE = 'index.bin'
+LOCK_FILE = 'store.lock'
+FORMAT_VERSION = 1
+
+# Every record starts with the length of the name, the number of edge numbers, the number of graph numbers, the number of precolorings and a flag that is 1 if the
+# precolorings are stored in a set instead of a list. It is followed by the name, the edge numbers (16 bit each), the graph numbers (32 bit each), one adjacency
+# bitmask per node and one packed precoloring per precoloring, in which each node takes 2 bits holding its color, or 0 if it is not colored.
+RECORD_HEADER = struct.Struct('<HHHIB')
+
+LOCK_TIMEOUT = 600
+
+
+# Determines whether the directory contains a graph store
+def store_exists(directory):
+    return os.path.exists(os.path.join(directory, INDEX_FILE))
+
+
+# Append-only store of the graphs of one directory, see META_FILE. The records are read through a memory map, so every graph can be accessed by its index without
+# reading the others, and it is only materialised when it is accessed.
+# Appending is guarded by a lock file, so several processes can append to the same store, see StoreLock.
+class GraphStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.nodes = None
+        self.ends = None
+        self.records_file = None
+        self.records = None
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def __len__(self):
+        return len(self.get_ends())
+
+    def __iter__(self):
+        return self.read_graphs()
+
+    # Reads the node names from META_FILE
+    def get_nodes(self):
+        if self.nodes is None:
+            with open(self.path(META_FILE)) as f:
+                meta = json.load(f)
+            if meta['format'] != FORMAT_VERSION:
+                raise ValueError('Unsupported graph store format ' + str(meta['format']) + ' in ' + self.directory)
+            self.nodes = meta['nodes']
+        return self.nodes
+
+    # Reads the end offsets of all records from INDEX_FILE
+    def get_ends(self):
+        if self.ends is None:
+            self.ends = read_index(self.path(INDEX_FILE))
+        return self.ends
+
+    # Returns the packed record with the given index, it is read through the memory map of RECORDS_FILE
+    def get_record(self, i):
+        ends = self.get_ends()
+        if self.records is None:
+            self.records_file = open(self.path(RECORDS_FILE), 'rb')
+            self.records = mmap.mmap(self.records_file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = ends[i - 1] if i > 0 else 0
+        return self.records[start:ends[i]]
+
+    # Returns the graph with the given index as CompactGraph
+    def read_compact(self, i):
+        if i < 0:
+            i += len(self)
+        return decode_record(self.get_record(i), self.get_nodes())
+
+    # Returns the graph with the given index as CustomGraph
+    def read_graph(self, i):
+        return self.read_compact(i).to_custom_graph()
+
+    # Iterates over all graphs in the order in which they were appended, as CompactGraphs
+    def read_compacts(self):
+        for i in range(len(self)):
+            yield self.read_compact(i)
+
+    # Iterates over all graphs in the order in which they were appended, as CustomGraphs
+    def read_graphs(self):
+        for i in range(len(self)):
+            yield self.read_graph(i)
+
+    # Appends CustomGraphs or CompactGraphs to the store. All graphs have to consist of the same nodes, the node names of the first graph are written to META_FILE
+    # when the store is created. Records that were written to RECORDS_FILE, but never made it into INDEX_FILE, as well as incomplete index entries, are overwritten.
+    # With fsync, the new records are synced to disk before the method returns.
+    def append_graphs(self, graphs, fsync=False):
+        graphs = [graph.to_compact() for graph in graphs]
+        if not graphs:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        with StoreLock(self.path(LOCK_FILE)):
+            if not os.path.exists(self.path(META_FILE)):
+                write_meta(self.path(META_FILE), graphs[0].names)
+            nodes = self.get_nodes()
+            ends = read_index(self.path(INDEX_FILE))
+            offset = ends[-1] if ends else 0
+
+            new_ends = array.array('Q')
+            with open(self.path(RECORDS_FILE), 'ab') as f:
+                f.truncate(offset)
+                for graph in graphs:
+                    offset += f.write(encode_record(graph, nodes))
+                    new_ends.append(offset)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            with open(self.path(INDEX_FILE), 'ab') as f:
+                f.truncate(len(ends) * ends.itemsize)
+                f.write(index_bytes(new_ends))
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        self.close()
+
+    # Removes all graphs after the first count graphs, e.g. the graphs that were appended after the last checkpoint of an interrupted stage
+    def truncate(self, count):
+        if not store_exists(self.directory):
+            return
+
+        with StoreLock(self.path(LOCK_FILE)):
+            ends = read_index(self.path(INDEX_FILE))
+            if count < len(ends):
+                with open(self.path(INDEX_FILE), 'r+b') as f:
+                    f.truncate(count * ends.itemsize)
+                with open(self.path(RECORDS_FILE), 'r+b') as f:
+                    f.truncate(ends[count - 1] if count > 0 else 0)
+
+        self.close()
+
+    # Closes the memory map, the store is reopened on the next access
+    def close(self):
+        if self.records is not None:
+            self.records.close()
+            self.records_file.close()
+        self.records = None
+        self.records_file = None
+        self.ends = None
+
+
+# Tries to take an exclusive lock on an open file without waiting and returns whether it succeeded. The lock is held by the operating system until it is released
+# or the file is closed, which also happens when the process crashes.
+def try_lock_file(f):
+    if sys.platform == 'win32':
+        import msvcrt
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    import fcntl
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def unlock_file(f):
+    if sys.platform == 'win32':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# Exclusive lock on a lock file, that is held from entering until leaving the context, see try_lock_file. The lock of a process that crashed is released by the operating
+# system, so it never has to be broken by another process and a stage can be resumed right away.
+# The lock file is left in place when leaving the context, since a process that removed it could not tell whether another process has just locked it.
+class StoreLock:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.file_path, 'a+b')
+        waited = 0
+        while not try_lock_file(self.file):
+            if waited > LOCK_TIMEOUT:
+                self.file.close()
+                self.file = None
+                raise TimeoutError('Could not acquire ' + self.file_path + ' within ' + str(LOCK_TIMEOUT) + ' seconds, another process is writing to the store')
+            time.sleep(0.01)
+            waited += 0.01
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        unlock_file(self.file)
+        self.file.close()
+        self.file = None
+
+
+def write_meta(file_path, nodes):
+    with open(file_path, 'w') as f:
+        json.dump({'format': FORMAT_VERSION, 'nodes': list(nodes)}, f)
+
+
+# Reads the end offsets from an index file, a missing index file belongs to an empty store
+def read_index(file_path):
+    ends = array.array('Q')
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        ends.frombytes(data[:len(data) - len(data) % ends.itemsize])
+        if sys.byteorder == 'big':
+            ends.byteswap()
+    return ends
+
+
+def index_bytes(ends):
+    if sys.byteorder == 'big':
+        ends = array.array('Q', ends)
+        ends.byteswap()
+    return ends.tobytes()
+
+
+# Packs a CompactGraph into a record, the adjacency bitmasks and the precolorings refer to the node order of the store
+def encode_record(graph, nodes):
+    node_count = len(nodes)
+    if graph.names != nodes:
+        if sorted(graph.names) != sorted(nodes):
+            raise ValueError('The nodes of ' + graph.name + ' differ from the nodes of the graph store')
+        index = {node: i for i, node in enumerate(nodes)}
+        adjacency = [0] * node_count
+        for u, v in graph.edges():
+            adjacency[index[u]] |= 1 << index[v]
+            adjacency[index[v]] |= 1 << index[u]
+    else:
+        index = graph.index
+        adjacency = graph.adjacency
+
+    name = graph.name.encode('utf-8')
+    precolorings = graph.possible_precolorings
+    parts = [RECORD_HEADER.pack(len(name), len(graph.edge_numbers), len(graph.graph_numbers), len(precolorings), isinstance(precolorings, set)), name,
+             struct.pack('<' + str(len(graph.edge_numbers)) + 'H', *graph.edge_numbers),
+             struct.pack('<' + str(len(graph.graph_numbers)) + 'I', *graph.graph_numbers)]
+
+    row_size = (node_count + 7) // 8
+    for mask in adjacency:
+        parts.append(mask.to_bytes(row_size, 'little'))
+
+    precoloring_size = (node_count + 3) // 4
+    for precoloring in precolorings:
+        packed = 0
+        for node, color in precoloring.items():
+            packed |= color << (2 * index[node])
+        parts.append(packed.to_bytes(precoloring_size, 'little'))
+
+    return b''.join(parts)
+
+
+# Unpacks a record into a CompactGraph
+def decode_record(record, nodes):
+    node_count = len(nodes)
+    (name_length, edge_number_count, graph_number_count, precoloring_count, is_set) = RECORD_HEADER.unpack_from(record, 0)
+    offset = RECORD_HEADER.size
+
+    name = record[offset:offset + name_length].decode('utf-8')
+    offset += name_length
+    edge_numbers = list(struct.unpack_from('<' + str(edge_number_count) + 'H', record, offset))
+    offset += 2 * edge_number_count
+    graph_numbers = list(struct.unpack_from('<' + str(graph_number_count) + 'I', record, offset))
+    offset += 4 * graph_number_count
+
+    row_size = (node_count + 7) // 8
+    adjacency = []
+    for i in range(node_count):
+        adjacency.append(int.from_bytes(record[offset:offset + row_size], 'little'))
+        offset += row_size
+
+    precoloring_size = (node_count + 3) // 4
+    precolorings = []
+    for i in range(precoloring_count):
+        packed = int.from_bytes(record[offset:offset + precoloring_size], 'little')
+        offset += precoloring_size
+        precoloring = {}
+        for j, node in enumerate(nodes):
+            color = packed >> (2 * j) & 3
+            if color:
+                precoloring[node] = color
+        precolorings.append(precoloring)
+
+    return compact_graph.CompactGraph(nodes, adjacency, name=name, edge_numbers=edge_numbers, graph_numbers=graph_numbers,
+                                      possible_precolorings=set() if is_set else precolorings)
+
+
+# Node names of the graphs packed most recently by this process, graphs with the same nodes get the same tuple of names, so pickle writes it only once per message.
+# Only the SHARED_NAMES_SIZE most recently used tuples are kept, the graphs of one stage share a few of them.
+SHARED_NAMES_SIZE = 64
+shared_names = collections.OrderedDict()
+
+
+# Returns the tuple of names in shared_names, that equals the given one, and adds the given one if there is none
+def get_shared_names(names):
+    shared = shared_names.get(names)
+    if shared is None:
+        shared_names[names] = names
+        if len(shared_names) > SHARED_NAMES_SIZE:
+            shared_names.popitem(last=False)
+        return names
+    shared_names.move_to_end(names)
+    return shared
+
+
+# Packs a graph into its node names, its cycles and a record, which is how CompactGraphs and CustomGraphs are pickled, e.g. when they are sent to worker processes.
+# The graph itself takes a few bytes per node and precoloring instead of a dictionary per node and per precoloring.
+def pack_graph(graph):
+    graph = graph.to_compact()
+    names = tuple(graph.names)
+    names = get_shared_names(names)
+    return names, bytes(graph.cycles), encode_record(graph, graph.names)
+
+
+# Unpacks a graph packed by pack_graph into a CompactGraph
+def unpack_compact_graph(names, cycles, record):
+    graph = decode_record(record, names)
+    graph.cycles = list(cycles)
+    return graph
+
+
+# Unpacks a graph packed by pack_graph into a CustomGraph
+def unpack_custom_graph(names, cycles, record):
+    return unpack_compact_graph(names, cycles, record).to_custom_graph()
+
+
+# Removes the graph store files from a directory, e.g. before a stage writes the directory again. The lock file is kept, see StoreLock.
+def remove_store(directory):
+    for file_name in (META_FILE, RECORDS_FILE, INDEX_FILE):
+        file_path = os.path.join(directory, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+# Imports every directory below root, that contains pickled graphs, into a graph store in the same directory. The graphs are appended sorted by their file names.
+# Directories that already contain a graph store are skipped. With remove_pickles, the pickle files are removed after the import.
+# Results that were saved as pickle files have to be imported once, since graph_io.read_graph_files only reads graph stores.
+def import_pickle_tree(root, remove_pickles=False):
+    imported = 0
+    for directory, subfolders, files in os.walk(root):
+        pickle_files = sorted(f for f in files if f.endswith('.pkl'))
+        if not pickle_files or store_exists(directory):
+            continue
+
+        graphs = []
+        for pickle_file in pickle_files:
+            with open(os.path.join(directory, pickle_file), 'rb') as f:
+                graphs.append(pickle.load(f))
+        GraphStore(directory).append_graphs(graphs)
+        imported += len(graphs)
+
+        if remove_pickles:
+            for pickle_file in pickle_files:
+                os.remove(os.path.join(directory, pickle_file))
+
+    return imported
+
+
+# Imports the pickle files below a folder of results into graph stores, e.g.
+#   python graph_store.py results --remove-pickles
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Imports the graphs that were saved as pickle files into graph stores')
+    parser.add_argument('root', nargs='?', default='results')
+    parser.add_argument('--remove-pickles', action='store_true', help='remove the pickle files after the import')
+    arguments = parser.parse_args()
+
+    print('Imported ' + str(import_pickle_tree(arguments.root, arguments.remove_pickles)) + ' graphs')
@@ -1,11 +1,14 @@
 import itertools
 import networkx as nx
 from networkx import isomorphism
-import concurrent.futures
 from pathlib import Path
 
+import canonical_form
+import compact_graph
 import custom_graph
 import graph_io as gio
+import induced_path
+import scheduler
 
 
 # Generates all possible sets of edges of a given size between two cycles. When nodes_per_cycle = 5, then the method also considers the incidence constraints.
@@ -21,6 +24,132 @@ def generate_all_possible_edgesets(g1, g2, size, nodes_per_cycle):
     return possible_edge_subsets
 
 
+# Returns the permutations of the possible edges between two cycles, that are induced by rotating and reflecting the cycles.
+# The possible edges are numbered like in generate_all_possible_edgesets, so the edge between the i'th node of the first cycle and the j'th node of the second cycle has the number i * nodes_per_cycle + j.
+def get_edgeset_symmetries(nodes_per_cycle):
+    group = canonical_form.dihedral_group(nodes_per_cycle)
+    symmetries = []
+    for g in group:
+        for h in group:
+            symmetries.append(tuple(g[i] * nodes_per_cycle + h[j] for i in range(nodes_per_cycle) for j in range(nodes_per_cycle)))
+    return symmetries
+
+
+# Determines whether a sorted tuple of edge numbers is the lexicographically smallest one in its orbit under the given symmetries
+def is_orbit_minimal(edge_indices, symmetries):
+    edge_indices = list(edge_indices)
+    for symmetry in symmetries:
+        if sorted(map(symmetry.__getitem__, edge_indices)) < edge_indices:
+            return False
+    return True
+
+
+# Returns all distinct sorted tuples of edge numbers, that the given tuple is mapped to by the symmetries
+def get_edgeset_orbit(edge_indices, symmetries):
+    return sorted({tuple(sorted(symmetry[e] for e in edge_indices)) for symmetry in symmetries})
+
+
+# Generates the edge numbers of all sets of edges of a given size between two cycles, for which the resulting graph is (P6, triangle)-free when nodes_per_cycle = 5, or (P6, diamond, K4)-free when nodes_per_cycle = 3. When nodes_per_cycle = 5, then the method also considers the incidence constraints.
+# The edge sets are built by adding edges with increasing numbers, and a set is not extended as soon as it is clear that no extension of it can be valid:
+# - a node is incident to more than 2 edges, or a node that cannot get any more edges has a neighbor that cannot reach incidence 2 anymore,
+# - the set creates a triangle (nodes_per_cycle = 5) or an induced diamond or K4 (nodes_per_cycle = 3), which stays when further edges are added,
+# - the graph contains an induced P6 that stays induced whatever edges are added, since all edges between its nodes, that are not on the path, can no longer be added.
+# If symmetries are given, only the sets that are the lexicographically smallest ones in their orbit are generated. If a set is not the smallest one in its orbit, neither is
+# any set that is built from it, so the set is not extended.
+def generate_pruned_edgesets(g1, g2, size, nodes_per_cycle, symmetries=None):
+    possible_edges = list(itertools.product(g1.nodes(), g2.nodes()))
+    base_graph = compact_graph.CompactGraph.from_custom_graph(nx.compose(g1, g2))
+    edge_nodes = [(base_graph.index[a], base_graph.index[b]) for a, b in possible_edges]
+    node_count = base_graph.number_of_nodes()
+    edge_count = len(edge_nodes)
+    with_incidence_constraints = nodes_per_cycle == 5
+
+    # future_edges[x][e] is the number of possible edges incident to node x, whose number is at least e
+    future_edges = [[sum(1 for f in range(e, edge_count) if x in edge_nodes[f]) for e in range(edge_count + 1)] for x in range(node_count)]
+    cycle_adjacency = base_graph.adjacency
+    adjacency = cycle_adjacency.copy()
+    incidence = [0] * node_count
+    edge_indices = []
+
+    def creates_forbidden_subgraph(a, b):
+        common = adjacency[a] & adjacency[b]
+        if nodes_per_cycle == 5:
+            return common != 0
+        # After adding the edge ab, every new induced diamond or K4 contains a and b
+        if common.bit_count() >= 2:
+            return True
+        exactly_one = (adjacency[a] ^ adjacency[b]) & ~(1 << a) & ~(1 << b)
+        return any(adjacency[x] & exactly_one for x in compact_graph.iter_bits(common))
+
+    def incidence_constraints_satisfiable(next_edge, remaining):
+        # The neighbors of nodes that cannot get any more edges, but have incidence 0, need incidence 2
+        required_nodes = 0
+        for x in range(node_count):
+            if incidence[x] == 0 and (remaining == 0 or future_edges[x][next_edge] == 0):
+                required_nodes |= cycle_adjacency[x]
+
+        missing_per_cycle = [0, 0]
+        for y in compact_graph.iter_bits(required_nodes):
+            missing = 2 - incidence[y]
+            if missing > min(remaining, future_edges[y][next_edge]):
+                return False
+            missing_per_cycle[base_graph.cycles[y]] += missing
+        return max(missing_per_cycle) <= remaining
+
+    def has_closed_induced_p6(next_edge, remaining):
+        blocking_adjacency = adjacency.copy()
+        if remaining > 0:
+            for e in range(next_edge, edge_count):
+                a, b = edge_nodes[e]
+                if not with_incidence_constraints or (incidence[a] < 2 and incidence[b] < 2):
+                    blocking_adjacency[a] |= 1 << b
+                    blocking_adjacency[b] |= 1 << a
+        return induced_path.has_induced_path(adjacency, 6, blocking_adjacency=blocking_adjacency)
+
+    def extend(next_edge):
+        remaining = size - len(edge_indices)
+        if remaining == 0:
+            yield tuple(edge_indices)
+            return
+
+        for e in range(next_edge, edge_count - remaining + 1):
+            a, b = edge_nodes[e]
+            if with_incidence_constraints and (incidence[a] == 2 or incidence[b] == 2):
+                continue
+            if creates_forbidden_subgraph(a, b):
+                continue
+            if symmetries is not None and not is_orbit_minimal(edge_indices + [e], symmetries):
+                continue
+
+            edge_indices.append(e)
+            adjacency[a] |= 1 << b
+            adjacency[b] |= 1 << a
+            incidence[a] += 1
+            incidence[b] += 1
+
+            if (not with_incidence_constraints or incidence_constraints_satisfiable(e + 1, remaining - 1)) and not has_closed_induced_p6(e + 1, remaining - 1):
+                yield from extend(e + 1)
+
+            edge_indices.pop()
+            adjacency[a] &= ~(1 << b)
+            adjacency[b] &= ~(1 << a)
+            incidence[a] -= 1
+            incidence[b] -= 1
+
+    yield from extend(0)
+
+
+# Returns the sorted tuple of the numbers of the edges between the two cycles of a graph, that consists of the cycles u and v
+def get_connecting_edge_indices(graph, nodes_per_cycle):
+    edge_indices = []
+    for a, b in graph.edges():
+        if a[0] == 'v' and b[0] == 'u':
+            a, b = b, a
+        if a[0] == 'u' and b[0] == 'v':
+            edge_indices.append(int(a[1:]) * nodes_per_cycle + int(b[1:]))
+    return tuple(sorted(edge_indices))
+
+
 # Determines for each node, to how many edges it is incident.
 def calculate_incidence(edge_subset):
     incidence = {}
@@ -61,61 +190,118 @@ def compose_graphs(g1, g2, edgesets):
     return graphs
 
 
-# Checks for Isomorphisms where each cycle is mapped onto itself and returns only one representation for each isomorphism class
-def filter_isomorphisms_with_cycle_to_cycle_mapping(graphs):
-    filtered_graphs = []
-
-    for graph1 in graphs:
-        node_groups = graph1.get_nodes_by_initial()
-        found = False
-        for graph2 in filtered_graphs:
-            gm = isomorphism.GraphMatcher(graph1, graph2)
-
-            for mapping in gm.isomorphisms_iter():
-                valid_mapping = True
-
-                for char, nodes_set in node_groups.items():
-                    mapped_nodes = {mapping[node] for node in nodes_set if node in mapping}
-
-                    if not all(mapped_node in nodes_set for mapped_node in mapped_nodes):
-                        valid_mapping = False
-                        break
-
-                if valid_mapping:
-                    found = True
-                    break
-            if found:
-                break
-
-        if not found:
-            filtered_graphs.append(graph1)
-
-    return filtered_graphs
-
-
-# Gets the list of all graphs, that represent two C5s with all possible connections, from the results folder
+# Combines the two cycles with each of the given edge sets, given by the numbers of their edges, to a CompactGraph. The graphs are generated one after the other.
+def compose_compact_graphs(g1, g2, edgesets):
+    possible_edges = list(itertools.product(g1.nodes(), g2.nodes()))
+    base_graph = compact_graph.CompactGraph.from_custom_graph(nx.compose(g1, g2))
+    for edge_indices in edgesets:
+        yield base_graph.with_edges([possible_edges[e] for e in edge_indices])
+
+
+# VF2 matcher for isomorphisms that send each cycle onto itself. Two nodes are only matched, if they belong to cycles with the same initial character,
+# so VF2 never explores a mapping that moves a node to another cycle.
+class CycleGraphMatcher(isomorphism.GraphMatcher):
+
+    def semantic_feasibility(self, G1_node, G2_node):
+        return G1_node[0] == G2_node[0]
+
+
+# Returns invariants of a graph under the isomorphisms that send each cycle onto itself: the sorted degrees of the nodes of every cycle, the number of edges between every
+# pair of cycles and the numbers of triangles and of (not necessarily induced) C4s. Graphs with different invariants cannot be isomorphic.
+def get_cycle_invariants(graph):
+    graph = graph.to_compact()
+    adjacency = graph.adjacency
+    initials = [node[0] for node in graph.names]
+
+    degrees = {}
+    edge_counts = {}
+    triangles = 0
+    c4s = 0
+    for i, mask in enumerate(adjacency):
+        degrees.setdefault(initials[i], []).append(mask.bit_count())
+        for j in compact_graph.iter_bits(mask >> (i + 1)):
+            j += i + 1
+            pair = tuple(sorted((initials[i], initials[j])))
+            edge_counts[pair] = edge_counts.get(pair, 0) + 1
+            triangles += (adjacency[i] & adjacency[j] & ~((1 << (j + 1)) - 1)).bit_count()
+        # Every C4 is counted once for each of its two pairs of opposite nodes
+        for j in range(i + 1, len(adjacency)):
+            common_neighbors = (mask & adjacency[j]).bit_count()
+            c4s += common_neighbors * (common_neighbors - 1) // 2
+
+    return (tuple(sorted((initial, tuple(sorted(node_degrees))) for initial, node_degrees in degrees.items())), tuple(sorted(edge_counts.items())), triangles, c4s // 2)
+
+
+# Returns the graphs of a bucket, that are not isomorphic to an earlier graph of the bucket by an isomorphism that sends each cycle onto itself, with their positions
+def filter_isomorphisms_in_bucket(method_input):
+    (bucket,) = method_input
+    representatives = []
+    for (position, graph1) in bucket:
+        if not any(CycleGraphMatcher(graph1, graph2).is_isomorphic() for (representative_position, graph2) in representatives):
+            representatives.append((position, graph1))
+    return representatives
+
+
+# Checks for Isomorphisms where each cycle is mapped onto itself and returns only one representation for each isomorphism class.
+# This is the reference implementation for filter_isomorphisms_by_canonical_form. The graphs are put into buckets by get_cycle_invariants and each graph is only compared
+# with the representatives of its bucket, with max_workers workers handling the buckets. As before, the first graph of each isomorphism class is kept, in the order of the graphs.
+def filter_isomorphisms_with_cycle_to_cycle_mapping(graphs, max_workers=1):
+    buckets = {}
+    for position, graph in enumerate(graphs):
+        buckets.setdefault(get_cycle_invariants(graph), []).append((position, graph))
+
+    representatives = []
+    scheduler.run_scheduled(filter_isomorphisms_in_bucket, ((bucket,) for bucket in buckets.values()), collect=representatives.extend, max_workers=max_workers,
+                            total=len(buckets))
+    return [graph for (position, graph) in sorted(representatives, key=lambda representative: representative[0])]
+
+
+# Returns only one representation for each isomorphism class, where the isomorphisms have to send each cycle onto itself, like filter_isomorphisms_with_cycle_to_cycle_mapping.
+# The graphs are put into a dictionary that is keyed by their canonical form, so each graph is only handled once. As in the reference implementation, the first graph of each isomorphism class is kept.
+def filter_isomorphisms_by_canonical_form(graphs, cycle_permutations=None):
+    representatives = {}
+    for graph in graphs:
+        key = canonical_form.canonical_form(graph.to_compact(), cycle_permutations)
+        if key not in representatives:
+            representatives[key] = graph
+
+    return list(representatives.values())
+
+
+# Returns all graphs for which the bitmask and the VF2 engine of has_induced_p6 give different results. CompactGraphs are converted to CustomGraphs, on which VF2 runs.
+def find_p6_engine_mismatches(graphs):
+    mismatches = []
+    for graph in graphs:
+        if isinstance(graph, compact_graph.CompactGraph):
+            graph = graph.to_custom_graph()
+        if graph.has_induced_p6(engine='bitmask') != graph.has_induced_p6(engine='vf2'):
+            mismatches.append(graph)
+    return mismatches
+
+
+# Gets the list of all graphs, that represent two C5s with all possible connections, from the results folder, as CompactGraphs
 def get_connections_2c5s():
     connections_2_c5s = {}
     for i in range(5, 11):
         path = 'results/c5s/' + '2_c5s/' + str(i) + '_connecting_edges'
         if Path(path).exists():
-            connections_2_c5s[str(i)] = gio.read_graph_files(path)
+            connections_2_c5s[str(i)] = gio.read_graph_files(path, compact=True)
 
     return connections_2_c5s
 
 
-# Gets the list of all graphs, that represent two triangle with all possible connections, from the results folder
+# Gets the list of all graphs, that represent two triangle with all possible connections, from the results folder, as CompactGraphs
 def get_connections_2c3s():
     connections_2_c3s = {}
     for i in range(1, 4):
         path = 'results/c3s/' + '2_c3s/' + str(i) + '_connecting_edges'
         if Path(path).exists():
-            connections_2_c3s[str(i)] = gio.read_graph_files(path)
+            connections_2_c3s[str(i)] = gio.read_graph_files(path, compact=True)
 
     return connections_2_c3s
 
 
-# Gets the list of all graphs, that represent (k - 1) cycles with all possible connections, from the results folder
+# Gets the list of all graphs, that represent (k - 1) cycles with all possible connections, from the results folder, as CompactGraphs
 def get_connections_last_iteration(k, nodes_per_cycle):
     if k == 3:
         if nodes_per_cycle == 3:
@@ -128,12 +314,12 @@ def get_connections_last_iteration(k, nodes_per_cycle):
         connections_last_iteration = {}
         subfolders = gio.get_subfolders_with_suffix('results/c' + str(nodes_per_cycle) + 's/' + str(k - 1) + '_c' + str(nodes_per_cycle) + 's_with_precoloring', '_connecting_edges')
         for (subfolder, connecting_edges) in subfolders:
-            connections_last_iteration[connecting_edges] = gio.read_graph_files(subfolder)
+            connections_last_iteration[connecting_edges] = gio.read_graph_files(subfolder, compact=True)
 
     return connections_last_iteration
 
 
-# Gets the list of all graphs, that represent (k - 1) cycles connected by edges, from the results folder.
+# Gets the list of all graphs, that represent (k - 1) cycles connected by edges, from the results folder, as CompactGraphs.
 # Here only one representative for each set of graphs, that are isomorphic and the isomorphism sends each cycle onto the same cycle, is given.
 def get_unique_connections_last_iteration(k, nodes_per_cycle):
     unique_connections_last_iteration = {}
@@ -143,11 +329,63 @@ def get_unique_connections_last_iteration(k, nodes_per_cycle):
         path = 'results/c' + str(nodes_per_cycle) + 's/' + str(k - 1) + '_c' + str(nodes_per_cycle) + 's_with_precoloring_unique_by_automorphisms'
     subfolders = gio.get_subfolders_with_suffix(path, '_connecting_edges')
     for (subfolder, connecting_edges) in subfolders:
-        unique_connections_last_iteration[connecting_edges] = gio.read_graph_files(subfolder)
+        unique_connections_last_iteration[connecting_edges] = gio.read_graph_files(subfolder, compact=True)
 
     return unique_connections_last_iteration
 
 
+# Returns the number of entries of graph_numbers, that two graphs with k-1 cycles have to share to be combined in iteration step k, i.e. the graph numbers of the connections between the first k-2 cycles
+def get_join_prefix_length(k):
+    return ((k - 2) * (k - 3)) // 2
+
+
+# Returns the key on which start_execution joins the graphs with k-1 cycles: for k = 3 the number of connecting edges, otherwise the prefix of graph_numbers of length get_join_prefix_length(k)
+def get_join_key(graph, k):
+    if k == 3:
+        return int(graph.edge_numbers[0])
+    return tuple(graph.graph_numbers[:get_join_prefix_length(k)])
+
+
+# Indexes the graphs from the last iteration step by their join key. The graphs of each key keep the order in which they appear in connections_last_iteration.
+def index_connections_last_iteration(connections_last_iteration, k):
+    index = {}
+    for graphs in connections_last_iteration.values():
+        for graph in graphs:
+            index.setdefault(get_join_key(graph, k), []).append(graph)
+    return index
+
+
+# Returns the lists of graphs in the index, that can be combined with graph_1: for k = 3 the graphs with at least as many connecting edges as graph_1, otherwise the graphs with the same prefix of graph_numbers
+def get_join_partners(index, graph_1, k):
+    key = get_join_key(graph_1, k)
+    if k == 3:
+        return [graphs for edge_number, graphs in index.items() if key <= edge_number]
+    return [index.get(key, [])]
+
+
+# Lazily yields the pairs of graphs, that are combined in iteration step k of the 'find_possible_connections' methods, pairing every unique graph from the last iteration step with its join partners from the index
+def generate_execution_inputs(k, unique_connections_last_iteration, index):
+    for graphs_1 in unique_connections_last_iteration.values():
+        for graph_1 in graphs_1:
+            for graphs_2 in get_join_partners(index, graph_1, k):
+                for graph_2 in graphs_2:
+                    yield graph_1, graph_2
+
+
+# Counts the inputs that generate_execution_inputs yields, using only the sizes of the lists in the index. If a predicate on the pairs of graphs is given, e.g. the membership in
+# a shard, only the pairs for which it holds are counted, going through the lists of the index without building the pairs of generate_execution_inputs.
+def count_execution_inputs(k, unique_connections_last_iteration, index, predicate=None):
+    count = 0
+    for graphs_1 in unique_connections_last_iteration.values():
+        for graph_1 in graphs_1:
+            for graphs_2 in get_join_partners(index, graph_1, k):
+                if predicate is None:
+                    count += len(graphs_2)
+                else:
+                    count += sum(1 for graph_2 in graphs_2 if predicate((graph_1, graph_2)))
+    return count
+
+
 # Combines the three input graphs to one graph that consists of k C5s in the following way:
 # graph_last_iteration_1 and graph_last_iteration_2 consist of k-1 C5s, graph_connection_2_c5s consists of 2 C5s.
 # In the new graph, the edges in graph_last_iteration_1 represent the edges between the first k-1 C5s in the new graph.
@@ -172,7 +410,14 @@ def combine_graph_from_last_iteration(graph_last_iteration_1, graph_last_iterati
     combined_graph = nx.compose_all([g1, g2, g3])
 
     n = combined_graph.number_of_nodes() // nodes_per_cycle
+    name, edge_numbers, graph_numbers, possible_precolorings = combine_metadata(graph_last_iteration_1, graph_last_iteration_2, graph_connection_2_cycles, n)
+
+    new_graph = custom_graph.CustomGraph.from_networkx_graph(combined_graph, name, edge_numbers, graph_numbers, possible_precolorings)
+    return new_graph
+
 
+# Determines the name, edge_numbers, graph_numbers and possible_precolorings of a graph with n cycles, that is combined from the three given graphs
+def combine_metadata(graph_last_iteration_1, graph_last_iteration_2, graph_connection_2_cycles, n):
     edge_numbers = graph_last_iteration_1.edge_numbers.copy()
     if len(graph_last_iteration_2.edge_numbers) <= 1:
         edge_numbers.extend(graph_last_iteration_2.edge_numbers)
@@ -193,11 +438,39 @@ def combine_graph_from_last_iteration(graph_last_iteration_1, graph_last_iterati
     for graph_number in graph_numbers[1:]:
         name += '_' + str(graph_number)
 
-    new_graph = custom_graph.CustomGraph.from_networkx_graph(combined_graph, name, edge_numbers, graph_numbers, possible_precolorings)
-    return new_graph
+    return name, edge_numbers, graph_numbers, possible_precolorings
+
 
+# Does the same as combine_graph_from_last_iteration, but works on CompactGraphs and returns a CompactGraph.
+# The nodes of graph_last_iteration_1 keep their indices, the nodes of the new cycle are appended in the order of the last cycle of graph_last_iteration_2.
+def combine_compact_graph_from_last_iteration(graph_last_iteration_1, graph_last_iteration_2, graph_connection_2_cycles, nodes_per_cycle):
+    names_2 = graph_last_iteration_2.names
+    last_cycle_node_name = max([node[0] for node in names_2])
+    current_position = ord(last_cycle_node_name) - ord('a')
+    new_position = (current_position + 1) % 26
+    new_cycle_name = chr(new_position + ord('a'))
 
-# Parallelizes the execution of the method for all given inputs
-def run_parallel(method, inputs):
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        executor.map(method, inputs)
+    names = graph_last_iteration_1.names.copy()
+    index = graph_last_iteration_1.index.copy()
+    for node in names_2:
+        if node[0] == last_cycle_node_name:
+            new_node = new_cycle_name + node[1:]
+            index[new_node] = len(names)
+            names.append(new_node)
+
+    g2_mapping = [index[new_cycle_name + node[1:] if node[0] == last_cycle_node_name else node] for node in names_2]
+    g3_mapping = [index[(last_cycle_node_name if node[0] == 'u' else new_cycle_name) + node[1:]] for node in graph_connection_2_cycles.names]
+
+    adjacency = graph_last_iteration_1.adjacency + [0] * (len(names) - len(graph_last_iteration_1.names))
+    for graph, mapping in ((graph_last_iteration_2, g2_mapping), (graph_connection_2_cycles, g3_mapping)):
+        for i, mask in enumerate(graph.adjacency):
+            new_mask = 0
+            for j in compact_graph.iter_bits(mask):
+                new_mask |= 1 << mapping[j]
+            adjacency[mapping[i]] |= new_mask
+
+    n = len(names) // nodes_per_cycle
+    name, edge_numbers, graph_numbers, possible_precolorings = combine_metadata(graph_last_iteration_1, graph_last_iteration_2, graph_connection_2_cycles, n)
+
+    cycles = graph_last_iteration_1.cycles + [max(graph_last_iteration_1.cycles) + 1] * (len(names) - len(graph_last_iteration_1.names))
+    return compact_graph.CompactGraph(names, adjacency, cycles, name, edge_numbers, graph_numbers, possible_precolorings)
@@ -0,0 +1,100 @@
+# Searches for an induced path on 'length' nodes in the graph that is given by the adjacency bitmasks of its nodes and returns the indices of its nodes, or None if there is no such path.
+# Paths are extended node by node. 'blocked' contains every node on the path and every neighbor of a node on the path except for the last one, so every candidate for the next node is found with one bitmask operation.
+# Each induced path is found from both of its ends, so only paths whose end has a larger index than their start are completed.
+# If required_masks are given, only paths that contain at least one node of every mask are searched. A path is only extended by nodes that are close enough to every mask it does not hit yet.
+# If blocking_adjacency is given, two nodes of the path that are not consecutive must not be adjacent in blocking_adjacency instead of adjacency. This is used to find paths that stay induced when further edges are added.
+def find_induced_path(adjacency, length, required_masks=(), blocking_adjacency=None):
+    node_count = len(adjacency)
+    if length <= 0 or node_count < length:
+        return None
+
+    reachable = [nodes_within_distance(adjacency, mask, length - 1) for mask in required_masks]
+    blocking = adjacency if blocking_adjacency is None else blocking_adjacency
+    path = []
+
+    def extend(last, blocked, larger_than_start):
+        path.append(last)
+        if len(path) == length:
+            return True
+
+        candidates = adjacency[last] & ~blocked
+        if len(path) == length - 1:
+            candidates &= larger_than_start
+        blocked |= blocking[last]
+        while candidates:
+            lowest_bit = candidates & -candidates
+            if extend(lowest_bit.bit_length() - 1, blocked | lowest_bit, larger_than_start):
+                return True
+            candidates ^= lowest_bit
+
+        path.pop()
+        return False
+
+    def extend_hitting_required_masks(last, blocked, path_mask, larger_than_start):
+        path.append(last)
+        if len(path) == length:
+            return True
+
+        remaining = length - len(path)
+        candidates = adjacency[last] & ~blocked
+        if remaining == 1:
+            candidates &= larger_than_start
+        for mask, within_distance in zip(required_masks, reachable):
+            if not path_mask & mask:
+                candidates &= within_distance[remaining - 1]
+
+        blocked |= blocking[last]
+        while candidates:
+            lowest_bit = candidates & -candidates
+            if extend_hitting_required_masks(lowest_bit.bit_length() - 1, blocked | lowest_bit, path_mask | lowest_bit, larger_than_start):
+                return True
+            candidates ^= lowest_bit
+
+        path.pop()
+        return False
+
+    start_candidates = (1 << node_count) - 1
+    for within_distance in reachable:
+        start_candidates &= within_distance[length - 1]
+
+    while start_candidates:
+        lowest_bit = start_candidates & -start_candidates
+        start = lowest_bit.bit_length() - 1
+        # Only nodes with a larger index than the start can end the path
+        if required_masks:
+            found = extend_hitting_required_masks(start, lowest_bit, lowest_bit, -(lowest_bit << 1))
+        else:
+            found = extend(start, lowest_bit, -(lowest_bit << 1))
+        if found:
+            return path
+        start_candidates ^= lowest_bit
+
+    return None
+
+
+# Returns a list, whose d'th entry is the bitmask of all nodes that have distance at most d to a node in the given mask
+def nodes_within_distance(adjacency, mask, max_distance):
+    within_distance = [mask]
+    frontier = mask
+    for _ in range(max_distance):
+        neighborhood = 0
+        while frontier:
+            lowest_bit = frontier & -frontier
+            neighborhood |= adjacency[lowest_bit.bit_length() - 1]
+            frontier ^= lowest_bit
+        frontier = neighborhood & ~within_distance[-1]
+        within_distance.append(within_distance[-1] | neighborhood)
+    return within_distance
+
+
+# Determines whether the graph given by its adjacency bitmasks contains an induced path on 'length' nodes, that contains at least one node of every required mask
+def has_induced_path(adjacency, length, required_masks=(), blocking_adjacency=None):
+    return find_induced_path(adjacency, length, required_masks, blocking_adjacency) is not None
+
+
+# Returns the node names of an induced path on 'length' nodes in a CompactGraph, or None if there is no such path
+def find_induced_path_in_graph(graph, length):
+    path = find_induced_path(graph.adjacency, length)
+    if path is None:
+        return None
+    return [graph.names[i] for i in path]
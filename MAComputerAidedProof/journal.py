@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+
+# Append-only progress journal of a stage. Every record is one line of JSON, that is written with a single write call and synced to disk before append returns,
+# so after a crash the journal contains every record that was appended, except maybe an incomplete last line, which is ignored when reading.
+# The first record is the header, that describes the inputs of the stage. The other records are only valid for the inputs described in the header.
+class ProgressJournal:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    # Returns all complete records of the journal
+    def read(self):
+        if not os.path.exists(self.file_path):
+            return []
+
+        records = []
+        with open(self.file_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def append(self, record):
+        fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, (json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Replaces the journal by a new journal, that only contains the header. The new journal is written to a temporary file first and then renamed, so the old journal
+    # stays valid until the new one is complete.
+    def reset(self, header):
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        temporary_path = self.file_path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write((json.dumps(header, sort_keys=True) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.file_path)
+
+    # Returns the records after the header, if the journal was written for the same header. Otherwise the journal is reset to the header and an empty list is returned.
+    def resume(self, header):
+        records = self.read()
+        if records and records[0] == json.loads(json.dumps(header)):
+            return records[1:]
+        self.reset(header)
+        return []
+
+    # Starts a stage with the given header and returns the records of the last run of the stage, that can be resumed. Without resume, the journal is always reset.
+    def start(self, header, resume=True):
+        if resume:
+            return self.resume(header)
+        self.reset(header)
+        return []
+
+
+# Counts the finished work items of a stage, whose results are saved by a GraphWriter, and appends a checkpoint to the journal every checkpoint_seconds seconds.
+# The results have to be collected in the order of the work items, then a checkpoint, i.e. the number of finished items and the number of graphs in each store, describes
+# the state of the stage after these items. Before the checkpoint is appended, the writer is flushed with fsync, so the journal never refers to graphs that are not on disk.
+class StageCheckpointer:
+
+    def __init__(self, progress_journal, writer, items_done=0, checkpoint_seconds=60):
+        self.progress_journal = progress_journal
+        self.writer = writer
+        self.items_done = items_done
+        self.checkpoint_seconds = checkpoint_seconds
+        self.last_checkpoint_time = time.monotonic()
+
+    # Saves the graphs that resulted from one work item
+    def collect(self, graphs):
+        self.writer.add_all(graphs)
+        self.items_done += 1
+        if time.monotonic() - self.last_checkpoint_time >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def checkpoint(self, complete=False):
+        self.writer.flush()
+        self.progress_journal.append({'items_done': self.items_done, 'store_counts': self.writer.store_counts, 'complete': complete})
+        self.last_checkpoint_time = time.monotonic()
+
+
+# Returns the last record of a list of records, that contains the given key, or None
+def get_last_record_with(records, key):
+    for record in reversed(records):
+        if key in record:
+            return record
+    return None
@@ -0,0 +1,103 @@
+import compact_graph
+
+# Reasons for which is_decomposed_strictly rejects a precoloring, that the propagation alone does not reject
+UNEXTENDABLE = 'unextendable'
+FORCED = 'forced'
+
+
+# Removes the color of every node in the worklist from the domains of its neighbors, until the worklist is empty, like ColorDomains.propagate.
+# Every node also carries an explanation, the bitmask of the decision levels that removed colors from its domain, where level 0 stands for the given domains.
+# A node, whose domain shrinks, takes over the explanation of the node that removed the color. Returns 0, or the explanation of the node whose domain became empty.
+def propagate(adjacency, domains, explanations, worklist):
+    while worklist:
+        i = worklist.pop()
+        bit = domains[i]
+        neighbors = adjacency[i]
+        while neighbors:
+            lowest_bit = neighbors & -neighbors
+            neighbors ^= lowest_bit
+            j = lowest_bit.bit_length() - 1
+            domain = domains[j]
+            if domain & bit:
+                domain &= ~bit
+                domains[j] = domain
+                explanations[j] |= explanations[i]
+                if domain == 0:
+                    return explanations[j]
+                if domain & (domain - 1) == 0:
+                    worklist.append(j)
+    return 0
+
+
+# Searches a list coloring of the graph with the given domains, i.e. 3-bit masks per node index, in which every node with a single color was already propagated.
+# The search branches on a node with the fewest colors left, propagates every choice and jumps back over the decisions that did not take part in a conflict.
+# Returns the colored domains of a solution, or None and the conflict, i.e. the decision levels that are responsible for the failure.
+def search(adjacency, domains, explanations, level):
+    uncolored = [i for i, domain in enumerate(domains) if domain & (domain - 1)]
+    if not uncolored:
+        return domains, 0
+    i = min(uncolored, key=lambda j: domains[j].bit_count())
+
+    level_bit = 1 << level
+    conflicts = explanations[i]
+    remaining = domains[i]
+    while remaining:
+        bit = remaining & -remaining
+        remaining ^= bit
+
+        new_domains = domains.copy()
+        new_explanations = explanations.copy()
+        new_domains[i] = bit
+        new_explanations[i] = level_bit
+        conflict = propagate(adjacency, new_domains, new_explanations, [i])
+        if not conflict:
+            (solution, conflict) = search(adjacency, new_domains, new_explanations, level + 1)
+            if solution is not None:
+                return solution, 0
+        # The choice of the node at this level did not take part in the conflict, so the other colors fail in the same way
+        if not conflict & level_bit:
+            return None, conflict
+        conflicts |= conflict & ~level_bit
+    return None, conflicts
+
+
+# Returns a list coloring of the graph with adjacency bitmasks, that respects the domains, as a list of color bits per node index, or None if there is none
+def find_list_coloring(adjacency, domains):
+    domains = list(domains)
+    if not all(domains):
+        return None
+    explanations = [1] * len(domains)
+    if propagate(adjacency, domains, explanations, [i for i, domain in enumerate(domains) if domain & (domain - 1) == 0]):
+        return None
+    return search(adjacency, domains, explanations, 1)[0]
+
+
+# Returns for every node in nodes_mask the bitmask of the colors that it has in at least one list coloring, or None if there is no list coloring.
+# Every color that appears in a solution is supported at once, so only the colors that no solution found so far uses have to be tried on their own.
+def get_feasible_colors(adjacency, domains, nodes_mask):
+    solution = find_list_coloring(adjacency, domains)
+    if solution is None:
+        return None
+    feasible = {i: solution[i] for i in compact_graph.iter_bits(nodes_mask)}
+    for i in feasible:
+        for bit in (1, 2, 4):
+            if domains[i] & bit and not feasible[i] & bit:
+                restricted_domains = list(domains)
+                restricted_domains[i] = bit
+                solution = find_list_coloring(adjacency, restricted_domains)
+                if solution is not None:
+                    for j in feasible:
+                        feasible[j] |= solution[j]
+    return feasible
+
+
+# Decides a state, that propagation.is_decomposed does not reject, exactly: returns UNEXTENDABLE, if the precoloring cannot be extended to a coloring of the whole graph,
+# FORCED, if a node of the last cycle has the same color in every extension, and None otherwise.
+def is_decomposed_strictly(domains):
+    graph = domains.graph
+    feasible = get_feasible_colors(graph.adjacency, domains.domains, graph.cycle_mask(max(graph.cycles)))
+    if feasible is None:
+        return UNEXTENDABLE
+    if any(colors & (colors - 1) == 0 for colors in feasible.values()):
+        return FORCED
+    return None
@@ -1,229 +1,441 @@
+import itertools
+import time
 import networkx as nx
 
 import graph_io as gio
 import graph_utils as gu
-import custom_graph
 import graph_coloring as gc
+import batch_coloring as bc
+import propagation
+import journal
+import metrics
+import pipeline
+import scheduler
+import sharding
 
 
 # Generates two C5s and determines all possible combinations of edges, that can run between the two C5s. For every resulting graph, it is checked, whether it is (P6, triangle)-free. The (P6, triangle)-free graphs are then saved to the results folder.
-def find_connections_2_c5s():
-    # Counts the number of resulting graphs, to give them unique names
-    graph_counter = 0
-    for edge_number in range(5, 11):
-        # Generates 2 C5s
-        g1 = nx.cycle_graph(5)
-        g2 = nx.cycle_graph(5)
-
-        g1 = nx.relabel_nodes(g1, {num: 'u' + str(num) for num in list(g1)})
-        g2 = nx.relabel_nodes(g2, {num: 'v' + str(num) for num in list(g2)})
-
-        # Determines all possible combinations of edges, that can run between the two C5s
-        possible_edgesets = gu.generate_all_possible_edgesets(g1, g2, edge_number, 5)
-
-        # Combines the C5s and the edges to a new Graph
-        nx_graphs = gu.compose_graphs(g1, g2, possible_edgesets)
-
-        # Checks for each graph, whether it is (P6, triangle)-free
-        p6_triangle_free_graphs = []
-        for nx_graph in nx_graphs:
-            graph = custom_graph.CustomGraph.from_networkx_graph(nx_graph, 'graph' + str(graph_counter), [edge_number], [graph_counter], set())
-            if graph.is_p6_triangle_free():
-                p6_triangle_free_graphs.append(graph)
-                graph_counter += 1
-
-        # Saves the graphs and their plots
-        gio.save_graphs_in_directory(p6_triangle_free_graphs,
-                                     'results/c5s/2_c5s/' + str(edge_number) + '_connecting_edges')
-        gio.save_graph_plots_in_directory(p6_triangle_free_graphs,
-                                          'results/c5s/2_c5s/' + str(edge_number) + '_connecting_edges_plots')
+# With max_workers > 1, each number of connecting edges is handled by its own worker. The plots are rendered afterwards by plotting.py.
+@metrics.stage_report
+def find_connections_2_c5s(max_workers=1):
+    find_connections_2_cycles(5, range(5, 11), max_workers)
 
 
 # Generates two triangles and determines all possible combinations of edges, that can run between the two triangles. For every resulting graph, it is checked, whether it is (P6, K4, diamong)-free. The (P6, triangle)-free graphs are then saved to the results folder.
-def find_connections_2_c3s():
-    # Counts the number of resulting graphs, to give them unique names
-    graph_counter = 0
-    for edge_number in range(1, 4):
-        # Generates 2 triangles
-        g1 = nx.cycle_graph(3)
-        g2 = nx.cycle_graph(3)
-
-        g1 = nx.relabel_nodes(g1, {num: 'u' + str(num) for num in list(g1)})
-        g2 = nx.relabel_nodes(g2, {num: 'v' + str(num) for num in list(g2)})
-
-        # Determines all possible combinations of edges, that can run between the two triangles
-        possible_edgesets = gu.generate_all_possible_edgesets(g1, g2, edge_number, 3)
-
-        # Combines the triangles and the edges to a new Graph
-        nx_graphs = gu.compose_graphs(g1, g2, possible_edgesets)
-
-        # Checks for each graph, whether it is (P6, k4, diamond)-free
-        p6_k4_diamond_free_graphs = []
-        for nx_graph in nx_graphs:
-            graph = custom_graph.CustomGraph.from_networkx_graph(nx_graph, 'graph' + str(graph_counter), [edge_number], [graph_counter], set())
-            if graph.is_p6_diamond_k4_free():
-                p6_k4_diamond_free_graphs.append(graph)
-                graph_counter += 1
-
-        # Saves the graphs and their plots
-        gio.save_graphs_in_directory(p6_k4_diamond_free_graphs,
-                                     'results/c3s/2_c3s/' + str(edge_number) + '_connecting_edges')
-        gio.save_graph_plots_in_directory(p6_k4_diamond_free_graphs,
-                                          'results/c3s/2_c3s/' + str(edge_number) + '_connecting_edges_plots')
+# With max_workers > 1, each number of connecting edges is handled by its own worker. The plots are rendered afterwards by plotting.py.
+@metrics.stage_report
+def find_connections_2_c3s(max_workers=1):
+    find_connections_2_cycles(3, range(1, 4), max_workers)
+
+
+# Runs find_connections_2_cycles_with_edge_number for all given numbers of connecting edges, each number of connecting edges is handled by one of max_workers workers.
+# The edge sets come back in the order of the edge numbers and only then the graphs are composed, numbered consecutively over all edge numbers and saved, so the results are
+# the same as in a serial run.
+# The edge sets of one edge number come back as one batch instead of streaming to the writer one by one: they are only in the numbering order after the orbits of all
+# representatives were expanded and sorted, see find_connections_2_cycles_with_edge_number. The composed graphs still stream to the writer, and the batches are small
+# (1,870 free edge sets for C5s over all edge numbers).
+def find_connections_2_cycles(nodes_per_cycle, edge_numbers, max_workers=1):
+    gio.remove_graph_stores('results/c' + str(nodes_per_cycle) + 's/2_c' + str(nodes_per_cycle) + 's')
+    g1, g2 = generate_2_cycles(nodes_per_cycle)
+    writer = gio.GraphWriter(nodes_per_cycle)
+
+    def collect(result):
+        (edge_number, edgesets) = result
+        for graph in gu.compose_compact_graphs(g1, g2, edgesets):
+            graph.name = 'graph' + str(writer.graph_count)
+            graph.edge_numbers = [edge_number]
+            graph.graph_numbers = [writer.graph_count]
+            graph.possible_precolorings = set()
+            writer.add(graph)
+
+    scheduler.run_scheduled(find_connections_2_cycles_with_edge_number, ((nodes_per_cycle, edge_number) for edge_number in edge_numbers), collect=collect,
+                            max_workers=max_workers, chunk_size=1)
+    writer.flush()
+    metrics.count('graphs', writer.graph_count)
+
+
+# Generates two cycles with the given number of nodes
+def generate_2_cycles(nodes_per_cycle):
+    g1 = nx.cycle_graph(nodes_per_cycle)
+    g2 = nx.cycle_graph(nodes_per_cycle)
+
+    g1 = nx.relabel_nodes(g1, {num: 'u' + str(num) for num in list(g1)})
+    g2 = nx.relabel_nodes(g2, {num: 'v' + str(num) for num in list(g2)})
+    return g1, g2
+
+
+# Forbidden subgraphs of graphs consisting of C5s and of triangles, with the methods of CompactGraph that search them, in the order of is_p6_triangle_free and is_p6_diamond_k4_free
+FORBIDDEN_SUBGRAPHS = {5: (('triangle', 'has_triangle'), ('p6', 'has_induced_p6')),
+                       3: (('p6', 'has_induced_p6'), ('diamond', 'has_diamond'), ('k4', 'has_k4'))}
+
+# Engine of is_free_of_forbidden_subgraphs for every number of nodes per cycle: 'matcher' searches all forbidden subgraphs in one pass of the compiled matcher of subgraph_matcher,
+# 'separate' runs the searches of FORBIDDEN_SUBGRAPHS one after another. The patterns of triangles share their first nodes, so the single pass is faster for them.
+# For C5s, the cheap triangle search already rejects most graphs before the P6 search starts, so the separate searches are faster.
+FORBIDDEN_SUBGRAPH_ENGINES = {5: 'separate', 3: 'matcher'}
+
+
+# Determines, whether a graph that consists of cycles with the given number of nodes is free of the forbidden subgraphs, i.e. (P6, triangle)-free for C5s and (P6, K4, diamond)-free for triangles.
+# If required_masks are given, only forbidden subgraphs that hit every mask are searched. The time spent in every search and the forbidden subgraph that rejected the graph are recorded in the metrics.
+# A CustomGraph is converted to a CompactGraph once, before the searches run on it.
+def is_free_of_forbidden_subgraphs(graph, nodes_per_cycle, required_masks=()):
+    metrics.count('candidates')
+    graph = graph.to_compact()
+    if FORBIDDEN_SUBGRAPH_ENGINES[nodes_per_cycle] == 'matcher':
+        start = time.perf_counter()
+        subgraph = graph.find_forbidden_subgraph(nodes_per_cycle, required_masks)
+        metrics.add_time('forbidden_subgraphs', time.perf_counter() - start)
+        if subgraph is not None:
+            metrics.count('rejected_by_' + subgraph)
+            return False
+        return True
+
+    for (subgraph, method_name) in FORBIDDEN_SUBGRAPHS[nodes_per_cycle]:
+        start = time.perf_counter()
+        found = getattr(graph, method_name)(required_masks)
+        metrics.add_time(subgraph, time.perf_counter() - start)
+        if found:
+            metrics.count('rejected_by_' + subgraph)
+            return False
+    return True
+
+
+# Returns the numbers of connecting edges and the edge sets of all graphs, that consist of two cycles with edge_number edges between them and are free of the forbidden subgraphs.
+# gu.generate_pruned_edgesets only yields the free edge sets, that are the lexicographically smallest ones in their orbit under rotating and reflecting the cycles. All edge
+# sets in an orbit result in isomorphic graphs, so the orbits of these representatives contain all free edge sets, without checking them again. The edge sets are given by the
+# numbers of their edges, see gu.get_edgeset_symmetries, and sorting them restores the order of itertools.combinations, so the graphs keep their numbers.
+def find_connections_2_cycles_with_edge_number(method_input):
+    (nodes_per_cycle, edge_number) = method_input
+    g1, g2 = generate_2_cycles(nodes_per_cycle)
+    symmetries = gu.get_edgeset_symmetries(nodes_per_cycle)
+
+    free_edgesets = []
+    for representative in gu.generate_pruned_edgesets(g1, g2, edge_number, nodes_per_cycle, symmetries):
+        free_edgesets.extend(gu.get_edgeset_orbit(representative, symmetries))
+        metrics.count('representatives')
+    free_edgesets.sort()
+    return edge_number, free_edgesets
 
 
 # Runs through the list of connections between two C5s and only saves one representative for each set of graphs, in which every graph is isomorphic to each other with an isomorphism that sends each C5 onto itself.
+@metrics.stage_report
 def find_connections_2_c5s_with_filtered_automorphisms():
     for i in range(5, 11):
         directory_name = 'results/c5s/2_c5s/' + str(i) + '_connecting_edges'
         new_directory_name = 'results/c5s/2_c5s_unique_by_automorphisms/' + str(i) + '_connecting_edges'
 
         graphs = gio.read_graph_files(directory_name)
-        unique_graphs = gu.filter_isomorphisms_with_cycle_to_cycle_mapping(graphs)
+        # The representative of each orbit of connecting edges under rotating and reflecting the cycles is the lexicographically smallest edge set, see gu.generate_pruned_edgesets
+        symmetries = gu.get_edgeset_symmetries(5)
+        unique_graphs = [graph for graph in graphs if gu.is_orbit_minimal(gu.get_connecting_edge_indices(graph, 5), symmetries)]
+        metrics.count('candidates', len(graphs))
+        metrics.count('rejected_by_automorphism', len(graphs) - len(unique_graphs))
 
         gio.save_graphs_in_directory(unique_graphs, new_directory_name)
 
 
 # Runs through the list of connections between two triangles and only saves one representative for each set of graphs, in which every graph is isomorphic to each other with an isomorphism that sends each triangle onto itself.
+@metrics.stage_report
 def find_connections_2_c3s_with_filtered_automorphisms():
     for i in range(1, 4):
         directory_name = 'results/c3s/2_c3s/' + str(i) + '_connecting_edges'
         new_directory_name = 'results/c3s/2_c3s_unique_by_automorphisms/' + str(i) + '_connecting_edges'
 
         graphs = gio.read_graph_files(directory_name)
-        unique_graphs = gu.filter_isomorphisms_with_cycle_to_cycle_mapping(graphs)
+        # The representative of each orbit of connecting edges under rotating and reflecting the cycles is the lexicographically smallest edge set, see gu.generate_pruned_edgesets
+        symmetries = gu.get_edgeset_symmetries(3)
+        unique_graphs = [graph for graph in graphs if gu.is_orbit_minimal(gu.get_connecting_edge_indices(graph, 3), symmetries)]
+        metrics.count('candidates', len(graphs))
+        metrics.count('rejected_by_automorphism', len(graphs) - len(unique_graphs))
 
         gio.save_graphs_in_directory(unique_graphs, new_directory_name)
 
 
-# For two given graphs from the last iteration step, this function puts together all possible graphs with k C5s and saves those graphs, that are (P6, triangle)-free.
+# For two given graphs from the last iteration step, this function puts together all possible graphs with k C5s and returns those graphs, that are (P6, triangle)-free. All input graphs have to be CompactGraphs.
+# Since the three combined graphs are already (P6, triangle)-free, only triangles and induced P6s that touch the new C5 are searched (see CompactGraph.last_cycle_required_masks).
 def find_possible_connections_c5s(method_input):
     (graph_1, graph_2, connections_2_c5s, k) = method_input
+    combined_graphs = []
     for connecting_edges_3, possible_connections_2c5s in connections_2_c5s.items():
         if int(graph_1.edge_numbers[0]) <= int(connecting_edges_3):
             for graph_3 in possible_connections_2c5s:
-                edge_numbers = graph_1.edge_numbers.copy()
-                if len(graph_2.edge_numbers) <= 1:
-                    edge_numbers.extend(graph_2.edge_numbers)
-                else:
-                    edge_numbers.extend(graph_2.edge_numbers[((k-2)*(k-3)) // 2:])
-                edge_numbers.append(graph_3.edge_numbers[0])
+                combined_graph = gu.combine_compact_graph_from_last_iteration(graph_1, graph_2, graph_3, 5)
+                if is_free_of_forbidden_subgraphs(combined_graph, 5, combined_graph.last_cycle_required_masks()):
+                    combined_graphs.append(combined_graph)
+    return combined_graphs
 
-                combined_graph = gu.combine_graph_from_last_iteration(graph_1, graph_2, graph_3, 5)
-                if combined_graph.is_p6_triangle_free():
-                    gio.save_graph(combined_graph, 5)
 
-
-# For two given graphs from the last iteration step, this function puts together all possible graphs with k triangles and saves those graphs, that are (P6, K4, diamond)-free.
+# For two given graphs from the last iteration step, this function puts together all possible graphs with k triangles and returns those graphs, that are (P6, K4, diamond)-free. All input graphs have to be CompactGraphs.
+# Since the three combined graphs are already (P6, K4, diamond)-free, only forbidden subgraphs that touch the new triangle are searched (see CompactGraph.last_cycle_required_masks).
 def find_possible_connections_c3s(method_input):
     (graph_1, graph_2, connections_2_c3s, k) = method_input
+    combined_graphs = []
     for connecting_edges_3, possible_connections_2c3s in connections_2_c3s.items():
         if int(graph_1.edge_numbers[0]) <= int(connecting_edges_3):
             for graph_3 in possible_connections_2c3s:
-                edge_numbers = graph_1.edge_numbers.copy()
-                if len(graph_2.edge_numbers) <= 1:
-                    edge_numbers.extend(graph_2.edge_numbers)
-                else:
-                    edge_numbers.extend(graph_2.edge_numbers[((k-2)*(k-3)) // 2:])
-                edge_numbers.append(graph_3.edge_numbers[0])
-
-                combined_graph = gu.combine_graph_from_last_iteration(graph_1, graph_2, graph_3, 3)
-                if combined_graph.is_p6_diamond_k4_free():
-                    gio.save_graph(combined_graph, 3)
-
-
-# Collects all inputs for iteration step k of the 'find_possible_connections' method, that need to be checked. Therefore, for every graph with k-1 C5s from the last iteration step, we take another graph with k-1 C5s, that represents the connections between the first k-2 C5s and the new C5 that will be added. These pairs of graphs, together with a list of all possible connections between two C5s, are then used as inputs for running the 'find_possible_connections' method.
-def start_execution(k, nodes_per_cycle):
+                combined_graph = gu.combine_compact_graph_from_last_iteration(graph_1, graph_2, graph_3, 3)
+                if is_free_of_forbidden_subgraphs(combined_graph, 3, combined_graph.last_cycle_required_masks()):
+                    combined_graphs.append(combined_graph)
+    return combined_graphs
+
+
+# Collects all inputs for iteration step k of the 'find_possible_connections' method, that need to be checked, and runs them with max_workers workers (all cores by default).
+# The progress is checkpointed to a journal in the results folder of step k. With resume, a run that was interrupted continues at its last checkpoint, a finished run is skipped.
+# A run is only resumed, if the code and the graphs of the last iteration step did not change since it started, see pipeline.get_stage_fingerprint.
+# With a shard (i, N), only the inputs of the shard are run and the graphs are saved below the results folder of the shard, see sharding.py. Therefore, for every graph with k-1 C5s from the last iteration step, we take another graph with k-1 C5s, that represents the connections between the first k-2 C5s and the new C5 that will be added. These pairs of graphs, together with a list of all possible connections between two C5s, are then used as inputs for running the 'find_possible_connections' method.
+@metrics.stage_report
+def start_execution(k, nodes_per_cycle, max_workers=None, chunk_size=None, resume=True, checkpoint_seconds=60, shard=None):
     if nodes_per_cycle == 3:
         connections_2_cycles = gu.get_connections_2c3s()
-        print(len(connections_2_cycles))
     elif nodes_per_cycle == 5:
         connections_2_cycles = gu.get_connections_2c5s()
     else:
         return
 
     connections_last_iteration = gu.get_connections_last_iteration(k, nodes_per_cycle)
-    print(len(connections_last_iteration))
     unique_connections_last_iteration = gu.get_unique_connections_last_iteration(k, nodes_per_cycle)
-    print(len(unique_connections_last_iteration))
 
-    inputs = []
-    for connecting_edges_1, possible_unique_connections_last_iteration_1 in unique_connections_last_iteration.items():
-        for graph_1 in possible_unique_connections_last_iteration_1:
-            for connecting_edges_2, possible_connections_last_iteration_2 in connections_last_iteration.items():
-                for graph_2 in possible_connections_last_iteration_2:
-                    if (k == 3 and int(graph_1.edge_numbers[0]) <= int(graph_2.edge_numbers[0])) or (k != 3 and graph_1.graph_numbers[:((k - 2) * (k - 3)) // 2] == graph_2.graph_numbers[:((k - 2) * (k - 3)) // 2]):
-                        method_input = (graph_1, graph_2, connections_2_cycles, k)
-                        inputs.append(method_input)
+    # The graphs of the last iteration step are joined with the unique graphs by their join key, see gu.get_join_key
+    index = gu.index_connections_last_iteration(connections_last_iteration, k)
+    inputs = gu.generate_execution_inputs(k, unique_connections_last_iteration, index)
+    if shard is None:
+        input_count = gu.count_execution_inputs(k, unique_connections_last_iteration, index)
+    else:
+        inputs = (graph_pair for graph_pair in inputs if sharding.is_input_in_shard(graph_pair, shard))
+        input_count = gu.count_execution_inputs(k, unique_connections_last_iteration, index, lambda graph_pair: sharding.is_input_in_shard(graph_pair, shard))
 
-    print(len(inputs))
+    metrics.count('inputs', input_count)
+    print('Step ' + str(k) + ': ' + str(input_count) + ' inputs from ' + str(sum(len(graphs) for graphs in unique_connections_last_iteration.values())) + ' unique graphs and '
+          + str(sum(len(graphs) for graphs in connections_last_iteration.values())) + ' graphs of the last iteration step')
 
     if nodes_per_cycle == 3:
-        gu.run_parallel(find_possible_connections_c3s, inputs)
-    elif nodes_per_cycle == 5:
-        gu.run_parallel(find_possible_connections_c5s, inputs)
+        method = find_possible_connections_c3s
     else:
+        method = find_possible_connections_c5s
+
+    # The progress of an earlier run with the same inputs can be resumed, the stores are truncated to the graphs that were saved at its last checkpoint
+    results_root = sharding.get_results_root(shard)
+    level_directory = results_root + '/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's'
+    progress_journal = journal.ProgressJournal(level_directory + '/progress.journal')
+    header = {'stage': 'start_execution', 'k': k, 'nodes_per_cycle': nodes_per_cycle, 'input_count': input_count,
+              'fingerprint': pipeline.get_stage_fingerprint('start_execution', k, nodes_per_cycle)}
+    if shard is not None:
+        header['shard'] = list(shard)
+    records = progress_journal.start(header, resume)
+    checkpoint = journal.get_last_record_with(records, 'items_done')
+    if checkpoint is None:
+        gio.remove_graph_stores(level_directory)
+        checkpoint = {'items_done': 0, 'store_counts': {}, 'complete': False}
+    elif checkpoint['complete']:
+        print('Step ' + str(k) + ' is already complete')
         return
-
-
-# Runs through the list of connections between k C5s. For each graph all proper precolorings of the first k-1 C5s are determined. For each precoloring it is checked, if it does not decompose the graph, then it is saved in the graph instance. Each graph that hasss at least one precoloring that does not decompose the graph, is saved in the results folder.
-def find_possible_precolored_graphs(k, nodes_per_cycle):
-    subfolders = gio.get_subfolders_with_suffix('results/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's', '_connecting_edges')
-    for (subfolder, connecting_edges) in subfolders:
-        graph_list = gio.read_graph_files(subfolder)
-
-        for graph in graph_list:
-            coloring_list = []
+    else:
+        gio.truncate_graph_stores(level_directory, checkpoint['store_counts'])
+        print('Resuming step ' + str(k) + ' after ' + str(checkpoint['items_done']) + ' of ' + str(input_count) + ' inputs')
+    inputs = itertools.islice(inputs, checkpoint['items_done'], None)
+
+    # The connections between two cycles are sent to every worker only once, the combined graphs are sent back and saved in batches
+    writer = gio.GraphWriter(nodes_per_cycle, fsync=True, initial_store_counts=checkpoint['store_counts'], results_root=results_root)
+    checkpointer = journal.StageCheckpointer(progress_journal, writer, checkpoint['items_done'], checkpoint_seconds)
+    progress = metrics.ProgressReporter('Step ' + str(k), input_count, checkpoint['items_done'])
+
+    def collect(combined_graphs):
+        checkpointer.collect(combined_graphs)
+        progress.update()
+
+    scheduler.run_scheduled(method, inputs, (connections_2_cycles, k), collect, max_workers, chunk_size, input_count - checkpoint['items_done'])
+    checkpointer.checkpoint(complete=True)
+
+
+# Determines the precolorings of one graph with k cycles, that do not decompose it, see find_possible_precolored_graphs. Returns the position of the subfolder of the graph,
+# the number of graphs in the subfolder and the graph with its precolorings, or None if it has none. An empty subfolder is passed as graph None.
+# The cache of the propagated states of the first k-1 cycles is kept in the worker process for all graphs that it handles.
+def find_possible_precolorings(method_input):
+    (subfolder_position, graph_count, graph, k, nodes_per_cycle, strict, cache_size) = method_input
+    if graph is None:
+        return subfolder_position, graph_count, None
+
+    start = time.perf_counter()
+    pruned_before = metrics.counters['pruned_unextendable'] + metrics.counters['pruned_forced']
+    if k == 3:
+        coloring_list = []
+        if nodes_per_cycle == 3:
+            coloring_list = gc.generate_colorings_two_c3s()
+        if nodes_per_cycle == 5:
+            coloring_list = gc.generate_colorings_two_c5s()
+
+        survivors = bc.surviving_precolorings(graph, coloring_list, nodes_per_cycle)
+        graph.possible_precolorings = [precoloring.copy() for precoloring, survives in zip(coloring_list, survivors) if survives]
+        if strict:
+            graph.possible_precolorings = propagation.strictly_surviving_precolorings(propagation.ColorDomains(graph), graph.possible_precolorings)
+        metrics.count('precoloring_candidates', len(coloring_list))
+    else:
+        # Every inherited precoloring is propagated once and only the colorings of the added cycle are branched over
+        domains = propagation.ColorDomains(graph)
+        cache = scheduler.get_worker_object('propagation_cache', lambda: propagation.PropagationCache(cache_size))
+        # The first (k-1)(k-2)/2 graph numbers are the ones of the graph with k-1 cycles, that the graph was combined from, see gu.combine_metadata
+        prefix = tuple(graph.graph_numbers[:(k - 1) * (k - 2) // 2])
+        possible_precolorings = []
+        for precoloring in graph.possible_precolorings:
+            added_colorings = []
             if nodes_per_cycle == 3:
-                if k == 3:
-                    coloring_list = gc.generate_colorings_two_c3s()
-                else:
-                    for precoloring in graph.possible_precolorings:
-                        coloring_list.extend(gc.generate_colorings_with_added_c3(precoloring))
-
+                added_colorings = gc.generate_colorings_of_added_c3(precoloring)
             if nodes_per_cycle == 5:
-                if k == 3:
-                    coloring_list = gc.generate_colorings_two_c5s()
-                else:
-                    for precoloring in graph.possible_precolorings:
-                        coloring_list.extend(gc.generate_colorings_with_added_c5(precoloring))
+                added_colorings = gc.generate_colorings_of_added_c5(precoloring)
+            metrics.count('precoloring_candidates', len(added_colorings))
+            if cache_size > 0:
+                possible_precolorings.extend(propagation.cached_surviving_extensions(domains, cache, prefix, (k - 1) * nodes_per_cycle, precoloring, added_colorings,
+                                                                                      nodes_per_cycle, strict))
+            else:
+                possible_precolorings.extend(propagation.surviving_extensions(domains, precoloring, added_colorings, nodes_per_cycle, strict))
+        graph.possible_precolorings = possible_precolorings
+        cache.record_peaks()
+
+    metrics.count('candidates')
+    metrics.count('precolorings', len(graph.possible_precolorings))
+    metrics.add_time('propagation', time.perf_counter() - start)
+    if len(graph.possible_precolorings) > 0:
+        return subfolder_position, graph_count, graph
+    if metrics.counters['pruned_unextendable'] + metrics.counters['pruned_forced'] > pruned_before:
+        # The propagation alone would have kept a precoloring of the graph
+        metrics.count('rejected_by_strict_mode')
+    else:
+        metrics.count('rejected_by_decomposition')
+    return subfolder_position, graph_count, None
 
-            graph.possible_precolorings = []
 
-            for precoloring in coloring_list:
-                (is_decomposed, coloring) = graph.decomposed_by_precoloring(precoloring, nodes_per_cycle)
-                if not is_decomposed:
-                    graph.possible_precolorings.append(precoloring.copy())
+# Returns the inputs of find_possible_precolorings for all graphs of the given subfolders, one subfolder after the other. The graphs of a subfolder are only read,
+# when its first input is requested. The graphs are read as CompactGraphs, which the propagation works on.
+def generate_precoloring_inputs(subfolders):
+    for subfolder_position, (subfolder, connecting_edges) in enumerate(subfolders):
+        graph_list = gio.read_graph_files(subfolder, compact=True)
+        if not graph_list:
+            yield subfolder_position, 0, None
+        for graph in graph_list:
+            yield subfolder_position, len(graph_list), graph
 
-            if len(graph.possible_precolorings) > 0:
-                cycle_number = len(graph.nodes()) // nodes_per_cycle
-                edges = str(graph.edge_numbers[0])
-                for edge_number in graph.edge_numbers[1:]:
-                    edges += '_' + str(edge_number)
-                path_name = 'results/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's_with_precoloring/' + str(
-                    edges) + '_connecting_edges/' + graph.name + '.pkl'
-                graph.save_to_pickle(path_name)
+
+# Runs through the list of connections between k C5s. For each graph all proper precolorings of the first k-1 C5s are determined. For each precoloring it is checked, if it does not decompose the graph, then it is saved in the graph instance. Each graph that hasss at least one precoloring that does not decompose the graph, is saved in the results folder.
+# The graphs are handled by max_workers workers (all cores by default), see find_possible_precolorings. The results come back in the order of the graphs and every subfolder
+# is saved as soon as all its graphs are back, so the saved graphs are the same as in a serial run.
+# Every finished subfolder is recorded in a journal, with resume the subfolders that were finished by an earlier run with the same code and inputs are skipped,
+# see pipeline.get_stage_fingerprint.
+# With a shard (i, N), only the subfolders of the shard are handled and saved below the results folder of the shard, see sharding.py.
+# With strict, the precolorings that cannot be extended to the last cycle or force a color of it are dropped too, although the propagation alone does not reject them,
+# see list_coloring.is_decomposed_strictly. The dropped precolorings and graphs are counted in the metrics.
+# For k > 3, the propagated states of the first k-1 cycles are shared by all graphs with the same prefix of graph_numbers through a cache with cache_size entries in every
+# worker, see propagation.PropagationCache. Its hits, misses and evictions are added to the metrics. With cache_size 0, every graph is propagated on its own.
+@metrics.stage_report
+def find_possible_precolored_graphs(k, nodes_per_cycle, resume=True, shard=None, strict=False, cache_size=propagation.PROPAGATION_CACHE_SIZE, max_workers=None):
+    subfolders = gio.get_subfolders_with_suffix('results/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's', '_connecting_edges')
+    results_root = sharding.get_results_root(shard)
+    progress_journal = journal.ProgressJournal(results_root + '/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's_with_precoloring/progress.journal')
+    header = {'stage': 'find_possible_precolored_graphs', 'k': k, 'nodes_per_cycle': nodes_per_cycle, 'subfolders': sorted(connecting_edges for (subfolder, connecting_edges) in subfolders)}
+    if shard is not None:
+        header['shard'] = list(shard)
+    if strict:
+        header['strict'] = True
+    header['fingerprint'] = pipeline.get_stage_fingerprint('find_possible_precolored_graphs', k, nodes_per_cycle, strict)
+    finished_subfolders = {record['subfolder'] for record in progress_journal.start(header, resume) if 'subfolder' in record}
+    pending_subfolders = [(subfolder, connecting_edges) for (subfolder, connecting_edges) in subfolders
+                          if connecting_edges not in finished_subfolders and sharding.is_subfolder_in_shard(connecting_edges, shard)]
+    progress = metrics.ProgressReporter('Precoloring step ' + str(k), len(pending_subfolders))
+    graph_count = sum(gio.count_graph_files(subfolder) for (subfolder, connecting_edges) in pending_subfolders)
+
+    # The precolored graphs of the subfolder, whose results are coming back
+    collected = {'graphs': [], 'count': 0}
+
+    def collect(result):
+        (subfolder_position, subfolder_graph_count, graph) = result
+        collected['count'] += 1
+        if graph is not None:
+            collected['graphs'].append(graph)
+        if collected['count'] < max(subfolder_graph_count, 1):
+            return
+
+        connecting_edges = pending_subfolders[subfolder_position][1]
+        path_name = results_root + '/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's_with_precoloring/' + str(connecting_edges) + '_connecting_edges'
+        gio.save_graphs_in_directory(collected['graphs'], path_name, fsync=True)
+        progress_journal.append({'subfolder': connecting_edges})
+        progress.update()
+        collected['graphs'] = []
+        collected['count'] = 0
+
+    scheduler.run_scheduled(find_possible_precolorings, generate_precoloring_inputs(pending_subfolders), (k, nodes_per_cycle, strict, cache_size), collect, max_workers,
+                            total=graph_count)
+
+
+# Keeps one representative of every set of isomorphic graphs of one subfolder with precolorings, see find_possible_precolored_graphs_unique_by_automorphisms,
+# and saves the representatives. Every subfolder is saved to its own folder, so the subfolders can be handled by different workers.
+def find_unique_precolored_graphs(method_input):
+    (subfolder, nodes_per_cycle) = method_input
+    graph_list = gio.read_graph_files(subfolder, compact=True)
+
+    start = time.perf_counter()
+    unique_graphs = gu.filter_isomorphisms_by_canonical_form(graph_list)
+    metrics.add_time('canonical_form', time.perf_counter() - start)
+    metrics.count('candidates', len(graph_list))
+    metrics.count('rejected_by_isomorphism', len(graph_list) - len(unique_graphs))
+    if len(unique_graphs) > 0:
+        graph = unique_graphs[0]
+
+        cycle_number = len(graph.nodes()) // nodes_per_cycle
+        edges = str(graph.edge_numbers[0])
+        for edge_number in graph.edge_numbers[1:]:
+            edges += '_' + str(edge_number)
+        path_name = 'results/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's_with_precoloring_unique_by_automorphisms/' + str(
+            edges) + '_connecting_edges'
+
+        gio.save_graphs_in_directory(unique_graphs, path_name)
 
 
 # Runs through the list of connections between k C5s that are equipped with a precoloring. Only saves one representative for each set of graphs, in which every graph is isomorphic to each other with an isomorphism that sends each C5 onto itself.
-def find_possible_precolored_graphs_unique_by_automorphisms(k, nodes_per_cycle):
+# Every subfolder is handled by one of max_workers workers (all cores by default).
+@metrics.stage_report
+def find_possible_precolored_graphs_unique_by_automorphisms(k, nodes_per_cycle, max_workers=None):
     subfolders = gio.get_subfolders_with_suffix('results/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's_with_precoloring', '_connecting_edges')
-    for (subfolder, connecting_edges) in subfolders:
-        graph_list = gio.read_graph_files(subfolder)
-
-        unique_graphs = gu.filter_isomorphisms_with_cycle_to_cycle_mapping(graph_list)
-        if len(unique_graphs) > 0:
-            graph = unique_graphs[0]
-
-            cycle_number = len(graph.nodes()) // nodes_per_cycle
-            edges = str(graph.edge_numbers[0])
-            for edge_number in graph.edge_numbers[1:]:
-                edges += '_' + str(edge_number)
-            path_name = 'results/c' + str(nodes_per_cycle) + 's/' + str(cycle_number) + '_c' + str(nodes_per_cycle) + 's_with_precoloring_unique_by_automorphisms/' + str(
-                edges) + '_connecting_edges'
-            path_name_plots = path_name + '_plots'
+    scheduler.run_scheduled(find_unique_precolored_graphs, ((subfolder,) for (subfolder, connecting_edges) in subfolders), (nodes_per_cycle,), max_workers=max_workers,
+                            total=len(subfolders))
+
+
+# Returns the candidates of the two-cycle stage with edge_number connecting edges, i.e. the two cycles combined with every set of edge_number possible edges, before any
+# forbidden subgraph is searched. For C5s, only the edge sets that satisfy the incidence constraints are candidates, see gu.is_possible_edge_subset.
+def generate_two_cycle_candidates(nodes_per_cycle, edge_number):
+    g1, g2 = generate_2_cycles(nodes_per_cycle)
+    possible_edges = list(itertools.product(g1.nodes(), g2.nodes()))
+    two_cycles = nx.compose(g1, g2)
+    edgesets = (edge_indices for edge_indices in itertools.combinations(range(len(possible_edges)), edge_number)
+                if nodes_per_cycle != 5 or gu.is_possible_edge_subset(two_cycles, [possible_edges[e] for e in edge_indices]))
+    return gu.compose_compact_graphs(g1, g2, edgesets)
+
+
+# Returns the candidates of start_execution(3, nodes_per_cycle), i.e. every graph that find_possible_connections combines from its inputs, before any forbidden subgraph is searched.
+# connections_2_cycles are the graphs with two cycles and unique_connections_2_cycles their representatives, as returned by gu.get_connections_last_iteration and
+# gu.get_unique_connections_last_iteration for k = 3.
+def generate_three_cycle_candidates(nodes_per_cycle, connections_2_cycles, unique_connections_2_cycles):
+    index = gu.index_connections_last_iteration(connections_2_cycles, 3)
+    for (graph_1, graph_2) in gu.generate_execution_inputs(3, unique_connections_2_cycles, index):
+        for connecting_edges_3, graphs_3 in connections_2_cycles.items():
+            if int(graph_1.edge_numbers[0]) <= int(connecting_edges_3):
+                for graph_3 in graphs_3:
+                    yield gu.combine_compact_graph_from_last_iteration(graph_1, graph_2, graph_3, nodes_per_cycle)
+
+
+# Cross-checks the bitmask engine of has_induced_p6 against the VF2 engine on every candidate of the two-cycle stage and of start_execution(3, nodes_per_cycle), before the
+# candidates are filtered. So a P6 that the bitmask engine finds wrongly, which would drop a valid graph, is caught as well as a P6 that it misses.
+# The candidates with three cycles are combined from the graphs with two cycles in the results folder. Returns the candidates for which the engines disagree.
+def cross_check_p6_engines(nodes_per_cycle):
+    if nodes_per_cycle == 3:
+        edge_numbers = range(1, 4)
+    else:
+        edge_numbers = range(5, 11)
 
-            gio.save_graphs_in_directory(unique_graphs, path_name)
+    mismatches = []
+    for edge_number in edge_numbers:
+        mismatches.extend(gu.find_p6_engine_mismatches(generate_two_cycle_candidates(nodes_per_cycle, edge_number)))
+    three_cycle_candidates = generate_three_cycle_candidates(nodes_per_cycle, gu.get_connections_last_iteration(3, nodes_per_cycle),
+                                                             gu.get_unique_connections_last_iteration(3, nodes_per_cycle))
+    mismatches.extend(gu.find_p6_engine_mismatches(three_cycle_candidates))
+    return mismatches
 
 
 # Returns a list of all graphs that consist of 3 C5s, where precoloring the first 2 C5s while applying the coloring restriction
@@ -281,6 +493,7 @@ def group_c5_graphs_by_connections_last_green_node():
     return groups_connections_to_u, groups_connections_to_v
 
 
+# The stages below can also be run with pipeline.py, which only runs the stages whose inputs or code changed, e.g. python pipeline.py 5 4
 if __name__ == "__main__":
     # graphs consisting of disjoint triangles
     # find_connections_2_c3s()
@@ -312,6 +525,8 @@ if __name__ == "__main__":
     # find_possible_precolored_graphs(4, 5)
     # find_possible_precolored_graphs_unique_by_automorphisms(4, 5)
     #
+    # print('Number of candidates with 2 and 3 C5s, for which the P6 engines disagree: ' + str(len(cross_check_p6_engines(5))))
+    #
     # print('Number of graphs with 3 C5s, for which we can find a proper precoloring of G1 and G2, where color 3 appears twice in V(G1): ' + str(len(get_c5_graphs_where_color_3_appears_once_in_v())))
     #
     # print("Number of graphs with 4 c5s, for which there are more than one precoloring that doesn't decompose G4: " + str(len(get_c5_graphs_with_multiple_precolorings(4))))
@@ -0,0 +1,156 @@
+import collections
+import datetime
+import functools
+import json
+import os
+import sys
+import time
+
+# The reports of the stages are written to this folder, one JSON file per stage
+REPORT_DIRECTORY = 'results/metrics'
+
+# Metrics of the current process since the last reset or take: counters, e.g. the number of candidates and of the candidates rejected for each reason,
+# the seconds spent in each timed step and for every worker process the number of items it handled, the seconds it spent on them, its peak RSS and the values of record_worker_peaks
+counters = collections.Counter()
+timers = collections.Counter()
+workers = {}
+
+
+# Returns the peak resident set size of the current process in MB
+def get_peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # On Windows there is no resource module, but psutil reports the peak working set
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak_rss / 2 ** 20
+    return peak_rss / 2 ** 10
+
+
+def count(name, amount=1):
+    counters[name] += amount
+
+
+def add_time(name, seconds):
+    timers[name] += seconds
+
+
+# Returns the metrics of the current process as a worker
+def get_worker():
+    return workers.setdefault(str(os.getpid()), {'items': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0})
+
+
+# Records that the current process handled a number of items in the given seconds
+def record_worker(items, seconds):
+    worker = get_worker()
+    worker['items'] += items
+    worker['seconds'] += seconds
+    worker['peak_rss_mb'] = get_peak_rss_mb()
+
+
+# Records the largest value, that each of the given values reached in the current process, e.g. the number of entries of a cache that is kept by the worker
+def record_worker_peaks(values):
+    worker = get_worker()
+    for name, value in values.items():
+        worker[name] = max(worker.get(name, 0), value)
+
+
+def reset():
+    counters.clear()
+    timers.clear()
+    workers.clear()
+
+
+# Returns the metrics of the current process and resets them, e.g. to send the metrics of a worker to the main process, which merges them
+def take():
+    snapshot = {'counters': dict(counters), 'timers': dict(timers), 'workers': {pid: dict(worker) for pid, worker in workers.items()}}
+    reset()
+    return snapshot
+
+
+# Adds the metrics of another process, that were returned by take, to the metrics of the current process
+def merge(snapshot):
+    counters.update(snapshot['counters'])
+    timers.update(snapshot['timers'])
+    for pid, worker in snapshot['workers'].items():
+        merged_worker = workers.setdefault(pid, {'items': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0})
+        for name, value in worker.items():
+            if name in ('items', 'seconds'):
+                merged_worker[name] += value
+            else:
+                # The peak RSS and the values of record_worker_peaks
+                merged_worker[name] = max(merged_worker.get(name, 0), value)
+
+
+# Returns the report of a stage, that ran for the given seconds, from the metrics of the current process
+def get_report(stage, seconds):
+    report_workers = {}
+    for pid, worker in sorted(workers.items()):
+        report_workers[pid] = dict(worker, items_per_second=worker['items'] / worker['seconds'] if worker['seconds'] > 0 else None)
+    return {'stage': stage, 'seconds': seconds, 'counters': dict(sorted(counters.items())), 'timers': dict(sorted(timers.items())), 'workers': report_workers,
+            'peak_rss_mb': max([get_peak_rss_mb()] + [worker['peak_rss_mb'] for worker in workers.values()])}
+
+
+def write_report(report, directory=REPORT_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    with open(directory + '/' + report['stage'] + '.json', 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+# Returns the counters of a report as one line, e.g. 'candidates: 1200, rejected_by_p6: 800'
+def format_counters(report):
+    return ', '.join(name + ': ' + str(value) for name, value in report['counters'].items())
+
+
+# Decorator for the stages of main. The metrics are reset when the stage starts, and when it ends, the metrics of the stage and its workers are written to a report
+# in REPORT_DIRECTORY, named after the stage and its positional arguments, e.g. start_execution_4_5.json.
+def stage_report(method):
+    @functools.wraps(method)
+    def run_stage(*args, **kwargs):
+        stage = '_'.join([method.__name__] + [str(argument) for argument in args])
+        if kwargs.get('shard') is not None:
+            stage += '_shard_' + str(kwargs['shard'][0]) + '_of_' + str(kwargs['shard'][1])
+
+        reset()
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        report = get_report(stage, time.perf_counter() - start)
+        write_report(report)
+        print(stage + ' took ' + str(round(report['seconds'], 1)) + ' s, peak RSS ' + str(round(report['peak_rss_mb'], 1)) + ' MB. ' + format_counters(report))
+        return result
+
+    return run_stage
+
+
+# Prints the progress of a stage with a known number of items and the estimated remaining time, at most every interval_seconds seconds
+class ProgressReporter:
+
+    def __init__(self, label, total, items_done=0, interval_seconds=30):
+        self.label = label
+        self.total = total
+        self.items_done = items_done
+        self.first_items_done = items_done
+        self.interval_seconds = interval_seconds
+        self.start_time = time.monotonic()
+        self.last_report_time = self.start_time
+
+    def update(self, amount=1):
+        self.items_done += amount
+        now = time.monotonic()
+        if now - self.last_report_time >= self.interval_seconds or self.items_done == self.total:
+            self.last_report_time = now
+            print(self.format_progress(now), flush=True)
+
+    def format_progress(self, now):
+        rate = (self.items_done - self.first_items_done) / max(now - self.start_time, 1e-9)
+        line = self.label + ': ' + str(self.items_done) + '/' + str(self.total)
+        if self.total:
+            line += ' (' + str(round(100 * self.items_done / self.total, 1)) + '%)'
+        line += ', ' + str(round(rate, 1)) + ' items/s'
+        if rate > 0:
+            line += ', ETA ' + str(datetime.timedelta(seconds=round((self.total - self.items_done) / rate)))
+        return line
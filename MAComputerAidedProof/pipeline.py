@@ -0,0 +1,237 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+
+import graph_store
+
+# The cache records the fingerprint of every stage that finished and a digest of its outputs, see run_pipeline
+CACHE_FILE = 'results/pipeline_cache.json'
+
+# Folder of the modules of the stages, the code version is computed from their source files wherever the pipeline is run from
+MODULE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Files in the output directories, that are not part of the results of a stage
+IGNORED_FILES = ('progress.journal', 'progress.journal.tmp', graph_store.LOCK_FILE)
+
+
+# A stage of the pipeline, i.e. a call of a method of main with fixed arguments. It reads the outputs of its input stages and writes the graphs in its output directories.
+class Stage:
+
+    def __init__(self, name, method_name, arguments, inputs, outputs, keyword_arguments=None):
+        self.name = name
+        self.method_name = method_name
+        self.arguments = arguments
+        self.keyword_arguments = keyword_arguments or {}
+        self.inputs = inputs
+        self.outputs = outputs
+
+    # Runs the stage, options only contains the keyword arguments that the method accepts
+    def run(self, options):
+        import main
+        getattr(main, self.method_name)(*self.arguments, **self.keyword_arguments, **options)
+
+
+def get_level_directory(nodes_per_cycle, k, suffix=''):
+    return 'results/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's' + suffix
+
+
+# Returns the stages for all graphs with up to k_max cycles of the given length, in an order in which every stage comes after its inputs:
+# the connections between two cycles, the automorphism filter and for every k from 3 to k_max start_execution, the precoloring and the filter of unique precolored graphs.
+# With strict, the precoloring stages run in the strict mode of main.find_possible_precolored_graphs.
+def get_stages(nodes_per_cycle, k_max, strict=False):
+    prefix = 'c' + str(nodes_per_cycle) + 's/'
+    two_cycles = Stage(prefix + 'two_cycles', 'find_connections_2_c' + str(nodes_per_cycle) + 's', (), [], [get_level_directory(nodes_per_cycle, 2)])
+    automorphisms = Stage(prefix + 'automorphisms', 'find_connections_2_c' + str(nodes_per_cycle) + 's_with_filtered_automorphisms', (), [two_cycles.name],
+                          [get_level_directory(nodes_per_cycle, 2, '_unique_by_automorphisms')])
+    stages = [two_cycles, automorphisms]
+
+    for k in range(3, k_max + 1):
+        if k == 3:
+            inputs = [two_cycles.name, automorphisms.name]
+        else:
+            inputs = [two_cycles.name, prefix + 'precoloring_' + str(k - 1), prefix + 'unique_' + str(k - 1)]
+        stages.append(Stage(prefix + 'start_execution_' + str(k), 'start_execution', (k, nodes_per_cycle), inputs, [get_level_directory(nodes_per_cycle, k)]))
+        stages.append(Stage(prefix + 'precoloring_' + str(k), 'find_possible_precolored_graphs', (k, nodes_per_cycle), [prefix + 'start_execution_' + str(k)],
+                            [get_level_directory(nodes_per_cycle, k, '_with_precoloring')], {'strict': True} if strict else None))
+        stages.append(Stage(prefix + 'unique_' + str(k), 'find_possible_precolored_graphs_unique_by_automorphisms', (k, nodes_per_cycle), [prefix + 'precoloring_' + str(k)],
+                            [get_level_directory(nodes_per_cycle, k, '_with_precoloring_unique_by_automorphisms')]))
+
+    return stages
+
+
+# Returns the names of the modules of this folder, that are imported by the given module, directly or through other modules of this folder
+def get_imported_modules(module_name, directory=MODULE_DIRECTORY):
+    modules = set()
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        file_path = os.path.join(directory, name + '.py')
+        if name in modules or not os.path.exists(file_path):
+            continue
+        modules.add(name)
+        with open(file_path, 'rb') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                pending.append(node.module)
+    return modules
+
+
+# Returns a digest of the source code of main and of every module it imports, so changing the code of any stage invalidates the cached stages
+def get_code_version(directory=MODULE_DIRECTORY):
+    digest = hashlib.sha256()
+    for name in sorted(get_imported_modules('main', directory)):
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(os.path.join(directory, name + '.py'), 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+# Returns the SHA-256 of the contents of a file. If file_digests holds the digest of the file with its current size and modification time, the file is not read again.
+# The entry of the file in file_digests is updated, so it can be reused by the next call.
+def get_file_digest(file_path, file_digests):
+    stat = os.stat(file_path)
+    cached = file_digests.get(file_path)
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+    file_digests[file_path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return file_digests[file_path][2]
+
+
+# Returns a digest of the contents of the output directories of a stage. The plots, journals and locks are left out, since they do not change the results.
+# The digests of the single files are kept in file_digests, see get_file_digest, so only the files that changed since the last call are read. The entries of the files,
+# that do not exist anymore, are removed from file_digests.
+def get_output_digest(directories, file_digests=None):
+    if file_digests is None:
+        file_digests = {}
+    digest = hashlib.sha256()
+    file_paths = set()
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.endswith('_plots'))
+            for file_name in sorted(files):
+                if file_name in IGNORED_FILES:
+                    continue
+                file_path = os.path.join(root, file_name)
+                file_paths.add(file_path)
+                digest.update(os.path.relpath(file_path, directory).replace(os.sep, '/').encode('utf-8') + b'\0')
+                digest.update(get_file_digest(file_path, file_digests).encode('utf-8') + b'\0')
+    for file_path in set(file_digests) - file_paths:
+        del file_digests[file_path]
+    return digest.hexdigest()
+
+
+# Returns the fingerprint of a stage, i.e. a digest of its method, its arguments, the code version and the outputs of its input stages
+def get_fingerprint(stage, code_version, output_digests):
+    description = {'method': stage.method_name, 'arguments': list(stage.arguments), 'keyword_arguments': stage.keyword_arguments, 'code_version': code_version,
+                   'inputs': {name: output_digests[name] for name in stage.inputs}}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Returns the fingerprint of the stage of get_stages, that calls the given method of main with the arguments (k, nodes_per_cycle), from the current outputs of its input stages.
+# The stages write it to their progress journals, so a run is only resumed with the same code and the same inputs, also when the stage is called outside of the pipeline.
+# The digests of the output files, that the pipeline cache holds, are reused, see get_output_digest.
+def get_stage_fingerprint(method_name, k, nodes_per_cycle, strict=False):
+    stages = {stage.name: stage for stage in get_stages(nodes_per_cycle, k, strict)}
+    stage = next(stage for stage in stages.values() if stage.method_name == method_name and stage.arguments == (k, nodes_per_cycle))
+    cache = read_cache()
+    output_digests = {name: get_output_digest(stages[name].outputs, cache.get(name, {}).get('file_digests', {})) for name in stage.inputs}
+    return get_fingerprint(stage, get_code_version(), output_digests)
+
+
+def read_cache(file_path=CACHE_FILE):
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path) as f:
+        return json.load(f)
+
+
+# Writes the cache to a temporary file first and renames it, so an interrupted write never leaves a broken cache behind
+def write_cache(cache, file_path=CACHE_FILE):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temporary_path = file_path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(temporary_path, file_path)
+
+
+# Runs all stages, whose outputs are not up to date. A stage is up to date, if the cache holds the same fingerprint for it and its outputs still have the digest that was
+# recorded when it finished. The digests of the output files are recorded as well, so the outputs are only read again, if their size or modification time changed.
+# The stages are fingerprinted with the code version of MODULE_DIRECTORY, the outputs are read relative to the current folder. The fingerprint depends on the digests of the outputs of the input stages, so a stage that reruns only invalidates the stages after it
+# if its outputs actually changed.
+# A stage, that was started with the same fingerprint but did not finish, is resumed from its progress journal. Otherwise start_execution and the precoloring start over.
+# With dry_run, the stages are only listed with their state. The stages in force are run even if they are up to date.
+def run_pipeline(stages, max_workers=None, force=(), dry_run=False):
+    cache = read_cache()
+    code_version = get_code_version()
+    output_digests = {}
+
+    for stage in stages:
+        fingerprint = get_fingerprint(stage, code_version, output_digests)
+        entry = cache.get(stage.name, {})
+        file_digests = entry.get('file_digests', {})
+        output_digest = get_output_digest(stage.outputs, file_digests)
+        if entry.get('fingerprint') == fingerprint and entry.get('output_digest') == output_digest and stage.name not in force:
+            print('Up to date: ' + stage.name)
+            output_digests[stage.name] = output_digest
+            entry['file_digests'] = file_digests
+            continue
+        if dry_run:
+            print('Would run: ' + stage.name)
+            # The stages after it cannot be fingerprinted before it ran, they are listed as if they had to run too
+            output_digests[stage.name] = None
+            continue
+
+        print('Running: ' + stage.name)
+        options = {}
+        if stage.method_name in ('start_execution', 'find_possible_precolored_graphs'):
+            options['resume'] = entry.get('started') == fingerprint
+        if stage.method_name in ('start_execution', 'find_possible_precolored_graphs', 'find_possible_precolored_graphs_unique_by_automorphisms', 'find_connections_2_c3s',
+                                 'find_connections_2_c5s') and max_workers is not None:
+            options['max_workers'] = max_workers
+
+        cache[stage.name] = {'started': fingerprint}
+        write_cache(cache)
+        stage.run(options)
+
+        output_digests[stage.name] = get_output_digest(stage.outputs, file_digests)
+        cache[stage.name] = {'fingerprint': fingerprint, 'output_digest': output_digests[stage.name], 'file_digests': file_digests}
+        write_cache(cache)
+
+    if not dry_run:
+        # The digests of output files, that were touched without changing the results, are recorded for the next run
+        write_cache(cache)
+
+
+# Runs the pipeline for graphs consisting of cycles of the given length up to k cycles, e.g.
+#   python pipeline.py 5 4
+#   python pipeline.py 3 6 --max-workers 8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs all stages up to k cycles, that are not up to date')
+    parser.add_argument('nodes_per_cycle', type=int, choices=[3, 5])
+    parser.add_argument('k', type=int, help='number of cycles of the last step')
+    parser.add_argument('--max-workers', type=int)
+    parser.add_argument('--plots', action='store_true', help='render the plots of the graphs that are unique by automorphisms after the last stage')
+    parser.add_argument('--force', nargs='*', metavar='STAGE', help='stages to run even if they are up to date, all stages if none are given')
+    parser.add_argument('--dry-run', action='store_true', help='only list the stages that would run')
+    parser.add_argument('--strict', action='store_true', help='also drop the precolorings that cannot be extended to the last cycle or force a color of it')
+    arguments = parser.parse_args()
+
+    pipeline_stages = get_stages(arguments.nodes_per_cycle, arguments.k, arguments.strict)
+    forced_stages = []
+    if arguments.force is not None:
+        forced_stages = arguments.force or [stage.name for stage in pipeline_stages]
+    run_pipeline(pipeline_stages, arguments.max_workers, forced_stages, arguments.dry_run)
+    # Plotting is not part of the fingerprinted stages, it skips the plots that are up to date on its own
+    if arguments.plots and not arguments.dry_run:
+        import plotting
+        plotting.render_plots('results/c' + str(arguments.nodes_per_cycle) + 's', only_representatives=True, max_workers=arguments.max_workers)
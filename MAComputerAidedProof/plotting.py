@@ -0,0 +1,85 @@
+import argparse
+import os
+
+import graph_store
+import scheduler
+
+# Graph stores, that were opened by render_plot in this process
+open_stores = {}
+
+
+# Returns the file of the plot of a graph from the store in the given directory, the plots of a directory are saved next to it in directory + '_plots'
+def get_plot_path(directory, graph_name):
+    return directory + '_plots/' + graph_name + '.png'
+
+
+# Determines whether the plot exists and was saved after the last change of the graph store
+def is_plot_up_to_date(plot_path, directory):
+    if not os.path.exists(plot_path):
+        return False
+    return os.path.getmtime(plot_path) >= os.path.getmtime(os.path.join(directory, graph_store.INDEX_FILE))
+
+
+# Returns all directories below root, that contain a graph store, in sorted order. With only_representatives, only the directories of the graphs that are unique by
+# automorphisms are returned.
+def get_store_directories(root, only_representatives=False):
+    directories = []
+    for directory, subfolders, files in os.walk(root):
+        subfolders[:] = sorted(subfolder for subfolder in subfolders if not subfolder.endswith('_plots'))
+        if graph_store.store_exists(directory) and (not only_representatives or '_unique_by_automorphisms' in directory):
+            directories.append(directory.replace(os.sep, '/'))
+    return directories
+
+
+# Returns the plots that have to be rendered, as tuples of the store directory, the index of the graph in the store and the file of the plot.
+# Only the first first_n graphs of every store are plotted, if first_n is given. Without force, plots that are up to date are skipped.
+def get_plot_tasks(root, only_representatives=False, first_n=None, force=False):
+    tasks = []
+    for directory in get_store_directories(root, only_representatives):
+        store = graph_store.GraphStore(directory)
+        count = len(store) if first_n is None else min(first_n, len(store))
+        for i in range(count):
+            plot_path = get_plot_path(directory, store.read_compact(i).name)
+            if force or not is_plot_up_to_date(plot_path, directory):
+                tasks.append((directory, i, plot_path))
+        store.close()
+    return tasks
+
+
+# Renders the plot of one graph with its first precoloring. The graph is read from the store in the worker, so only its position has to be sent to the worker.
+def render_plot(plot_input):
+    (directory, i, plot_path) = plot_input
+    if not open_stores:
+        # Plots are only saved to files, so no interactive backend is needed
+        import matplotlib
+        matplotlib.use('Agg')
+    if directory not in open_stores:
+        open_stores[directory] = graph_store.GraphStore(directory)
+
+    graph = open_stores[directory].read_graph(i)
+    if not graph.possible_precolorings:
+        graph.draw_and_save(plot_path, {})
+    else:
+        graph.draw_and_save(plot_path, graph.possible_precolorings[0])
+
+
+# Renders the plots of all graphs in the graph stores below root with max_workers workers (all cores by default), see get_plot_tasks. Returns the number of rendered plots.
+def render_plots(root='results', only_representatives=False, first_n=None, force=False, max_workers=None):
+    tasks = get_plot_tasks(root, only_representatives, first_n, force)
+    scheduler.run_scheduled(render_plot, tasks, max_workers=max_workers, total=len(tasks))
+    return len(tasks)
+
+
+# Renders the plots of the results after the computation, e.g.
+#   python plotting.py results/c5s/3_c5s_with_precoloring_unique_by_automorphisms --first 10
+#   python plotting.py results --representatives
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Renders the plots of the graphs in the graph stores below a folder, that are not up to date')
+    parser.add_argument('root', nargs='?', default='results')
+    parser.add_argument('--representatives', action='store_true', help='only plot the graphs that are unique by automorphisms')
+    parser.add_argument('--first', type=int, help='only plot the first graphs of every graph store')
+    parser.add_argument('--force', action='store_true', help='also render the plots that are up to date')
+    parser.add_argument('--max-workers', type=int)
+    arguments = parser.parse_args()
+
+    print('Rendered ' + str(render_plots(arguments.root, arguments.representatives, arguments.first, arguments.force, arguments.max_workers)) + ' plots')
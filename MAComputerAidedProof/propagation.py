@@ -0,0 +1,283 @@
+import collections
+
+import compact_graph
+import list_coloring
+import metrics
+
+ALL_COLORS = 7
+
+# Default number of entries of a PropagationCache
+PROPAGATION_CACHE_SIZE = 4096
+
+
+# Returns the bitmask of a color, color c is represented by the bit 1 << (c - 1)
+def color_bit(color):
+    return 1 << (color - 1)
+
+
+# Returns the sorted list of colors contained in a bitmask domain
+def colors_of_domain(domain):
+    return [color for color in (1, 2, 3) if domain >> (color - 1) & 1]
+
+
+# Color lists of all nodes of a graph, stored as one 3-bit mask per node index. Precoloring a node removes its color from the domains of its neighbors, and every node whose
+# domain shrinks to a single color is propagated in the same way, using a worklist instead of recursion.
+# Every change of a domain is recorded on the trail, so a state can be saved with mark and restored with undo, which only costs the changes made since the mark.
+class ColorDomains:
+    __slots__ = ('graph', 'domains', 'trail', 'failed')
+
+    def __init__(self, graph, color_lists=None):
+        self.graph = graph.to_compact()
+        if color_lists is None:
+            self.domains = [ALL_COLORS] * self.graph.number_of_nodes()
+        else:
+            self.domains = [0] * self.graph.number_of_nodes()
+            for node, colors in color_lists.items():
+                for color in colors:
+                    self.domains[self.graph.index[node]] |= color_bit(color)
+        self.trail = []
+        self.failed = False
+
+    # Removes a color from the domain of a node without propagating it, e.g. to apply a color restriction before precoloring
+    def remove_color(self, node, color):
+        i = self.graph.index[node]
+        bit = color_bit(color)
+        if self.domains[i] & bit:
+            self.trail.append((i, self.domains[i]))
+            self.domains[i] &= ~bit
+            if self.domains[i] == 0:
+                self.failed = True
+        return not self.failed
+
+    # Restricts the domain of the node to the given color and propagates the change. Returns False, if the color is not possible anymore or some domain becomes empty.
+    def assign(self, node, color):
+        if self.failed:
+            return False
+
+        i = self.graph.index[node]
+        bit = color_bit(color)
+        domains = self.domains
+        if not domains[i] & bit:
+            self.failed = True
+            return False
+        if domains[i] != bit:
+            self.trail.append((i, domains[i]))
+            domains[i] = bit
+
+        return self.propagate([i])
+
+    # Applies all colors of a precoloring one after the other and returns False, as soon as one of them fails
+    def assign_all(self, precoloring):
+        for node, color in precoloring.items():
+            if not self.assign(node, color):
+                return False
+        return True
+
+    # Removes the color of every node in the worklist from the domains of its neighbors, until the worklist is empty
+    def propagate(self, worklist):
+        domains = self.domains
+        adjacency = self.graph.adjacency
+        trail = self.trail
+        while worklist:
+            i = worklist.pop()
+            bit = domains[i]
+            neighbors = adjacency[i]
+            while neighbors:
+                lowest_bit = neighbors & -neighbors
+                neighbors ^= lowest_bit
+                j = lowest_bit.bit_length() - 1
+                domain = domains[j]
+                if domain & bit:
+                    trail.append((j, domain))
+                    domain &= ~bit
+                    domains[j] = domain
+                    if domain == 0:
+                        self.failed = True
+                        return False
+                    if domain & (domain - 1) == 0:
+                        worklist.append(j)
+        return True
+
+    # Replaces all domains, e.g. by a state that was propagated before, and starts a new trail
+    def set_domains(self, domains):
+        self.domains = domains
+        self.trail = []
+        self.failed = False
+
+    # Returns the current position of the trail, that can be passed to undo
+    def mark(self):
+        return len(self.trail)
+
+    # Restores all domains to the state at the given mark
+    def undo(self, mark):
+        domains = self.domains
+        trail = self.trail
+        while len(trail) > mark:
+            (i, domain) = trail.pop()
+            domains[i] = domain
+        self.failed = False
+
+    # Returns the number of nodes with exactly one color left
+    def number_of_colored_nodes(self):
+        return sum(1 for domain in self.domains if domain & (domain - 1) == 0)
+
+    # Returns the domains in the color list format of graph_coloring, i.e. a dictionary of sorted color lists, that is empty if the propagation failed
+    def to_color_lists(self):
+        if self.failed:
+            return {}
+        return {node: colors_of_domain(domain) for node, domain in zip(self.graph.names, self.domains)}
+
+
+# Determines whether the current state decomposes the graph in the sense of CustomGraph.decomposed_by_precoloring, i.e. the propagation failed, no node is colored
+# or more nodes than the ones outside of the last cycle are colored
+def is_decomposed(domains, nodes_per_cycle):
+    if domains.failed:
+        return True
+    coloring_size = domains.number_of_colored_nodes()
+    return coloring_size == 0 or coloring_size > len(domains.domains) - nodes_per_cycle
+
+
+# Determines whether the current state, that is_decomposed does not reject, is rejected by list_coloring.is_decomposed_strictly. The reason is counted in the metrics.
+def is_pruned_strictly(domains):
+    reason = list_coloring.is_decomposed_strictly(domains)
+    if reason is None:
+        return False
+    metrics.count('pruned_' + reason)
+    return True
+
+
+# Returns all combinations of the precoloring with one of the colorings of the added cycle, that do not decompose the graph, in the order of added_colorings.
+# The precoloring is propagated only once and every coloring of the added cycle is propagated from that state and undone afterwards. Since propagating more colors can only
+# color more nodes, all combinations are dropped at once, if the precoloring on its own already fails or colors more nodes than the graph has outside of one cycle,
+# which is the count bound of is_decomposed.
+# With strict, the combinations are also dropped, if they cannot be extended to the last cycle or force a color of it, see list_coloring.is_decomposed_strictly.
+def surviving_extensions(domains, precoloring, added_colorings, nodes_per_cycle, strict=False):
+    start = domains.mark()
+    extensions = []
+    if domains.assign_all(precoloring) and domains.number_of_colored_nodes() <= len(domains.domains) - nodes_per_cycle:
+        prefix = domains.mark()
+        for added_coloring in added_colorings:
+            if domains.assign_all(added_coloring) and not is_decomposed(domains, nodes_per_cycle) and not (strict and is_pruned_strictly(domains)):
+                extensions.append(precoloring | added_coloring)
+            domains.undo(prefix)
+    domains.undo(start)
+    return extensions
+
+
+# Returns the precolorings, that list_coloring.is_decomposed_strictly does not reject, from precolorings that do not decompose the graph
+def strictly_surviving_precolorings(domains, precolorings):
+    survivors = []
+    for precoloring in precolorings:
+        start = domains.mark()
+        domains.assign_all(precoloring)
+        if not is_pruned_strictly(domains):
+            survivors.append(precoloring)
+        domains.undo(start)
+    return survivors
+
+
+# Returns the subgraph of a CompactGraph on its first node_count nodes
+def get_leading_subgraph(graph, node_count):
+    mask = (1 << node_count) - 1
+    return compact_graph.CompactGraph(graph.names[:node_count], [adjacency & mask for adjacency in graph.adjacency[:node_count]], graph.cycles[:node_count])
+
+
+# Cache of propagated color states of the first k-1 cycles of the graphs with k cycles, with least recently used eviction.
+# Graphs with the same prefix of graph_numbers were combined from the same graph of the last iteration step, so they have the same subgraph on their first k-1 cycles
+# and the same inherited precolorings. An entry is keyed by the prefix, the names of the nodes of the subgraph in the order of their indices, since the cached domains
+# are indexed by them, and a precoloring, and holds every coloring of the added cycle, whose propagation on that subgraph does
+# not fail, with the propagated domains of the subgraph. The hits, misses and evictions are counted, see get_stats, and added to the metrics,
+# the largest sizes of the cache are recorded for every worker by record_peaks.
+class PropagationCache:
+
+    def __init__(self, max_entries=PROPAGATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Number of cached states of the subgraphs in all entries
+        self.shared_domains = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            metrics.count('cache_misses')
+            return None
+        self.hits += 1
+        metrics.count('cache_hits')
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if key in self.entries:
+            self.shared_domains -= len(self.entries[key])
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.shared_domains += len(entry)
+        if len(self.entries) > self.max_entries:
+            (evicted_key, evicted_entry) = self.entries.popitem(last=False)
+            self.shared_domains -= len(evicted_entry)
+            self.evictions += 1
+            metrics.count('cache_evictions')
+
+    # Returns the statistics of the cache, e.g. to size it against the available memory. shared_domains is the number of cached states of the subgraphs.
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries),
+                'shared_domains': self.shared_domains, 'hit_rate': self.hits / lookups if lookups else None}
+
+    # Records the largest number of entries and of cached states of the subgraphs, that the cache of this worker held, in the metrics of the worker
+    def record_peaks(self):
+        stats = self.get_stats()
+        metrics.record_worker_peaks({'cache_entries': stats['entries'], 'cache_shared_domains': stats['shared_domains']})
+
+
+# Propagates the precoloring and every coloring of the added cycle on the subgraph of the first shared_node_count nodes and returns the cache entry,
+# i.e. the colorings of the added cycle whose propagation does not fail, with the propagated domains of the subgraph
+def get_shared_states(shared_graph, precoloring, added_colorings):
+    domains = ColorDomains(shared_graph)
+    states = []
+    if domains.assign_all(precoloring):
+        prefix = domains.mark()
+        for added_coloring in added_colorings:
+            if domains.assign_all(added_coloring):
+                states.append((added_coloring, domains.domains.copy()))
+            domains.undo(prefix)
+    return states
+
+
+# Does the same as surviving_extensions, but starts from the propagated states of the first shared_node_count nodes in the cache, which are shared by all graphs with the same
+# prefix of graph_numbers. The shared nodes are already at the fixpoint among themselves, so only the colors of their nodes with a single color left have to be removed from
+# the domains of their neighbors in the last cycle, before the propagation continues from the last cycle. This reaches the same fixpoint as propagating the whole precoloring.
+# Colorings of the added cycle, whose propagation already fails on the shared nodes, fail on the whole graph too.
+def cached_surviving_extensions(domains, cache, prefix, shared_node_count, precoloring, added_colorings, nodes_per_cycle, strict=False):
+    key = (prefix, tuple(domains.graph.names[:shared_node_count]), tuple(precoloring.items()))
+    states = cache.get(key)
+    if states is None:
+        states = get_shared_states(get_leading_subgraph(domains.graph, shared_node_count), precoloring, added_colorings)
+        cache.put(key, states)
+
+    adjacency = domains.graph.adjacency
+    shared_mask = (1 << shared_node_count) - 1
+    shared_neighbors = [(j, list(compact_graph.iter_bits(adjacency[j] & shared_mask))) for j in range(shared_node_count, len(adjacency))]
+    extensions = []
+    for (added_coloring, shared_domains) in states:
+        last_cycle_domains = []
+        worklist = []
+        for (j, neighbors) in shared_neighbors:
+            domain = ALL_COLORS
+            for i in neighbors:
+                if shared_domains[i] & (shared_domains[i] - 1) == 0:
+                    domain &= ~shared_domains[i]
+            if domain & (domain - 1) == 0:
+                worklist.append(j)
+            last_cycle_domains.append(domain)
+        if not all(last_cycle_domains):
+            continue
+
+        domains.set_domains(shared_domains + last_cycle_domains)
+        if domains.propagate(worklist) and not is_decomposed(domains, nodes_per_cycle) and not (strict and is_pruned_strictly(domains)):
+            extensions.append(precoloring | added_coloring)
+    return extensions
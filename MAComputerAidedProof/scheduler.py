@@ -0,0 +1,114 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+import time
+
+import metrics
+
+# State of a worker process, that is set once by initialize_worker instead of being sent with every task
+worker_state = {}
+
+
+# Stores the method and the arguments, that are shared by all tasks, in the worker process. The objects of an earlier run, see get_worker_object, are dropped.
+def initialize_worker(method, shared_arguments):
+    worker_state.clear()
+    worker_state['method'] = method
+    worker_state['shared_arguments'] = shared_arguments
+
+
+# Returns an object, that is kept in the worker process for all tasks of one run_scheduled call, e.g. a cache. It is created with factory on the first call.
+def get_worker_object(name, factory):
+    if name not in worker_state:
+        worker_state[name] = factory()
+    return worker_state[name]
+
+
+# Initializes a worker process. A forked worker inherits the metrics of the main process, they are reset so the worker only reports its own metrics.
+def initialize_worker_process(method, shared_arguments):
+    metrics.reset()
+    initialize_worker(method, shared_arguments)
+
+
+# Runs the method of the worker for every item of a chunk, the shared arguments are appended to each item
+def run_chunk(chunk):
+    method = worker_state['method']
+    shared_arguments = worker_state['shared_arguments']
+    start = time.perf_counter()
+    results = [method(tuple(item) + shared_arguments) for item in chunk]
+    metrics.record_worker(len(chunk), time.perf_counter() - start)
+    return results
+
+
+# Runs a chunk in a worker process and returns its results together with the metrics that the worker recorded for it, see metrics.take
+def run_chunk_in_worker(chunk):
+    return run_chunk(chunk), metrics.take()
+
+
+# Returns the results of a chunk, that was run by run_chunk_in_worker, and merges its metrics into the metrics of this process
+def get_chunk_results(future):
+    (results, worker_metrics) = future.result()
+    metrics.merge(worker_metrics)
+    return results
+
+
+# Returns the default number of workers, i.e. the number of cores that the process may run on
+def get_default_max_workers():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Chooses a chunk size, so every worker gets about 16 chunks, which is enough to balance the load while keeping the number of messages between the processes small
+def get_chunk_size(total, max_workers, min_chunk_size=1, max_chunk_size=256):
+    chunk_size = -(-total // (max_workers * 16))
+    return max(min_chunk_size, min(max_chunk_size, chunk_size))
+
+
+# Splits an iterable lazily into lists of chunk_size items
+def generate_chunks(items, chunk_size):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Runs method(item + shared_arguments) for all items and passes the result of every item to collect, in the order of the items.
+# With max_workers > 1, the shared arguments are sent to every worker only once when it starts and the items are sent in chunks. At most max_pending_chunks chunks are
+# submitted at once, so the items can be generated lazily. The metrics recorded by the workers are merged into the metrics of this process. If a worker raises an exception, the chunks that did not start yet are cancelled and the exception is raised here.
+def run_scheduled(method, items, shared_arguments=(), collect=None, max_workers=None, chunk_size=None, total=None, max_pending_chunks=None):
+    max_workers = max_workers or get_default_max_workers()
+    if chunk_size is None:
+        chunk_size = get_chunk_size(total, max_workers) if total is not None else 1
+    collect = collect or (lambda result: None)
+
+    if max_workers == 1:
+        initialize_worker(method, shared_arguments)
+        try:
+            for chunk in generate_chunks(items, chunk_size):
+                for result in run_chunk(chunk):
+                    collect(result)
+        finally:
+            # The objects of the run, e.g. caches, are not kept in the main process until the next run
+            worker_state.clear()
+        return
+
+    max_pending_chunks = max_pending_chunks or 4 * max_workers
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers, initializer=initialize_worker_process, initargs=(method, shared_arguments))
+    try:
+        pending = collections.deque()
+        for chunk in generate_chunks(items, chunk_size):
+            if len(pending) >= max_pending_chunks:
+                for result in get_chunk_results(pending.popleft()):
+                    collect(result)
+            pending.append(executor.submit(run_chunk_in_worker, chunk))
+
+        while pending:
+            for result in get_chunk_results(pending.popleft()):
+                collect(result)
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
@@ -0,0 +1,166 @@
+import argparse
+import heapq
+import os
+import shutil
+import zlib
+
+import graph_io as gio
+import graph_store
+import graph_utils as gu
+import journal
+
+# The shards write their results to SHARDS_ROOT/<i>_of_<N>/..., in the same layout as the results folder, and are merged into the results folder afterwards
+SHARDS_ROOT = 'results_shards'
+
+
+# Parses a shard given as 'i/N' into the tuple (i, N), where the shards are numbered 0, ..., N-1
+def parse_shard(text):
+    (index, count) = (int(part) for part in text.split('/'))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError('Invalid shard ' + text + ', it has to be i/N with 0 <= i < N')
+    return index, count
+
+
+# Returns the folder, to which a shard writes its results, and the results folder if no shard is given
+def get_results_root(shard):
+    if shard is None:
+        return 'results'
+    return SHARDS_ROOT + '/' + str(shard[0]) + '_of_' + str(shard[1])
+
+
+# Returns the shard of a key. The CRC32 of the key does not depend on the process, the machine or the Python version, so every host computes the same partition.
+def get_shard_index(key, shard_count):
+    return zlib.crc32(key.encode('utf-8')) % shard_count
+
+
+# Determines whether the pair (graph_1, graph_2) of start_execution belongs to the shard, the pairs are partitioned by the graph numbers of both graphs
+def is_input_in_shard(graph_pair, shard):
+    if shard is None:
+        return True
+    (graph_1, graph_2) = graph_pair
+    key = '_'.join(str(number) for number in graph_1.graph_numbers) + '/' + '_'.join(str(number) for number in graph_2.graph_numbers)
+    return get_shard_index(key, shard[1]) == shard[0]
+
+
+# Determines whether a subfolder of find_possible_precolored_graphs, given by its connecting edges, belongs to the shard
+def is_subfolder_in_shard(connecting_edges, shard):
+    return shard is None or get_shard_index(connecting_edges, shard[1]) == shard[0]
+
+
+# Raises an exception, if the stage has not been completed by every shard
+def check_shards_complete(level_suffix, nodes_per_cycle, k, shard_count, is_complete):
+    for index in range(shard_count):
+        file_path = get_results_root((index, shard_count)) + '/c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's' + level_suffix + '/progress.journal'
+        if not is_complete(journal.ProgressJournal(file_path).read()):
+            raise RuntimeError('Shard ' + str(index) + '/' + str(shard_count) + ' has not completed ' + file_path)
+
+
+# Returns a function, that maps a graph saved by start_execution to its position in the order, in which an unsharded run saves the graphs:
+# by the position of graph_1 among the unique graphs, then by the position of graph_2 among the graphs of the last iteration step, then by the position of the connection
+# graph_3 between the last two cycles. All three graphs are identified by the graph numbers of the combined graph, see gu.combine_metadata.
+def get_execution_order_key(k, unique_connections_last_iteration, connections_last_iteration, connections_2_cycles):
+    positions_1 = {tuple(graph.graph_numbers): i for i, graph in enumerate(graph for graphs in unique_connections_last_iteration.values() for graph in graphs)}
+    positions_2 = {tuple(graph.graph_numbers): i for i, graph in enumerate(graph for graphs in connections_last_iteration.values() for graph in graphs)}
+    positions_3 = {graph.graph_numbers[0]: i for i, graph in enumerate(graph for graphs in connections_2_cycles.values() for graph in graphs)}
+    length_1 = ((k - 1) * (k - 2)) // 2
+    prefix_length = gu.get_join_prefix_length(k)
+
+    def order_key(graph):
+        graph_numbers = graph.graph_numbers
+        graph_numbers_1 = tuple(graph_numbers[:length_1])
+        graph_numbers_2 = tuple(graph_numbers[:prefix_length]) + tuple(graph_numbers[length_1:-1])
+        return positions_1[graph_numbers_1], positions_2[graph_numbers_2], positions_3[graph_numbers[-1]]
+
+    return order_key
+
+
+# Iterates over the graphs in the store of a shard together with their keys. Every shard saves its graphs in the order of its inputs, which is the order of order_key.
+def read_ordered_graphs(subfolder, order_key):
+    last_key = None
+    for graph in graph_store.GraphStore(subfolder).read_compacts():
+        key = order_key(graph)
+        if last_key is not None and key < last_key:
+            raise RuntimeError('The graphs in ' + subfolder + ' are not in the order of an unsharded run')
+        last_key = key
+        yield key, graph
+
+
+# Merges the results of start_execution(k, nodes_per_cycle) of all shards into the results folder. The graphs of each store are merged into the order of an unsharded run,
+# so the merged results do not depend on the number of shards. The stores of the shards are already in that order, so they are merged while they are read and
+# only a batch of graphs per store is kept in memory.
+def merge_execution_shards(k, nodes_per_cycle, shard_count):
+    check_shards_complete('', nodes_per_cycle, k, shard_count, lambda records: any(record.get('complete') for record in records))
+
+    if nodes_per_cycle == 3:
+        connections_2_cycles = gu.get_connections_2c3s()
+    else:
+        connections_2_cycles = gu.get_connections_2c5s()
+    order_key = get_execution_order_key(k, gu.get_unique_connections_last_iteration(k, nodes_per_cycle), gu.get_connections_last_iteration(k, nodes_per_cycle), connections_2_cycles)
+
+    level = 'c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's'
+    subfolders_by_connecting_edges = {}
+    for index in range(shard_count):
+        for (subfolder, connecting_edges) in gio.get_subfolders_with_suffix(get_results_root((index, shard_count)) + '/' + level, '_connecting_edges'):
+            if graph_store.store_exists(subfolder):
+                subfolders_by_connecting_edges.setdefault(connecting_edges, []).append(subfolder)
+
+    gio.remove_graph_stores('results/' + level)
+    writer = gio.GraphWriter(nodes_per_cycle)
+    for connecting_edges, subfolders in subfolders_by_connecting_edges.items():
+        for (key, graph) in heapq.merge(*(read_ordered_graphs(subfolder, order_key) for subfolder in subfolders), key=lambda item: item[0]):
+            writer.add(graph)
+        writer.flush()
+
+
+# Merges the results of find_possible_precolored_graphs(k, nodes_per_cycle) of all shards into the results folder. Every subfolder belongs to exactly one shard, so the
+# stores are copied as they are.
+def merge_precoloring_shards(k, nodes_per_cycle, shard_count):
+    level = 'c' + str(nodes_per_cycle) + 's/' + str(k) + '_c' + str(nodes_per_cycle) + 's_with_precoloring'
+    check_shards_complete('_with_precoloring', nodes_per_cycle, k, shard_count, is_precoloring_shard_complete)
+
+    for index in range(shard_count):
+        for (subfolder, connecting_edges) in gio.get_subfolders_with_suffix(get_results_root((index, shard_count)) + '/' + level, '_connecting_edges'):
+            target = 'results/' + level + '/' + connecting_edges + '_connecting_edges'
+            graph_store.remove_store(target)
+            os.makedirs(target, exist_ok=True)
+            for file_name in (graph_store.META_FILE, graph_store.RECORDS_FILE, graph_store.INDEX_FILE):
+                if os.path.exists(subfolder + '/' + file_name):
+                    shutil.copyfile(subfolder + '/' + file_name, target + '/' + file_name)
+
+
+# A shard of find_possible_precolored_graphs is complete, if it recorded every subfolder of its shard as finished
+def is_precoloring_shard_complete(records):
+    if not records:
+        return False
+    (header, records) = (records[0], records[1:])
+    shard = tuple(header['shard'])
+    finished_subfolders = {record['subfolder'] for record in records if 'subfolder' in record}
+    return all(connecting_edges in finished_subfolders for connecting_edges in header['subfolders'] if is_subfolder_in_shard(connecting_edges, shard))
+
+
+# Runs one shard of a stage or merges the shards of a stage, e.g.
+#   python sharding.py start_execution 4 5 --shard 0/4
+#   python sharding.py merge_start_execution 4 5 --shards 4
+if __name__ == "__main__":
+    import main
+
+    parser = argparse.ArgumentParser(description='Runs one shard of a stage on a shared results folder or merges the results of all shards')
+    parser.add_argument('stage', choices=['start_execution', 'find_possible_precolored_graphs', 'merge_start_execution', 'merge_find_possible_precolored_graphs'])
+    parser.add_argument('k', type=int)
+    parser.add_argument('nodes_per_cycle', type=int, choices=[3, 5])
+    parser.add_argument('--shard', type=parse_shard, help='shard i/N to run, with 0 <= i < N')
+    parser.add_argument('--shards', type=int, help='number of shards to merge')
+    parser.add_argument('--max-workers', type=int)
+    parser.add_argument('--strict', action='store_true', help='run the precoloring in the strict mode of main.find_possible_precolored_graphs')
+    arguments = parser.parse_args()
+
+    if arguments.stage.startswith('merge_') and arguments.shards is None:
+        parser.error('merging needs --shards')
+    if arguments.stage == 'start_execution':
+        main.start_execution(arguments.k, arguments.nodes_per_cycle, arguments.max_workers, shard=arguments.shard)
+    elif arguments.stage == 'find_possible_precolored_graphs':
+        main.find_possible_precolored_graphs(arguments.k, arguments.nodes_per_cycle, shard=arguments.shard, strict=arguments.strict, max_workers=arguments.max_workers)
+    elif arguments.stage == 'merge_start_execution':
+        merge_execution_shards(arguments.k, arguments.nodes_per_cycle, arguments.shards)
+    else:
+        merge_precoloring_shards(arguments.k, arguments.nodes_per_cycle, arguments.shards)
@@ -0,0 +1,177 @@
+import itertools
+
+# Forbidden induced subgraphs, given by their number of nodes and their edges. In the diamond, the edge (0, 1) is the edge whose endpoints have the two common neighbors 2 and 3.
+PATTERNS = {
+    'triangle': (3, ((0, 1), (0, 2), (1, 2))),
+    'diamond': (4, ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3))),
+    'k4': (4, ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3))),
+    'p6': (6, ((0, 1), (1, 2), (2, 3), (3, 4), (4, 5))),
+}
+
+# The forbidden induced subgraphs of graphs consisting of C5s and of triangles, i.e. (P6, triangle)-free and (P6, diamond, K4)-free
+FORBIDDEN_FAMILIES = {5: ('triangle', 'p6'), 3: ('p6', 'diamond', 'k4')}
+
+# Matchers that were compiled in this process, by the names of their patterns
+compiled_matchers = {}
+
+
+# Returns the adjacency bitmasks of a pattern
+def get_pattern_adjacency(node_count, edges):
+    adjacency = [0] * node_count
+    for u, v in edges:
+        adjacency[u] |= 1 << v
+        adjacency[v] |= 1 << u
+    return adjacency
+
+
+# Returns the constraints of a search order of the nodes of a pattern: for every position, the bitmask of the earlier positions whose nodes are adjacent to its node.
+# The nodes at the other earlier positions must not be adjacent to it, since the subgraphs are induced.
+def get_constraints(adjacency, order):
+    return tuple(sum(1 << j for j in range(i) if adjacency[order[i]] >> order[j] & 1) for i in range(len(order)))
+
+
+# Returns the search order of the nodes of a pattern, that starts with the given node and has the lexicographically largest constraints among all orders, in which every
+# node is adjacent to an earlier node. Dense parts of the patterns are searched first and patterns that share a subpattern share the beginning of their constraints.
+def get_search_order(adjacency, first_node):
+    best = None
+    for rest in itertools.permutations([node for node in range(len(adjacency)) if node != first_node]):
+        order = (first_node,) + rest
+        constraints = get_constraints(adjacency, order)
+        if all(constraints[1:]) and (best is None or constraints > best[0]):
+            best = (constraints, order)
+    return best[0]
+
+
+# Returns one node of every orbit of the automorphism group of a pattern
+def get_orbit_representatives(adjacency):
+    node_count = len(adjacency)
+    edges = {(u, v) for u in range(node_count) for v in range(node_count) if adjacency[u] >> v & 1}
+    orbits = {}
+    for permutation in itertools.permutations(range(node_count)):
+        if all((permutation[u], permutation[v]) in edges for (u, v) in edges):
+            for node in range(node_count):
+                orbits.setdefault(node, set()).add(permutation[node])
+    representatives = []
+    for node in range(node_count):
+        if not any(node in orbits[representative] for representative in representatives):
+            representatives.append(node)
+    return representatives
+
+
+# Node of a search plan. The path from the root to the node fixes the constraints of the nodes chosen so far, the node holds the patterns that are complete when it is reached
+# and the children that continue the search. Every child is stored with the positions of the chosen nodes that its next node has to be adjacent and non-adjacent to.
+# max_remaining is the largest number of nodes that can still be added below the node.
+class PlanNode:
+    __slots__ = ('children', 'patterns', 'max_remaining')
+
+    def __init__(self):
+        self.children = []
+        self.patterns = []
+        self.max_remaining = 0
+
+    # Adds the constraints of a search order for the pattern below this node, the constraints that are shared with other patterns are only searched once
+    def add(self, constraints, pattern_name):
+        node = self
+        for depth, constraint in enumerate(constraints):
+            node.max_remaining = max(node.max_remaining, len(constraints) - depth)
+            node = node.get_child(depth, constraint)
+        if pattern_name not in node.patterns:
+            node.patterns.append(pattern_name)
+
+    def get_child(self, depth, constraint):
+        for (child_constraint, adjacent_positions, non_adjacent_positions, child) in self.children:
+            if child_constraint == constraint:
+                return child
+        child = PlanNode()
+        adjacent_positions = tuple(j for j in range(depth) if constraint >> j & 1)
+        non_adjacent_positions = tuple(j for j in range(depth) if not constraint >> j & 1)
+        self.children.append((constraint, adjacent_positions, non_adjacent_positions, child))
+        # Children that complete a pattern sooner are searched first
+        self.children.sort(key=lambda entry: entry[3].max_remaining)
+        return child
+
+
+# Matcher for a family of forbidden induced subgraphs. The search orders of all patterns are compiled once into a search plan, in which orders with the same beginning are
+# merged, so the nodes of a common subpattern are only searched once for all patterns. A graph is checked in one pass, that stops at the first match.
+# The plan 'unrooted' holds one search order per pattern. The plan 'rooted' holds one search order starting at every orbit of nodes of each pattern, so with required masks,
+# the search only starts at the nodes of the smallest mask, like the searches of CompactGraph.
+class SubgraphMatcher:
+
+    def __init__(self, pattern_names):
+        self.pattern_names = tuple(pattern_names)
+        self.unrooted = PlanNode()
+        self.rooted = PlanNode()
+        for pattern_name in self.pattern_names:
+            adjacency = get_pattern_adjacency(*PATTERNS[pattern_name])
+            representatives = get_orbit_representatives(adjacency)
+            self.unrooted.add(max(get_search_order(adjacency, node) for node in representatives), pattern_name)
+            for node in representatives:
+                self.rooted.add(get_search_order(adjacency, node), pattern_name)
+
+    # Returns the name of a pattern, that is an induced subgraph of the graph given by its adjacency bitmasks, and the indices of the nodes that it was found on,
+    # or None if the graph is free of all patterns. If required_masks are given, only subgraphs that contain at least one node of every mask are searched.
+    def find(self, adjacency, required_masks=()):
+        all_nodes = (1 << len(adjacency)) - 1
+        if required_masks:
+            (plan, start_nodes) = (self.rooted, min(required_masks, key=lambda mask: mask.bit_count()))
+        else:
+            (plan, start_nodes) = (self.unrooted, all_nodes)
+        chosen = []
+        chosen_adjacency = []
+
+        def extend(node, used):
+            if node.patterns and all(used & mask for mask in required_masks):
+                return node.patterns[0]
+            if required_masks and sum(1 for mask in required_masks if not used & mask) > node.max_remaining:
+                return None
+
+            for (constraint, adjacent_positions, non_adjacent_positions, child) in node.children:
+                candidates = all_nodes & ~used
+                for j in adjacent_positions:
+                    candidates &= chosen_adjacency[j]
+                for j in non_adjacent_positions:
+                    candidates &= ~chosen_adjacency[j]
+                while candidates:
+                    lowest_bit = candidates & -candidates
+                    i = lowest_bit.bit_length() - 1
+                    chosen.append(i)
+                    chosen_adjacency.append(adjacency[i])
+                    found = extend(child, used | lowest_bit)
+                    if found is not None:
+                        return found
+                    chosen.pop()
+                    chosen_adjacency.pop()
+                    candidates ^= lowest_bit
+            return None
+
+        for (constraint, adjacent_positions, non_adjacent_positions, child) in plan.children:
+            nodes = start_nodes
+            while nodes:
+                lowest_bit = nodes & -nodes
+                i = lowest_bit.bit_length() - 1
+                chosen.append(i)
+                chosen_adjacency.append(adjacency[i])
+                found = extend(child, lowest_bit)
+                if found is not None:
+                    return found, chosen
+                chosen.pop()
+                chosen_adjacency.pop()
+                nodes ^= lowest_bit
+        return None
+
+    # Determines whether the graph given by its adjacency bitmasks is free of all patterns, that contain at least one node of every required mask
+    def is_free(self, adjacency, required_masks=()):
+        return self.find(adjacency, required_masks) is None
+
+
+# Returns the matcher for the given patterns, it is compiled on the first call
+def get_matcher(pattern_names):
+    pattern_names = tuple(pattern_names)
+    if pattern_names not in compiled_matchers:
+        compiled_matchers[pattern_names] = SubgraphMatcher(pattern_names)
+    return compiled_matchers[pattern_names]
+
+
+# Returns the matcher for the forbidden subgraphs of graphs consisting of cycles with the given number of nodes
+def get_forbidden_subgraph_matcher(nodes_per_cycle):
+    return get_matcher(FORBIDDEN_FAMILIES[nodes_per_cycle])
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+import batch_coloring as bc
+import custom_graph
+import graph_coloring as gc
+
+SEED = 8
+
+
+# Builds a graph of three cycles with the initials u, v and w, that are connected by random edges
+def build_random_graph(rng, nodes_per_cycle, edge_probability=0.15):
+    graph = custom_graph.CustomGraph()
+    nodes = []
+    for initial in 'uvw':
+        cycle = [initial + str(i) for i in range(nodes_per_cycle)]
+        graph.add_edges_from(zip(cycle, cycle[1:] + cycle[:1]))
+        nodes.extend(cycle)
+    for i, u in enumerate(nodes):
+        for v in nodes[i + 1:]:
+            if u[0] != v[0] and rng.random() < edge_probability:
+                graph.add_edge(u, v)
+    return graph
+
+
+# Returns the colorings of the first two cycles, as the precoloring stage uses them, and random precolorings of random subsets of the nodes
+def build_precolorings(rng, graph, nodes_per_cycle):
+    if nodes_per_cycle == 3:
+        precolorings = gc.generate_colorings_two_c3s()
+    else:
+        precolorings = gc.generate_colorings_two_c5s()
+    nodes = list(graph.nodes())
+    for i in range(20):
+        precolorings.append({node: rng.randint(1, 3) for node in rng.sample(nodes, rng.randint(0, len(nodes)))})
+    return precolorings
+
+
+# The batched propagation keeps exactly the precolorings, that CustomGraph.decomposed_by_precoloring keeps, also if the precolorings are propagated in several chunks
+@pytest.mark.parametrize('nodes_per_cycle', [3, 5])
+@pytest.mark.parametrize('chunk_size', [7, 4096])
+def test_surviving_precolorings_match_decomposed_by_precoloring(nodes_per_cycle, chunk_size):
+    rng = random.Random(SEED)
+    for i in range(20):
+        graph = build_random_graph(rng, nodes_per_cycle)
+        precolorings = build_precolorings(rng, graph, nodes_per_cycle)
+        survivors = bc.surviving_precolorings(graph, precolorings, nodes_per_cycle, chunk_size)
+        expected = [not graph.decomposed_by_precoloring(precoloring, nodes_per_cycle)[0] for precoloring in precolorings]
+        assert survivors.tolist() == expected
@@ -0,0 +1,25 @@
+import canonical_form
+import graph_utils as gu
+
+
+# Both filters keep the first graph of every isomorphism class, so they keep the same graphs. Every class of the canonical form is a single class of the reference
+# implementation, so the two filters also split the graphs into the same classes.
+def assert_same_classes(graphs):
+    graphs = [graph.to_custom_graph() for graph in graphs]
+    representatives = gu.filter_isomorphisms_with_cycle_to_cycle_mapping(graphs)
+    assert [graph.name for graph in gu.filter_isomorphisms_by_canonical_form(graphs)] == [graph.name for graph in representatives]
+
+    classes = {}
+    for graph in graphs:
+        classes.setdefault(canonical_form.canonical_form(graph.to_compact()), []).append(graph)
+    assert len(classes) == len(representatives)
+    for graphs_of_class in classes.values():
+        assert len(gu.filter_isomorphisms_with_cycle_to_cycle_mapping(graphs_of_class)) == 1
+
+
+def test_two_triangles(connections_2_c3s):
+    assert_same_classes([graph for graphs in connections_2_c3s.values() for graph in graphs])
+
+
+def test_three_triangles(graphs_3_c3s):
+    assert_same_classes(graphs_3_c3s)
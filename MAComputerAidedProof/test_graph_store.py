@@ -0,0 +1,135 @@
+import copyreg
+import io
+import os
+import pickle
+import subprocess
+import sys
+
+import networkx as nx
+import pytest
+
+import compact_graph
+import custom_graph
+import graph_io as gio
+import graph_store
+
+
+# Builds a graph of two C3s connected by two edges, as the two-cycle stage does, with the given precolorings
+def build_graph(possible_precolorings):
+    graph = custom_graph.CustomGraph()
+    graph.add_edges_from([('u0', 'u1'), ('u1', 'u2'), ('u2', 'u0'), ('v0', 'v1'), ('v1', 'v2'), ('v2', 'v0'), ('u0', 'v0'), ('u1', 'v2')])
+    graph.name = 'graph7'
+    graph.edge_numbers = [2]
+    graph.graph_numbers = [7]
+    graph.possible_precolorings = possible_precolorings
+    return graph
+
+
+# Pickles a graph by its attributes, which is how the pickle files were written before graphs were pickled in the packed format of graph_store.pack_graph
+def dumps_by_attributes(graph):
+    class AttributePickler(pickle.Pickler):
+        def reducer_override(self, obj):
+            if isinstance(obj, compact_graph.CompactGraph):
+                return copyreg.__newobj__, (type(obj),), (None, {slot: getattr(obj, slot) for slot in obj.__slots__})
+            if isinstance(obj, custom_graph.CustomGraph):
+                return copyreg.__newobj__, (type(obj),), obj.__dict__
+            return NotImplemented
+
+    buffer = io.BytesIO()
+    AttributePickler(buffer, pickle.HIGHEST_PROTOCOL).dump(graph)
+    return buffer.getvalue()
+
+
+# Returns everything that is saved of a graph, in a form that can be compared
+def get_key(graph):
+    graph = graph.to_compact()
+    return (graph.names, sorted(map(sorted, graph.edges())), graph.cycles, graph.name, graph.edge_numbers, graph.graph_numbers,
+            type(graph.possible_precolorings), [sorted(precoloring.items()) for precoloring in graph.possible_precolorings])
+
+
+# Asserts, that a graph is the same after a round trip through the packed pickle format and after loading it from a pickle file of the old format
+def assert_round_trip(graph):
+    packed = pickle.loads(pickle.dumps(graph, pickle.HIGHEST_PROTOCOL))
+    by_attributes = pickle.loads(dumps_by_attributes(graph))
+    assert type(packed) is type(graph) and type(by_attributes) is type(graph)
+    assert get_key(packed) == get_key(by_attributes) == get_key(graph)
+    if isinstance(graph, custom_graph.CustomGraph):
+        assert nx.utils.graphs_equal(packed, graph) and nx.utils.graphs_equal(by_attributes, graph)
+
+
+def test_custom_graph_with_precolorings():
+    assert_round_trip(build_graph([{'u0': 1, 'u1': 2}, {'u0': 1, 'u1': 2, 'u2': 3}]))
+
+
+def test_compact_graph_with_precolorings():
+    assert_round_trip(build_graph([{'u0': 1, 'u1': 2}, {'u0': 1, 'u1': 2, 'u2': 3}]).to_compact())
+
+
+def test_empty_precoloring_set():
+    assert_round_trip(build_graph(set()))
+    assert_round_trip(build_graph(set()).to_compact())
+
+
+# A graph with attributes cannot be packed, so it is pickled by default and keeps its attributes
+def test_graph_with_attributes_falls_back_to_default_pickling():
+    graph = build_graph([{'u0': 1}])
+    graph.nodes['u0']['color'] = 1
+    graph.edges['u0', 'v0']['weight'] = 2
+    assert graph.__reduce_ex__(pickle.HIGHEST_PROTOCOL)[0] is not graph_store.unpack_custom_graph
+
+    loaded = pickle.loads(pickle.dumps(graph, pickle.HIGHEST_PROTOCOL))
+    assert get_key(loaded) == get_key(graph)
+    assert loaded.nodes['u0'] == {'color': 1} and loaded.edges['u0', 'v0'] == {'weight': 2}
+
+
+# Graphs with the same nodes share their tuple of names, so it is pickled only once, but only the most recently used tuples are kept
+def test_shared_names_are_bounded():
+    graphs = [build_graph([]).to_compact() for i in range(2)]
+    assert graph_store.pack_graph(graphs[0])[0] is graph_store.pack_graph(graphs[1])[0]
+
+    for i in range(2 * graph_store.SHARED_NAMES_SIZE):
+        graph_store.pack_graph(compact_graph.CompactGraph(['u0', 'x' + str(i)], [2, 1]))
+    assert len(graph_store.shared_names) == graph_store.SHARED_NAMES_SIZE
+
+
+# The graphs of a directory of pickle files are read back the same after importing them into a graph store. Pickle files are only read by the import, so a directory,
+# whose store was removed, holds no graphs, although the pickle files are still next to it.
+def test_import_pickle_tree(tmp_path):
+    directory = str(tmp_path / 'c3s' / '2_c3s' / '2_connecting_edges')
+    os.makedirs(directory)
+    graphs = [build_graph([{'u0': 1}]), build_graph(set())]
+    for i, graph in enumerate(graphs):
+        graph.name = 'graph' + str(i)
+        with open(directory + '/graph' + str(i) + '.pkl', 'wb') as f:
+            f.write(dumps_by_attributes(graph))
+
+    assert gio.read_graph_files(directory) == [] and gio.count_graph_files(directory) == 0
+    assert graph_store.import_pickle_tree(str(tmp_path)) == 2
+    assert [get_key(graph) for graph in gio.read_graph_files(directory)] == [get_key(graph) for graph in graphs]
+    assert gio.count_graph_files(directory) == 2
+
+    gio.save_graphs_in_directory([], directory)
+    assert gio.read_graph_files(directory) == [] and gio.count_graph_files(directory) == 0
+
+
+# A lock that is held cannot be taken by another StoreLock until it is released
+def test_store_lock_is_exclusive(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_store, 'LOCK_TIMEOUT', 0.05)
+    lock_path = str(tmp_path / graph_store.LOCK_FILE)
+    with graph_store.StoreLock(lock_path):
+        with pytest.raises(TimeoutError):
+            with graph_store.StoreLock(lock_path):
+                pass
+    with graph_store.StoreLock(lock_path):
+        pass
+
+
+# The lock of a process that crashed while holding it is released with the process, so the next process takes it right away
+def test_store_lock_of_crashed_process_is_released(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_store, 'LOCK_TIMEOUT', 0.05)
+    lock_path = str(tmp_path / graph_store.LOCK_FILE)
+    code = 'import os, graph_store\ngraph_store.StoreLock(' + repr(lock_path) + ').__enter__()\nos._exit(1)'
+    environment = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code], env=environment).returncode == 1
+    with graph_store.StoreLock(lock_path):
+        pass
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+import custom_graph
+import graph_utils as gu
+import main
+
+SEED = 6
+
+
+# Builds a random graph of cycles with the given initials and number of nodes, that are connected by random edges
+def build_random_graph(rng, nodes_per_cycle, initials, edge_probability):
+    graph = custom_graph.CustomGraph()
+    nodes = []
+    for initial in initials:
+        cycle = [initial + str(i) for i in range(nodes_per_cycle)]
+        graph.add_edges_from(zip(cycle, cycle[1:] + cycle[:1]))
+        nodes.extend(cycle)
+    for i, u in enumerate(nodes):
+        for v in nodes[i + 1:]:
+            if u[0] != v[0] and rng.random() < edge_probability:
+                graph.add_edge(u, v)
+    return graph
+
+
+# Both engines agree on every candidate of the two-triangle stage, before the candidates are filtered
+def test_p6_engines_agree_on_two_triangle_candidates():
+    for edge_number in range(1, 4):
+        assert gu.find_p6_engine_mismatches(main.generate_two_cycle_candidates(3, edge_number)) == []
+
+
+# Both engines agree on every candidate of start_execution(3, 3), before the candidates are filtered
+def test_p6_engines_agree_on_three_triangle_candidates(candidates_3_c3s):
+    assert gu.find_p6_engine_mismatches(candidates_3_c3s) == []
+
+
+# Both engines agree on random graphs of cycles, from sparse graphs with many induced paths to dense ones with few
+@pytest.mark.parametrize('nodes_per_cycle, initials', [(3, 'uvwx'), (5, 'uv'), (5, 'uvw')])
+def test_p6_engines_agree_on_random_graphs(nodes_per_cycle, initials):
+    rng = random.Random(SEED)
+    graphs = [build_random_graph(rng, nodes_per_cycle, initials, rng.choice([0.05, 0.1, 0.2, 0.4])) for i in range(150)]
+    assert any(graph.has_induced_p6() for graph in graphs) and not all(graph.has_induced_p6() for graph in graphs)
+    assert gu.find_p6_engine_mismatches(graphs) == []
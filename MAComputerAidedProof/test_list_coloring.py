@@ -0,0 +1,79 @@
+import itertools
+import random
+
+import compact_graph
+import list_coloring
+import propagation
+
+SEED = 22
+
+
+# Returns all list colorings of the graph with adjacency bitmasks, that respect the domains, as lists of color bits per node index
+def brute_force_list_colorings(adjacency, domains):
+    colorings = []
+    for coloring in itertools.product(*([bit for bit in (1, 2, 4) if domain & bit] for domain in domains)):
+        if all(not coloring[i] & coloring[j] for i, mask in enumerate(adjacency) for j in compact_graph.iter_bits(mask)):
+            colorings.append(list(coloring))
+    return colorings
+
+
+def build_random_adjacency(rng, node_count, edge_probability):
+    adjacency = [0] * node_count
+    for i, j in itertools.combinations(range(node_count), 2):
+        if rng.random() < edge_probability:
+            adjacency[i] |= 1 << j
+            adjacency[j] |= 1 << i
+    return adjacency
+
+
+# The solver finds a list coloring exactly if there is one, and the feasible colors of every node are the colors it has in at least one list coloring
+def test_solver_agrees_with_brute_force():
+    rng = random.Random(SEED)
+    for i in range(600):
+        node_count = rng.randint(1, 9)
+        adjacency = build_random_adjacency(rng, node_count, rng.choice([0.2, 0.35, 0.5, 0.7]))
+        domains = [rng.choice([1, 2, 4, 3, 5, 6, 7, 7, 7]) for j in range(node_count)]
+        colorings = brute_force_list_colorings(adjacency, domains)
+
+        solution = list_coloring.find_list_coloring(adjacency, domains)
+        assert (solution is not None) == bool(colorings)
+        if solution is not None:
+            assert solution in colorings
+
+        nodes_mask = rng.randint(0, (1 << node_count) - 1)
+        feasible = list_coloring.get_feasible_colors(adjacency, domains, nodes_mask)
+        if not colorings:
+            assert feasible is None
+        else:
+            assert feasible == {j: sum({coloring[j] for coloring in colorings}) for j in compact_graph.iter_bits(nodes_mask)}
+
+
+# Builds a graph of two cycles u and v, with the given nodes per cycle, in which u0 is connected to the given nodes of v
+def build_graph(nodes_per_cycle, neighbors_of_u0):
+    names = ['u' + str(i) for i in range(nodes_per_cycle)] + ['v' + str(i) for i in range(nodes_per_cycle)]
+    adjacency = [0] * len(names)
+    edges = [(c * nodes_per_cycle + i, c * nodes_per_cycle + (i + 1) % nodes_per_cycle) for c in range(2) for i in range(nodes_per_cycle)]
+    edges += [(0, nodes_per_cycle + i) for i in neighbors_of_u0]
+    for i, j in edges:
+        adjacency[i] |= 1 << j
+        adjacency[j] |= 1 << i
+    return compact_graph.CompactGraph(names, adjacency)
+
+
+# Returns the verdict of is_decomposed_strictly for the precoloring u0 = 3, which the propagation alone does not reject
+def get_verdict(graph, nodes_per_cycle):
+    domains = propagation.ColorDomains(graph)
+    assert domains.assign_all({'u0': 3})
+    assert not propagation.is_decomposed(domains, nodes_per_cycle)
+    return list_coloring.is_decomposed_strictly(domains)
+
+
+# If u0 is adjacent to every node of the C5 v, the nodes of v only have the colors 1 and 2 left, but an odd cycle cannot be colored with two colors
+def test_unextendable_precoloring():
+    assert get_verdict(build_graph(5, range(5)), 5) == list_coloring.UNEXTENDABLE
+
+
+# If u0 is adjacent to v1 and v2 of the triangle v, they take the colors 1 and 2, so v0 has the color 3 in every extension, although the propagation leaves it all colors
+def test_forced_precoloring():
+    assert get_verdict(build_graph(3, (1, 2)), 3) == list_coloring.FORCED
+    assert get_verdict(build_graph(3, (1,)), 3) is None
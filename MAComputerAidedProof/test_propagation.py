@@ -0,0 +1,53 @@
+import pytest
+
+import compact_graph
+import graph_coloring as gc
+import propagation
+
+# The graphs with three triangles share the states of their first two triangles, if they have the same first graph number, see main.find_possible_precolorings
+PREFIX_LENGTH = 1
+SHARED_NODE_COUNT = 6
+
+
+# Returns a copy of the graph, in which the nodes of every cycle but the last are in reverse order
+def reverse_shared_cycles(graph):
+    order = []
+    for cycle in range(max(graph.cycles) + 1):
+        nodes = [i for i in range(len(graph.names)) if graph.cycles[i] == cycle]
+        order.extend(reversed(nodes) if cycle < max(graph.cycles) else nodes)
+    position = {i: new_i for new_i, i in enumerate(order)}
+    adjacency = [sum(1 << position[j] for j in compact_graph.iter_bits(graph.adjacency[i])) for i in order]
+    return compact_graph.CompactGraph([graph.names[i] for i in order], adjacency, name=graph.name, edge_numbers=graph.edge_numbers, graph_numbers=graph.graph_numbers)
+
+
+# Returns the graphs sorted by their prefixes, so the graphs that share a prefix come one after the other
+def group_by_prefix(graphs):
+    graphs = sorted(graphs, key=lambda graph: graph.graph_numbers[:PREFIX_LENGTH])
+    assert any(a.graph_numbers[:PREFIX_LENGTH] == b.graph_numbers[:PREFIX_LENGTH] for a, b in zip(graphs, graphs[1:]))
+    return graphs
+
+
+# The cached propagation keeps the same extensions as propagating every precoloring on the whole graph, for graphs that share their prefix, after evictions of the
+# least recently used entries, and for a graph with the same prefix, whose shared nodes are in another order. Every precoloring runs through all graphs, so with a single
+# entry, the graphs of one prefix hit the entry and the next prefix evicts it.
+@pytest.mark.parametrize('max_entries', [1, propagation.PROPAGATION_CACHE_SIZE])
+@pytest.mark.parametrize('strict', [False, True])
+def test_cached_surviving_extensions(graphs_3_c3s, max_entries, strict):
+    graphs = group_by_prefix(graphs_3_c3s)
+    graphs.insert(1, reverse_shared_cycles(graphs[0]))
+    precolorings = [coloring for rotation in gc.generate_colorings_c3(['u0', 'u1', 'u2']) for coloring in gc.permute_coloring(rotation)]
+    cache = propagation.PropagationCache(max_entries)
+    extension_count = 0
+    for precoloring in precolorings:
+        for graph in graphs:
+            prefix = tuple(graph.graph_numbers[:PREFIX_LENGTH])
+            added_colorings = gc.generate_colorings_of_added_c3(precoloring)
+            expected = propagation.surviving_extensions(propagation.ColorDomains(graph), precoloring, added_colorings, 3, strict)
+            cached = propagation.cached_surviving_extensions(propagation.ColorDomains(graph), cache, prefix, SHARED_NODE_COUNT, precoloring, added_colorings, 3, strict)
+            assert cached == expected
+            extension_count += len(expected)
+
+    assert 0 < extension_count < len(graphs) * len(precolorings) * 6
+    assert cache.hits > 0
+    if max_entries == 1:
+        assert cache.evictions > 0
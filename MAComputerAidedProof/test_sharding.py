@@ -0,0 +1,66 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import graph_store
+import graph_utils as gu
+import sharding
+
+# Folder of the modules, the stages are run as separate processes in a temporary folder and import the modules from here
+MODULE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+# Runs a python command in its own process in the given folder and returns the process
+def start_process(arguments, directory):
+    environment = dict(os.environ, PYTHONPATH=MODULE_DIRECTORY)
+    return subprocess.Popen([sys.executable] + arguments, cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def run_process(arguments, directory):
+    process = start_process(arguments, directory)
+    (stdout, stderr) = process.communicate()
+    assert process.returncode == 0, stderr.decode()
+
+
+# Returns the contents of all graph stores below a folder, by their paths relative to the folder
+def read_stores(directory):
+    stores = {}
+    for root, dirs, files in os.walk(directory):
+        if graph_store.store_exists(root):
+            stores[os.path.relpath(root, directory)] = tuple(open(os.path.join(root, file_name), 'rb').read()
+                                                             for file_name in (graph_store.META_FILE, graph_store.RECORDS_FILE, graph_store.INDEX_FILE))
+    return stores
+
+
+# Runs start_execution(4, 3) in two shards, that run at the same time in separate processes like on two hosts, merges them and compares the merged stores with the
+# stores of an unsharded run
+def test_two_shards_merge_to_unsharded_run(tmp_path):
+    directory = str(tmp_path)
+    run_process([MODULE_DIRECTORY + '/pipeline.py', '3', '3', '--max-workers', '1'], directory)
+    run_process(['-c', 'import main; main.start_execution(4, 3, max_workers=1, resume=False)'], directory)
+    unsharded = read_stores(directory + '/results/c3s/4_c3s')
+    shutil.rmtree(directory + '/results/c3s/4_c3s')
+
+    shards = [start_process([MODULE_DIRECTORY + '/sharding.py', 'start_execution', '4', '3', '--shard', str(index) + '/2', '--max-workers', '1'], directory)
+              for index in range(2)]
+    for process in shards:
+        (stdout, stderr) = process.communicate()
+        assert process.returncode == 0, stderr.decode()
+    sharded = [read_stores(directory + '/results_shards/' + str(index) + '_of_2/c3s/4_c3s') for index in range(2)]
+    assert sharded[0] and sharded[1]
+
+    run_process([MODULE_DIRECTORY + '/sharding.py', 'merge_start_execution', '4', '3', '--shards', '2'], directory)
+    assert read_stores(directory + '/results/c3s/4_c3s') == unsharded
+
+
+# The inputs of a shard are counted from the index without generating them, and the counts of the shards add up to the count of an unsharded run
+def test_shard_input_counts(connections_2_c3s, unique_connections_2_c3s):
+    index = gu.index_connections_last_iteration(connections_2_c3s, 3)
+    total = gu.count_execution_inputs(3, unique_connections_2_c3s, index)
+    counts = []
+    for shard in ((0, 3), (1, 3), (2, 3)):
+        inputs = [graph_pair for graph_pair in gu.generate_execution_inputs(3, unique_connections_2_c3s, index) if sharding.is_input_in_shard(graph_pair, shard)]
+        counts.append(gu.count_execution_inputs(3, unique_connections_2_c3s, index, lambda graph_pair: sharding.is_input_in_shard(graph_pair, shard)))
+        assert counts[-1] == len(inputs)
+    assert sum(counts) == total == len(list(gu.generate_execution_inputs(3, unique_connections_2_c3s, index)))
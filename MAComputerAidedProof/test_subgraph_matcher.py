@@ -0,0 +1,66 @@
+import random
+
+import networkx as nx
+import pytest
+from networkx.algorithms import isomorphism
+
+import subgraph_matcher
+
+SEED = 21
+
+
+def get_adjacency(graph):
+    adjacency = [0] * graph.number_of_nodes()
+    for u, v in graph.edges():
+        adjacency[u] |= 1 << v
+        adjacency[v] |= 1 << u
+    return adjacency
+
+
+def get_pattern_graph(pattern_name):
+    (node_count, edges) = subgraph_matcher.PATTERNS[pattern_name]
+    pattern = nx.empty_graph(node_count)
+    pattern.add_edges_from(edges)
+    return pattern
+
+
+# Determines with VF2, whether the graph contains one of the patterns as induced subgraph, that contains at least one node of every required mask
+def contains_pattern(graph, pattern_names, required_masks):
+    for pattern_name in pattern_names:
+        for mapping in isomorphism.GraphMatcher(graph, get_pattern_graph(pattern_name)).subgraph_isomorphisms_iter():
+            nodes_mask = sum(1 << node for node in mapping)
+            if all(nodes_mask & mask for mask in required_masks):
+                return True
+    return False
+
+
+# Returns one to three random, non-empty masks of the nodes, or no masks
+def build_required_masks(rng, node_count, with_masks):
+    if not with_masks:
+        return ()
+    return tuple(rng.randint(1, (1 << node_count) - 1) & rng.randint(1, (1 << node_count) - 1) or 1 for i in range(rng.randint(1, 3)))
+
+
+# The compiled matcher finds a forbidden subgraph exactly if VF2 finds one, and the subgraph it returns is an induced copy of the returned pattern, that hits every required mask
+@pytest.mark.parametrize('nodes_per_cycle', sorted(subgraph_matcher.FORBIDDEN_FAMILIES))
+@pytest.mark.parametrize('with_masks', [False, True])
+def test_matcher_agrees_with_vf2(nodes_per_cycle, with_masks):
+    rng = random.Random(SEED)
+    pattern_names = subgraph_matcher.FORBIDDEN_FAMILIES[nodes_per_cycle]
+    matcher = subgraph_matcher.get_forbidden_subgraph_matcher(nodes_per_cycle)
+    found_count = 0
+    for i in range(400):
+        node_count = rng.randint(4, 12)
+        graph = nx.gnp_random_graph(node_count, rng.choice([0.15, 0.25, 0.4, 0.6]), seed=rng.randrange(2 ** 32))
+        required_masks = build_required_masks(rng, node_count, with_masks)
+
+        found = matcher.find(get_adjacency(graph), required_masks)
+        assert (found is not None) == contains_pattern(graph, pattern_names, required_masks)
+        if found is not None:
+            (pattern_name, nodes) = found
+            assert pattern_name in pattern_names
+            assert len(set(nodes)) == subgraph_matcher.PATTERNS[pattern_name][0]
+            assert nx.is_isomorphic(graph.subgraph(nodes), get_pattern_graph(pattern_name))
+            assert all(sum(1 << node for node in nodes) & mask for mask in required_masks)
+            found_count += 1
+    assert 0 < found_count < 400